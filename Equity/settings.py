@@ -207,6 +207,14 @@ SMS_BACKEND = 'banking.sms.AfricasTalkingSMSBackend'
 AFRICASTALKING_USERNAME = config('AFRICASTALKING_USERNAME', default='')
 AFRICASTALKING_API_KEY = config('AFRICASTALKING_API_KEY', default='')
 
+# Reference number generator: give every application host a distinct id (0-1023).
+# Required when DEBUG is off; development servers all use 0.
+ID_GENERATOR_HOST_ID = config('ID_GENERATOR_HOST_ID', default=0 if DEBUG else None,
+                              cast=lambda value: None if value is None else int(value))
+
+# Dashboard snapshots: rebuilt in the background once older than this many seconds
+DASHBOARD_SNAPSHOT_FRESH_SECONDS = config('DASHBOARD_SNAPSHOT_FRESH_SECONDS', default=30, cast=int)
+
 
 # settings.py
 
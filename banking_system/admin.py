@@ -142,6 +142,7 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = ('transaction_id', 'account__account_number', 'reference_number', 'description')
     readonly_fields = ('transaction_id', 'created_at', 'processed_at')
     date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
     
     fieldsets = (
         ('Transaction Details', {
@@ -305,6 +306,13 @@ class ForexRateAdmin(admin.ModelAdmin):
     list_filter = ('base_currency', 'target_currency', 'effective_date')
     search_fields = ('base_currency', 'target_currency')
 
+@admin.register(LatestForexRate)
+class LatestForexRateAdmin(admin.ModelAdmin):
+    list_display = ('base_currency', 'target_currency', 'buy_rate', 'sell_rate', 'mid_rate', 'effective_date', 'updated_at')
+    list_filter = ('base_currency',)
+    # Maintained from ForexRate; edit the rates there
+    readonly_fields = ('base_currency', 'target_currency', 'buy_rate', 'sell_rate', 'mid_rate', 'effective_date', 'updated_at')
+
 # Notification Admin
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
@@ -458,8 +466,9 @@ def get_dashboard_stats():
     from django.db.models import Sum, Count, Q
     from django.utils import timezone
     from datetime import timedelta
+    from .dates import local_date_range, on_local_date
     
-    today = timezone.now().date()
+    today = timezone.localdate()
     week_ago = today - timedelta(days=7)
     
     stats = {
@@ -468,9 +477,9 @@ def get_dashboard_stats():
         'total_balance': BankAccount.objects.aggregate(
             total=Sum('balance'))['total'] or 0,
         'transactions_today': Transaction.objects.filter(
-            created_at__date=today).count(),
+            **on_local_date('created_at', today)).count(),
         'transactions_week': Transaction.objects.filter(
-            created_at__date__gte=week_ago).count(),
+            **local_date_range('created_at', week_ago)).count(),
         'active_loans': Loan.objects.filter(status='active').count(),
         'pending_kyc': KYCDocument.objects.filter(status='pending').count(),
         'active_agents': BankAgent.objects.filter(is_active=True).count(),
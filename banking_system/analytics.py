@@ -0,0 +1,436 @@
+# analytics.py
+"""
+Daily transaction rollup.
+
+DailyTransactionSummary keeps the count, sum, min and max amount per local
+date, branch, channel, transaction type and status. The ledger adds every
+transaction it writes to its row in the same database transaction
+(record_transactions), so dashboards and charts can read a few hundred
+summary rows instead of scanning Transaction.
+
+Updating one row per bucket would make every posting of a branch and
+channel wait for the previous one to commit, so each bucket is split into
+SUMMARY_SHARDS rows picked by account id. Two postings only queue on the
+same summary row when their accounts share a shard; readers always Sum()
+over the shards.
+
+Rows written outside the ledger (imports, admin edits, status changes) are
+picked up by rebuilding the affected dates with the
+backfill_transaction_summary command, which also records the first date
+the rollup is complete from; monthly_totals falls back to Transaction for
+earlier ranges. Rebuilds stop at yesterday: today's rows are being updated
+by live postings, which a rebuild would overwrite. Code that deletes
+transactions it wrote itself (the benchmarks) takes them back out of their
+rows with remove_transactions instead.
+
+Branch metrics are computed with one grouped query per table and merged in
+Python, so accounts are never joined to their transactions (see
+branch_performance).
+
+A customer's month-to-date totals are one conditional aggregate, cached
+under the account's last posting time (account_month_totals).
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import (
+    Coalesce, Greatest, Least, Trunc, TruncDate, TruncMonth, TruncWeek
+)
+from django.utils import timezone
+
+from .dates import local_date_range, local_day_start, local_month_start
+from .models import (
+    BankAccount, Branch, DailyTransactionSummary, SystemConfiguration, Transaction
+)
+
+# SystemConfiguration key holding the first date the rollup is complete from
+SUMMARY_COVERAGE_KEY = 'analytics.daily_summary_from'
+# Rows per summary bucket that concurrent postings are spread over
+SUMMARY_SHARDS = getattr(settings, 'TRANSACTION_SUMMARY_SHARDS', 8)
+# Month-to-date totals shown on the customer dashboard
+ACCOUNT_MONTH_TYPES = ('deposit', 'withdrawal', 'transfer')
+ACCOUNT_MONTH_CACHE_SECONDS = 24 * 60 * 60
+
+
+def _bucket(transaction):
+    return (
+        timezone.localdate(transaction.created_at),
+        transaction.branch_id or transaction.account.branch_id,
+        transaction.channel,
+        transaction.transaction_type,
+        transaction.status,
+        transaction.account_id % SUMMARY_SHARDS,
+    )
+
+
+def _group_by_bucket(transactions):
+    buckets = {}
+    for txn in transactions:
+        key = _bucket(txn)
+        if key in buckets:
+            count, total, low, high = buckets[key]
+            buckets[key] = (count + 1, total + txn.amount, min(low, txn.amount), max(high, txn.amount))
+        else:
+            buckets[key] = (1, txn.amount, txn.amount, txn.amount)
+    return buckets
+
+
+def _add_to_bucket(key, count, total, low, high):
+    day, branch_id, channel, transaction_type, status, shard = key
+    lookup = dict(date=day, branch_id=branch_id, channel=channel,
+                  transaction_type=transaction_type, status=status, shard=shard)
+
+    updated = DailyTransactionSummary.objects.filter(**lookup).update(
+        transaction_count=F('transaction_count') + count,
+        total_amount=F('total_amount') + total,
+        min_amount=Least('min_amount', Value(low)),
+        max_amount=Greatest('max_amount', Value(high)),
+        updated_at=timezone.now(),
+    )
+    if updated:
+        return
+
+    try:
+        with db_transaction.atomic():
+            DailyTransactionSummary.objects.create(
+                **lookup, transaction_count=count, total_amount=total,
+                min_amount=low, max_amount=high,
+            )
+    except IntegrityError:
+        # Another posting created the row first; add to it instead
+        _add_to_bucket(key, count, total, low, high)
+
+
+def record_transactions(transactions):
+    """Add newly written transactions to the daily summary; call inside their transaction"""
+    buckets = _group_by_bucket(transactions)
+    # Update rows in a fixed order so two concurrent postings cannot deadlock
+    for key in sorted(buckets):
+        _add_to_bucket(key, *buckets[key])
+
+
+def remove_transactions(transactions):
+    """
+    Take transactions that are about to be deleted back out of the daily
+    summary; call in the same database transaction as the delete. Counts and
+    totals are exact, min/max amounts are left as they were (a rebuild
+    tightens them once the day has ended). Returns the number of buckets.
+    """
+    buckets = _group_by_bucket(transactions)
+    for key in sorted(buckets):
+        day, branch_id, channel, transaction_type, status, shard = key
+        count, total, _, _ = buckets[key]
+        rows = DailyTransactionSummary.objects.filter(
+            date=day, branch_id=branch_id, channel=channel,
+            transaction_type=transaction_type, status=status, shard=shard,
+        )
+        rows.update(
+            transaction_count=F('transaction_count') - count,
+            total_amount=F('total_amount') - total,
+            updated_at=timezone.now(),
+        )
+        rows.filter(transaction_count=0).delete()
+    return len(buckets)
+
+
+def rebuild_daily_summary(start_date, end_date):
+    """
+    Recompute the summary rows for local dates start_date..end_date
+    (inclusive) from Transaction, one row per bucket. Returns the number of
+    rows written. Raises ValueError for a range that reaches today, whose
+    rows live postings are still adding to.
+    """
+    if end_date >= timezone.localdate():
+        raise ValueError("Today's summary rows are kept by the ledger; rebuild up to yesterday")
+    totals = (
+        Transaction.objects.filter(**local_date_range('created_at', start_date, end_date))
+        .annotate(day=TruncDate('created_at'), summary_branch=Coalesce('branch', 'account__branch'))
+        .values('day', 'summary_branch', 'channel', 'transaction_type', 'status')
+        .annotate(count=Count('id'), total=Sum('amount'), low=Min('amount'), high=Max('amount'))
+        .order_by()
+    )
+    rows = [
+        DailyTransactionSummary(
+            date=item['day'], branch_id=item['summary_branch'], channel=item['channel'],
+            transaction_type=item['transaction_type'], status=item['status'],
+            transaction_count=item['count'], total_amount=item['total'],
+            min_amount=item['low'], max_amount=item['high'],
+        )
+        for item in totals.iterator()
+    ]
+
+    with db_transaction.atomic():
+        DailyTransactionSummary.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+        DailyTransactionSummary.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def daily_totals(start_date, end_date=None, **filters):
+    """Per-date count and amount from the rollup, oldest first"""
+    summaries = DailyTransactionSummary.objects.filter(date__gte=start_date, **filters)
+    if end_date is not None:
+        summaries = summaries.filter(date__lte=end_date)
+    return summaries.values('date').annotate(
+        count=Sum('transaction_count'),
+        amount=Sum('total_amount'),
+    ).order_by('date')
+
+
+def summary_coverage_start():
+    """First date from which the rollup is complete, or None if it was never backfilled"""
+    value = SystemConfiguration.objects.filter(
+        key=SUMMARY_COVERAGE_KEY, is_active=True,
+    ).values_list('value', flat=True).first()
+    return date.fromisoformat(value) if value else None
+
+
+def set_summary_coverage(start_date):
+    """Record that the rollup is complete from ``start_date`` onwards"""
+    SystemConfiguration.objects.update_or_create(key=SUMMARY_COVERAGE_KEY, defaults=dict(
+        value=start_date.isoformat(),
+        config_type='general',
+        description='First date covered by the DailyTransactionSummary rollup',
+        is_active=True,
+    ))
+
+
+def summary_covers(start_date):
+    coverage = summary_coverage_start()
+    return coverage is not None and coverage <= start_date
+
+
+def _month_average(item):
+    return item['amount'] / item['count'] if item['count'] else Decimal('0')
+
+
+def monthly_totals_from_summary(start_date, end_date=None, **filters):
+    """Per-month count, amount and average amount from the rollup"""
+    summaries = DailyTransactionSummary.objects.filter(date__gte=start_date, **filters)
+    if end_date is not None:
+        summaries = summaries.filter(date__lte=end_date)
+    months = summaries.annotate(
+        month=TruncMonth('date'),
+    ).values('month').annotate(
+        count=Sum('transaction_count'),
+        amount=Sum('total_amount'),
+    ).order_by('month')
+    return [dict(item, avg_amount=_month_average(item)) for item in months]
+
+
+def monthly_totals_from_transactions(start_date, end_date=None, **filters):
+    """Per-month count, amount and average amount from Transaction, by local calendar month"""
+    months = Transaction.objects.filter(
+        **local_date_range('created_at', start_date, end_date), **filters,
+    ).annotate(
+        month=TruncMonth('created_at', tzinfo=timezone.get_current_timezone()),
+    ).values('month').annotate(
+        count=Count('id'),
+        amount=Sum('amount'),
+    ).order_by('month')
+    return [
+        dict(item, month=timezone.localtime(item['month']).date(), avg_amount=_month_average(item))
+        for item in months
+    ]
+
+
+def monthly_totals(start_date, **filters):
+    """
+    Per-month count, amount and average amount since ``start_date``, oldest
+    first. Served from the rollup when it covers the range, otherwise from
+    Transaction bucketed by local (Africa/Nairobi) calendar month.
+    """
+    if summary_covers(start_date):
+        return monthly_totals_from_summary(start_date, **filters)
+    return monthly_totals_from_transactions(start_date, **filters)
+
+
+def branch_performance(limit=None, status=None):
+    """
+    Branches with ``account_count``, ``transaction_count`` and ``total_amount``
+    set, busiest (most accounts) first. Transactions count toward the branch
+    that handled them, or their account's branch when none is recorded (the
+    same rule as the daily rollup), and can be restricted to one ``status``.
+
+    Annotating all three on Branch in one query joins every account to every
+    one of its transactions, which inflates the account count and grows with
+    accounts x transactions. Each metric is grouped separately here instead.
+    """
+    account_counts = dict(
+        BankAccount.objects.values_list('branch_id').annotate(count=Count('id')).order_by()
+    )
+
+    transactions = Transaction.objects.all()
+    if status is not None:
+        transactions = transactions.filter(status=status)
+    transaction_totals = {
+        item['summary_branch']: item
+        for item in transactions.annotate(summary_branch=Coalesce('branch', 'account__branch'))
+        .values('summary_branch').annotate(count=Count('id'), amount=Sum('amount')).order_by()
+    }
+
+    branches = list(Branch.objects.all())
+    for branch in branches:
+        totals = transaction_totals.get(branch.pk, {})
+        branch.account_count = account_counts.get(branch.pk, 0)
+        branch.transaction_count = totals.get('count', 0)
+        branch.total_amount = totals.get('amount') or Decimal('0')
+
+    branches.sort(key=lambda branch: (-branch.account_count, branch.pk))
+    return branches[:limit] if limit is not None else branches
+
+
+def account_month_totals(account):
+    """
+    This month's completed deposit, withdrawal and transfer totals for
+    ``account`` as {transaction_type: Decimal}.
+
+    The ledger stamps last_transaction_date on every posting, so the result
+    is cached under it: repeat dashboard loads do not touch Transaction
+    until the account is posted to again (or the month changes).
+    """
+    month_start = local_month_start()
+    posted_at = account.last_transaction_date.timestamp() if account.last_transaction_date else ''
+    key = f"account-month-totals:{account.pk}:{month_start.date()}:{posted_at}"
+    totals = cache.get(key)
+    if totals is None:
+        totals = Transaction.objects.filter(
+            account=account, transaction_type__in=ACCOUNT_MONTH_TYPES, status='completed',
+            created_at__gte=month_start,
+        ).aggregate(**{
+            transaction_type: Sum('amount', filter=Q(transaction_type=transaction_type),
+                                  default=Decimal('0'))
+            for transaction_type in ACCOUNT_MONTH_TYPES
+        })
+        cache.set(key, totals, ACCOUNT_MONTH_CACHE_SECONDS)
+    return totals
+
+
+# Chart series (see the api/analytics/ endpoint)
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+GROUP_BY_FIELDS = {
+    'channel': (F('channel'), F('channel')),
+    'type': (F('transaction_type'), F('transaction_type')),
+    'status': (F('status'), F('status')),
+    'branch': (F('branch'), Coalesce('branch', 'account__branch')),
+}  # group_by: (rollup expression, Transaction expression)
+LABEL_FORMATS = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m'}
+MAX_POINTS = 400
+
+
+def _bucket_starts(start_date, end_date, granularity):
+    """Every bucket start in the range, so empty buckets are reported as zero"""
+    if granularity == 'hour':
+        current, end = local_day_start(start_date), local_day_start(end_date + timedelta(days=1))
+        starts = []
+        while current < end:
+            starts.append(current)
+            current = timezone.localtime(current + timedelta(hours=1))
+        return starts
+    if granularity == 'day':
+        return [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+    if granularity == 'week':
+        current = start_date - timedelta(days=start_date.weekday())
+        starts = []
+        while current <= end_date:
+            starts.append(current)
+            current += timedelta(days=7)
+        return starts
+    current = start_date.replace(day=1)
+    starts = []
+    while current <= end_date:
+        starts.append(current)
+        current = (current + timedelta(days=32)).replace(day=1)
+    return starts
+
+
+def _point_count(start_date, end_date, granularity):
+    days = (end_date - start_date).days + 1
+    if granularity == 'hour':
+        return days * 24
+    if granularity == 'day':
+        return days
+    if granularity == 'week':
+        return days // 7 + 2
+    return (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+
+
+def _label(value, granularity):
+    if isinstance(value, datetime):
+        value = timezone.localtime(value)
+    return value.strftime(LABEL_FORMATS[granularity])
+
+
+def transaction_series(start_date, end_date, granularity='day', group_by=None, status=None):
+    """
+    Transaction counts and amounts for local dates start_date..end_date per
+    ``granularity`` bucket, optionally split by ``group_by`` (channel,
+    branch, type or status).
+
+    A granularity that would give more than MAX_POINTS buckets is coarsened
+    (hour -> day -> week -> month). Day, week and month buckets are read
+    from the daily rollup when it covers the range; hourly buckets and
+    uncovered ranges are aggregated from Transaction.
+
+    Returns {'granularity', 'source', 'labels', 'series': [{'key', 'label',
+    'counts', 'amounts'}]} with every series aligned to ``labels``.
+    """
+    position = GRANULARITIES.index(granularity)
+    while _point_count(start_date, end_date, granularity) > MAX_POINTS:
+        if position == len(GRANULARITIES) - 1:
+            raise ValueError(f'Date range too large: more than {MAX_POINTS} months')
+        position += 1
+        granularity = GRANULARITIES[position]
+
+    use_summary = granularity != 'hour' and summary_covers(start_date)
+    if use_summary:
+        rows = DailyTransactionSummary.objects.filter(date__gte=start_date, date__lte=end_date)
+        bucket = {'day': F('date'), 'week': TruncWeek('date'), 'month': TruncMonth('date')}[granularity]
+        count, amount = Sum('transaction_count'), Sum('total_amount')
+    else:
+        rows = Transaction.objects.filter(**local_date_range('created_at', start_date, end_date))
+        bucket = Trunc('created_at', granularity, tzinfo=timezone.get_current_timezone())
+        count, amount = Count('id'), Sum('amount')
+    if status:
+        rows = rows.filter(status=status)
+
+    group = {}
+    if group_by:
+        summary_expression, transaction_expression = GROUP_BY_FIELDS[group_by]
+        group = {'group': summary_expression if use_summary else transaction_expression}
+
+    totals = rows.annotate(bucket=bucket, **group).values('bucket', *group).annotate(
+        count=count, amount=amount,
+    ).order_by()
+
+    labels = [_label(start, granularity) for start in _bucket_starts(start_date, end_date, granularity)]
+    index = {label: i for i, label in enumerate(labels)}
+    series = {}
+    for item in totals:
+        key = item.get('group')
+        points = series.setdefault(key, ([0] * len(labels), [0.0] * len(labels)))
+        i = index.get(_label(item['bucket'], granularity))
+        if i is not None:
+            points[0][i] += item['count']
+            points[1][i] += float(item['amount'] or 0)
+
+    names = {}
+    if group_by == 'branch':
+        names = dict(Branch.objects.filter(pk__in=[key for key in series if key]).values_list('id', 'name'))
+    elif group_by:
+        names = dict({'channel': Transaction.CHANNELS, 'type': Transaction.TRANSACTION_TYPES,
+                      'status': Transaction.TRANSACTION_STATUS}[group_by])
+
+    return {
+        'granularity': granularity,
+        'source': 'summary' if use_summary else 'transactions',
+        'labels': labels,
+        'series': [
+            {'key': key, 'label': str(names.get(key, key if key is not None else 'All')),
+             'counts': counts, 'amounts': [round(value, 2) for value in amounts]}
+            for key, (counts, amounts) in sorted(series.items(), key=lambda item: str(item[0]))
+        ],
+    }
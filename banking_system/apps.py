@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BankingSystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'banking_system'
+
+    def ready(self):
+        from . import signals  # noqa: F401
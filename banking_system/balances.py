@@ -0,0 +1,139 @@
+# balances.py
+"""
+Point-in-time account balances.
+
+Every completed Transaction the ledger writes records the account's
+balance_before and balance_after, so the balance at any moment is an
+end-of-day AccountBalanceSnapshot plus the changes posted since:
+
+    balance = balance_as_of(account, statement_end)
+    balances = balances_as_of(account_ids, accrual_cutoff)
+
+The snapshot_balances command writes a snapshot for every account after
+midnight, so a lookup replays at most one day of transactions. Without a
+snapshot (before the first nightly run, or for accounts opened later) the
+balance is derived backwards from the current balance instead, which is
+exact but reads every posting since ``at``.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .dates import local_day_start
+from .models import AccountBalanceSnapshot, BankAccount, Transaction
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+def _change():
+    return Sum(F('balance_after') - F('balance_before'))
+
+
+def _cents(amount):
+    return Decimal(amount or 0).quantize(CENT)
+
+
+def _postings(**filters):
+    return Transaction.objects.filter(status='completed', **filters)
+
+
+def _later_changes(cutoff, inclusive=True):
+    """Subquery: the sum of an account's balance changes posted after ``cutoff``"""
+    lookup = 'created_at__gte' if inclusive else 'created_at__gt'
+    changes = _postings(account=OuterRef('pk'), **{lookup: cutoff}).values('account').annotate(
+        change=_change(),
+    ).values('change')
+    return Coalesce(Subquery(changes), Value(ZERO),
+                    output_field=models.DecimalField(max_digits=15, decimal_places=2))
+
+
+def balance_as_of(account, at=None):
+    """Balance of ``account`` (instance or id) at ``at`` (default: now)"""
+    at = at or timezone.now()
+    account_id = getattr(account, 'pk', account)
+    snapshot = AccountBalanceSnapshot.objects.filter(
+        account_id=account_id, date__lt=timezone.localdate(at),
+    ).order_by('-date').first()
+
+    if snapshot is not None:
+        replayed = _postings(
+            account_id=account_id,
+            created_at__gte=local_day_start(snapshot.date + timedelta(days=1)),
+            created_at__lte=at,
+        ).aggregate(change=_change())['change']
+        return _cents(snapshot.balance + _cents(replayed))
+
+    balance = BankAccount.objects.filter(pk=account_id).annotate(
+        later=_later_changes(at, inclusive=False),
+    ).values_list('balance', 'later').get()
+    return _cents(balance[0] - balance[1])
+
+
+def balances_as_of(account_ids, at=None):
+    """
+    Balances of many accounts at ``at`` as {account_id: Decimal}: the
+    previous day's snapshots plus one grouped query over that day's
+    postings. Accounts without that snapshot fall back to balance_as_of.
+    """
+    at = at or timezone.now()
+    account_ids = list(account_ids)
+    day = timezone.localdate(at)
+    balances = dict(AccountBalanceSnapshot.objects.filter(
+        account_id__in=account_ids, date=day - timedelta(days=1),
+    ).values_list('account_id', 'balance'))
+
+    replayed = _postings(
+        account_id__in=list(balances), created_at__gte=local_day_start(day), created_at__lte=at,
+    ).values('account_id').annotate(change=_change()).order_by()
+    for row in replayed:
+        balances[row['account_id']] += _cents(row['change'])
+
+    for account_id in account_ids:
+        balances[account_id] = (_cents(balances[account_id]) if account_id in balances
+                                else balance_as_of(account_id, at))
+    return balances
+
+
+def end_of_day_balances(day, accounts=None, fields=(), batch_size=1000):
+    """
+    Yield batches of (account id, balance at the end of local date ``day``,
+    *fields) for ``accounts`` (default: every account) opened by then, in
+    primary key order.
+
+    Each batch reads the current balances and the changes posted since the
+    end of ``day`` in one statement, so postings made while the caller runs
+    cannot be counted on one side only.
+    """
+    cutoff = local_day_start(day + timedelta(days=1))
+    accounts = BankAccount.objects.all() if accounts is None else accounts
+    accounts = accounts.filter(created_at__lt=cutoff).order_by('pk').annotate(
+        later=_later_changes(cutoff),
+    )
+    last_pk = 0
+    while True:
+        batch = list(accounts.filter(pk__gt=last_pk).values_list('pk', 'balance', 'later', *fields)[:batch_size])
+        if not batch:
+            return
+        yield [(pk, _cents(balance - later), *rest) for pk, balance, later, *rest in batch]
+        last_pk = batch[-1][0]
+
+
+def snapshot_balances(day, batch_size=1000):
+    """
+    Write (or rewrite) every account's end-of-day balance for local date
+    ``day``. Returns the number of snapshots written.
+    """
+    written = 0
+    for batch in end_of_day_balances(day, batch_size=batch_size):
+        AccountBalanceSnapshot.objects.bulk_create(
+            [AccountBalanceSnapshot(account_id=pk, date=day, balance=balance) for pk, balance in batch],
+            update_conflicts=True, unique_fields=['account', 'date'],
+            update_fields=['balance', 'updated_at'],
+        )
+        written += len(batch)
+    return written
@@ -0,0 +1,176 @@
+# benchmarks.py
+"""
+Helpers shared by the benchmark_* management commands: seeding large
+volumes of synthetic transactions and timing queries.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from .account_numbers import assign_account_numbers
+from .ids import generate_id
+from .models import AccountType, BankAccount, Branch, Transaction, User
+
+# Seeded rows carry this reference so they can be reused between runs and removed afterwards
+SEED_REFERENCE = 'BENCHSEED'
+SEED_BRANCH_PREFIX = 'BN'
+SEED_USERNAME = 'benchmark-customer'
+
+TRANSACTION_MIX = (
+    ('deposit', 35), ('withdrawal', 30), ('transfer', 25),
+    ('bill_payment', 5), ('fee_charge', 5),
+)
+STATUS_MIX = (('completed', 92), ('failed', 4), ('pending', 3), ('reversed', 1))
+CHANNELS = ('mobile', 'agent', 'atm', 'branch', 'internet', 'ussd')
+
+
+@contextmanager
+def backdating(model):
+    """Let bulk_create keep explicit created_at values on an auto_now_add field"""
+    field = model._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def benchmark_accounts(limit):
+    """Active accounts to spread seeded rows over, as (id, branch_id) pairs"""
+    return list(
+        BankAccount.objects.filter(status='active').order_by('id')
+        .values_list('id', 'branch_id')[:limit]
+    )
+
+
+def seed_branches(count, accounts_per_branch):
+    """
+    Create ``count`` benchmark branches (codes BN0001...) with
+    ``accounts_per_branch`` accounts each, owned by one benchmark customer.
+    Existing benchmark branches are reused. Returns (account id, branch id) pairs.
+    """
+    customer, _ = User.objects.get_or_create(username=SEED_USERNAME, defaults=dict(
+        phone_number='+254700999999', national_id='BENCHMARK', address='Benchmark',
+        city='Nairobi', postal_code='00100',
+    ))
+    account_type = AccountType.objects.filter(is_active=True).order_by('id').first()
+    if account_type is None:
+        account_type = AccountType.objects.create(name='Benchmark Savings', code='BENCH')
+
+    existing = set(Branch.objects.filter(branch_code__startswith=SEED_BRANCH_PREFIX)
+                   .values_list('branch_code', flat=True))
+    Branch.objects.bulk_create([
+        Branch(name=f'Benchmark Branch {i}', branch_code=code, address='Benchmark',
+               city='Nairobi', county='Nairobi', phone_number='0700000000',
+               email='benchmark@example.com')
+        for i, code in ((i, f'{SEED_BRANCH_PREFIX}{i:04d}') for i in range(1, count + 1))
+        if code not in existing
+    ])
+
+    branches = Branch.objects.filter(branch_code__startswith=SEED_BRANCH_PREFIX).order_by('id')[:count]
+    new_accounts = []
+    for branch in branches.annotate(accounts=Count('bankaccount')):
+        new_accounts.extend(
+            BankAccount(customer=customer, account_type=account_type, branch=branch)
+            for _ in range(accounts_per_branch - branch.accounts)
+        )
+    BankAccount.objects.bulk_create(assign_account_numbers(new_accounts), batch_size=1000)
+
+    return list(BankAccount.objects.filter(branch__in=branches).values_list('id', 'branch_id'))
+
+
+def delete_seeded_branches(batch_size=900):
+    """Remove benchmark branches, their accounts and the benchmark customer"""
+    delete_seeded()
+    # Accounts go in batches too: one cascade over every account exceeds the SQL variable limits
+    accounts = BankAccount.objects.filter(branch__branch_code__startswith=SEED_BRANCH_PREFIX)
+    while True:
+        ids = list(accounts.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        BankAccount.objects.filter(id__in=ids).delete()
+    Branch.objects.filter(branch_code__startswith=SEED_BRANCH_PREFIX).delete()
+    User.objects.filter(username=SEED_USERNAME).delete()
+
+
+def seed_transactions(count, accounts, days=365, batch_size=5000, progress=None):
+    """
+    Insert ``count`` completed-looking transactions spread evenly over the
+    last ``days`` days across ``accounts`` ((id, branch_id) pairs). Rows are
+    tagged with SEED_REFERENCE.
+    """
+    types, type_weights = zip(*TRANSACTION_MIX)
+    statuses, status_weights = zip(*STATUS_MIX)
+    now = timezone.now()
+    span = days * 86400
+    created = 0
+
+    with backdating(Transaction):
+        while created < count:
+            size = min(batch_size, count - created)
+            rows = []
+            for transaction_type, status in zip(random.choices(types, type_weights, k=size),
+                                                random.choices(statuses, status_weights, k=size)):
+                account_id, branch_id = random.choice(accounts)
+                amount = Decimal(random.randint(100, 5000000)) / 100
+                created_at = now - timedelta(seconds=random.randint(0, span))
+                rows.append(Transaction(
+                    transaction_id=generate_id('TXN'),
+                    account_id=account_id,
+                    branch_id=branch_id,
+                    transaction_type=transaction_type,
+                    amount=amount,
+                    fee=Decimal('0.00'),
+                    total_amount=amount,
+                    balance_before=Decimal('0.00'),
+                    balance_after=Decimal('0.00'),
+                    channel=random.choice(CHANNELS),
+                    reference_number=SEED_REFERENCE,
+                    description='Benchmark seed',
+                    status=status,
+                    created_at=created_at,
+                    processed_at=created_at,
+                ))
+            Transaction.objects.bulk_create(rows, batch_size=batch_size)
+            created += size
+            if progress:
+                progress(created)
+    return created
+
+
+def delete_seeded(batch_size=900):
+    """Remove seeded transactions in small batches (cascades stay under SQL variable limits)"""
+    seeded = Transaction.objects.filter(reference_number=SEED_REFERENCE)
+    deleted = 0
+    while True:
+        ids = list(seeded.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Transaction.objects.filter(id__in=ids).delete()[0]
+
+
+def analyze(model):
+    """Refresh planner statistics after a bulk load"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor in ('sqlite', 'postgresql'):
+            cursor.execute(f'ANALYZE {table}')
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'ANALYZE TABLE {table}')
+
+
+def timed(func, repeat=5):
+    """Best wall-clock time of ``repeat`` calls, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
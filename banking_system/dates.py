@@ -0,0 +1,46 @@
+# dates.py
+"""
+Local-date filters for datetime columns.
+
+    Transaction.objects.filter(**on_local_date('created_at', today))
+    Transaction.objects.filter(**local_date_range('created_at', week_ago))
+
+A lookup such as created_at__date=today wraps the column in a DATE() cast
+(converted to the current time zone), so the database has to evaluate it on
+every row and cannot use an index on created_at. These helpers turn local
+dates into a half-open [start, end) range of aware datetimes at local
+midnight (TIME_ZONE, Africa/Nairobi), which compares the raw column and
+selects the same rows.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def local_day_start(day):
+    """Aware datetime for local midnight at the start of ``day``"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def local_month_start(day=None):
+    """Aware datetime for local midnight on the first of ``day``'s month (default: this month)"""
+    return local_day_start((day or timezone.localdate()).replace(day=1))
+
+
+def local_date_range(field, start_date=None, end_date=None):
+    """
+    Filter kwargs for ``field`` between local dates start_date and end_date,
+    both inclusive. Either end may be None for an open range.
+    """
+    filters = {}
+    if start_date is not None:
+        filters[f'{field}__gte'] = local_day_start(start_date)
+    if end_date is not None:
+        filters[f'{field}__lt'] = local_day_start(end_date + timedelta(days=1))
+    return filters
+
+
+def on_local_date(field, day=None):
+    """Filter kwargs for ``field`` on local date ``day`` (default: today)"""
+    day = day or timezone.localdate()
+    return local_date_range(field, day, day)
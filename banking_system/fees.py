@@ -0,0 +1,104 @@
+# fees.py
+"""
+Fee schedule cache.
+
+FeeStructure rows change maybe once a quarter, so each process loads every
+active row once and reuses it. Saving or deleting a FeeStructure (see
+signals.py) stores a new version token in the Django cache; every process
+compares its copy against that token and reloads when it has changed.
+"""
+import threading
+import uuid
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import FeeStructure
+
+VERSION_CACHE_KEY = 'fee_schedule:version'
+CENT = Decimal('0.01')
+
+# Fees charged when no FeeStructure applies to a transaction type
+DEFAULT_FEES = {
+    'agent_deposit': Decimal('10.00'),
+    'agent_withdrawal': Decimal('35.00'),
+    'mobile_transfer_own': Decimal('25.00'),
+    'mobile_transfer_other': Decimal('50.00'),
+}
+
+_lock = threading.Lock()
+_schedule = None  # (version, {transaction_type: [FeeStructure, newest first]})
+
+
+def _current_version():
+    return cache.get_or_set(VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def invalidate():
+    """Force every process to reload the fee schedule on its next lookup"""
+    global _schedule
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+    with _lock:
+        _schedule = None
+
+
+def get_schedule():
+    """Return active fee structures grouped by transaction type, newest first"""
+    global _schedule
+    version = _current_version()
+    schedule = _schedule
+    if schedule is not None and schedule[0] == version:
+        return schedule[1]
+
+    with _lock:
+        if _schedule is None or _schedule[0] != version:
+            by_type = defaultdict(list)
+            for structure in FeeStructure.objects.filter(is_active=True).order_by('-effective_from'):
+                by_type[structure.transaction_type].append(structure)
+            _schedule = (version, dict(by_type))
+        return _schedule[1]
+
+
+def get_fee_structure(transaction_type, at=None):
+    """The FeeStructure in effect for ``transaction_type`` at ``at`` (default: now), or None"""
+    at = at or timezone.now()
+    for structure in get_schedule().get(transaction_type, ()):
+        if structure.effective_from <= at and (
+                structure.effective_to is None or at < structure.effective_to):
+            return structure
+    return None
+
+
+def _apply(structure, amount):
+    # Use fixed fee or percentage fee, whichever is higher
+    calculated_fee = max(structure.fixed_fee, amount * (structure.percentage_fee / 100))
+
+    # Apply minimum and maximum limits
+    if calculated_fee < structure.minimum_fee:
+        calculated_fee = structure.minimum_fee
+    if structure.maximum_fee and calculated_fee > structure.maximum_fee:
+        calculated_fee = structure.maximum_fee
+    # Percentage fees are charged to the cent, like the balances they come out of
+    return calculated_fee.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def calculate_fee(transaction_type, amount, at=None):
+    """Calculate the fee for a single transaction"""
+    structure = get_fee_structure(transaction_type, at)
+    if structure is None:
+        return DEFAULT_FEES.get(transaction_type, Decimal('0.00'))
+    return _apply(structure, amount)
+
+
+def calculate_fees(transaction_type, amounts, at=None):
+    """
+    Calculate fees for many transactions of the same type in one pass, e.g.
+    for standing orders or bulk imports. Returns a list in ``amounts`` order.
+    """
+    structure = get_fee_structure(transaction_type, at)
+    if structure is None:
+        default = DEFAULT_FEES.get(transaction_type, Decimal('0.00'))
+        return [default for _ in amounts]
+    return [_apply(structure, amount) for amount in amounts]
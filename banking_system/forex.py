@@ -0,0 +1,211 @@
+# forex.py
+"""
+Current and historical forex rates.
+
+LatestForexRate holds one row per currency pair with the most recent
+ForexRate (by effective_date). Signal handlers keep it in step:
+- a new ForexRate replaces the pair's row if it is newer (record_rate);
+- an edited or deleted ForexRate makes the pair be recomputed
+  (refresh_latest_rate).
+
+Readers get every current rate in one indexed read:
+
+    for rate in latest_rates():
+        ...
+    usd = get_latest_rate('USD')
+
+Rates written with bulk_create() or queryset.update() bypass the signals;
+run rebuild_latest_rates() and invalidate_history() afterwards.
+
+Point-in-time lookups (reversals, statements, loan accounting) use the rate
+in effect at a moment, i.e. the newest rate with effective_date <= it:
+
+    rate = rate_at(('KES', 'USD'), transaction.created_at)
+    amounts = convert_many([(amount, 'USD', created_at), ...])
+
+Each process keeps the last HISTORY_CACHE_DAYS of every pair it has looked
+up as sorted lists and answers from them with bisect; older timestamps
+extend the cached range with one query. The lookups read ForexRate through
+its unique (base_currency, target_currency, effective_date) index. Saving
+or deleting a ForexRate stores a new version token in the Django cache and
+every process drops its history on its next lookup, as fees.py does.
+"""
+import threading
+import uuid
+from bisect import bisect_right
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from django.db import IntegrityError, transaction as db_transaction
+
+from .models import ForexRate, LatestForexRate
+
+DEFAULT_BASE_CURRENCY = 'KES'
+RATE_FIELDS = ('buy_rate', 'sell_rate', 'mid_rate', 'effective_date')
+CENT = Decimal('0.01')
+
+HISTORY_CACHE_DAYS = getattr(settings, 'FOREX_HISTORY_CACHE_DAYS', 90)
+HISTORY_VERSION_CACHE_KEY = 'forex_history:version'
+
+_history_lock = threading.Lock()
+# (version, {(base, target): (covered_from, effective dates, ForexRates)}); covered_from
+# is None when the cached rates start at the pair's first rate
+_history = (None, {})
+
+
+def _values(rate):
+    return {field: getattr(rate, field) for field in RATE_FIELDS}
+
+
+def record_rate(rate):
+    """Make ``rate`` the pair's latest rate unless a newer one is already recorded"""
+    pair = dict(base_currency=rate.base_currency, target_currency=rate.target_currency)
+
+    # Conditional update, so concurrent inserts can only move the rate forward
+    if LatestForexRate.objects.filter(**pair, effective_date__lte=rate.effective_date).update(**_values(rate)):
+        return
+    if LatestForexRate.objects.filter(**pair).exists():
+        return  # a newer rate is already recorded
+
+    try:
+        with db_transaction.atomic():
+            LatestForexRate.objects.create(**pair, **_values(rate))
+    except IntegrityError:
+        # Another insert created the row first; compare against it instead
+        record_rate(rate)
+
+
+def refresh_latest_rate(base_currency, target_currency):
+    """Recompute one pair's latest rate from ForexRate"""
+    pair = dict(base_currency=base_currency, target_currency=target_currency)
+    rate = ForexRate.objects.filter(**pair).order_by('-effective_date').first()
+    if rate is None:
+        LatestForexRate.objects.filter(**pair).delete()
+    else:
+        LatestForexRate.objects.update_or_create(**pair, defaults=_values(rate))
+
+
+def rebuild_latest_rates():
+    """Recompute every pair's latest rate from ForexRate. Returns the number of pairs."""
+    pairs = list(ForexRate.objects.values_list('base_currency', 'target_currency').distinct())
+    with db_transaction.atomic():
+        LatestForexRate.objects.all().delete()
+        for base_currency, target_currency in pairs:
+            refresh_latest_rate(base_currency, target_currency)
+    return len(pairs)
+
+
+def latest_rates(base_currency=DEFAULT_BASE_CURRENCY):
+    """Current rate for every pair quoted against ``base_currency``"""
+    return list(LatestForexRate.objects.filter(base_currency=base_currency).order_by('target_currency'))
+
+
+def get_latest_rate(target_currency, base_currency=DEFAULT_BASE_CURRENCY):
+    """Current rate for one pair, or None if it has never been quoted"""
+    return LatestForexRate.objects.filter(
+        base_currency=base_currency, target_currency=target_currency,
+    ).first()
+
+
+def _current_history_version():
+    return cache.get_or_set(HISTORY_VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_history():
+    """Force every process to reload rate history on its next lookup"""
+    global _history
+    cache.set(HISTORY_VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+    with _history_lock:
+        _history = (None, {})
+
+
+def _pair(pair):
+    """Accept ('KES', 'USD') or 'KES/USD'"""
+    if isinstance(pair, str):
+        base_currency, _, target_currency = pair.partition('/')
+        return base_currency, target_currency
+    return tuple(pair)
+
+
+def _load_history(pair, since):
+    base_currency, target_currency = pair
+    rates = ForexRate.objects.filter(base_currency=base_currency, target_currency=target_currency)
+    history = list(rates.filter(effective_date__gte=since).order_by('effective_date'))
+    # The rate still in effect at ``since``
+    earlier = rates.filter(effective_date__lt=since).order_by('-effective_date').first()
+    if earlier is None:
+        return None, [rate.effective_date for rate in history], history
+    history.insert(0, earlier)
+    return earlier.effective_date, [rate.effective_date for rate in history], history
+
+
+def _pair_history(pair, at, version):
+    """Cached (covered_from, dates, rates) for ``pair``, loading back to ``at`` if needed"""
+    global _history
+
+    def usable(entry):
+        return entry is not None and (entry[0] is None or entry[0] <= at)
+
+    cached_version, pairs = _history
+    if cached_version == version and usable(pairs.get(pair)):
+        return pairs[pair]
+
+    with _history_lock:
+        if _history[0] != version:
+            _history = (version, {})
+        pairs = _history[1]
+        if not usable(pairs.get(pair)):
+            since = min(at, timezone.now() - timedelta(days=HISTORY_CACHE_DAYS))
+            pairs[pair] = _load_history(pair, since)
+        return pairs[pair]
+
+
+def _find(history, at):
+    _, dates, rates = history
+    position = bisect_right(dates, at)
+    return rates[position - 1] if position else None
+
+
+def rate_at(pair, at=None):
+    """The ForexRate for ``pair`` in effect at ``at`` (default: now), or None if none was yet"""
+    at = at or timezone.now()
+    pair = _pair(pair)
+    return _find(_pair_history(pair, at, _current_history_version()), at)
+
+
+def convert_many(items, base_currency=DEFAULT_BASE_CURRENCY, rate_field='mid_rate'):
+    """
+    Convert (amount, currency, timestamp) tuples into ``base_currency`` at
+    the rate in effect at each timestamp, in one pass: every pair's history
+    is loaded at most once. Returns a list of Decimals rounded to the cent,
+    in ``items`` order, and raises ValueError when a currency had no rate
+    yet at its timestamp.
+    """
+    items = list(items)
+    version = _current_history_version()
+    earliest = {}
+    for amount, currency, at in items:
+        if currency != base_currency:
+            pair = (base_currency, currency)
+            earliest[pair] = min(at, earliest.get(pair, at))
+    histories = {pair: _pair_history(pair, at, version) for pair, at in earliest.items()}
+
+    converted = []
+    for amount, currency, at in items:
+        if currency == base_currency:
+            converted.append(Decimal(amount).quantize(CENT))
+            continue
+        rate = _find(histories[base_currency, currency], at)
+        if rate is None:
+            raise ValueError(f"No {base_currency}/{currency} rate in effect at {at}")
+        converted.append((Decimal(amount) * getattr(rate, rate_field)).quantize(CENT))
+    return converted
+
+
+def convert(amount, currency, at=None, base_currency=DEFAULT_BASE_CURRENCY, rate_field='mid_rate'):
+    """Convert one amount into ``base_currency`` at the rate in effect at ``at`` (default: now)"""
+    return convert_many([(amount, currency, at or timezone.now())], base_currency, rate_field)[0]
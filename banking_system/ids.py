@@ -0,0 +1,113 @@
+# ids.py
+"""
+Time-ordered unique reference numbers (Snowflake style).
+
+Each ID packs, most significant first:
+
+    41 bits  milliseconds since ID_EPOCH
+    10 bits  host id  (settings.ID_GENERATOR_HOST_ID, unique per machine)
+    22 bits  process id
+    12 bits  per-process sequence within the millisecond
+
+and is written as 17 fixed-width Crockford base32 characters after a short
+prefix, e.g. ``TXN01HZX3K8Q2M0004R``. Two processes can never produce the
+same ID because they differ in host or process id, and within a process the
+sequence (plus waiting for the next millisecond when it runs out) keeps IDs
+unique and strictly increasing. No database round trip is needed. Because
+the encoding is fixed width and the alphabet is in ASCII order, IDs with the
+same prefix sort by creation time, which keeps unique index inserts at the
+right-hand edge of the B-tree.
+
+The host id has no safe default: two hosts sharing one can issue the same
+ID, so a missing or out of range ID_GENERATOR_HOST_ID raises
+ImproperlyConfigured on first use (settings.py only defaults it to 0 when
+DEBUG is on).
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+ID_EPOCH_MS = 1577836800000  # 2020-01-01T00:00:00Z
+
+TIMESTAMP_BITS = 41
+HOST_BITS = 10
+PROCESS_BITS = 22
+SEQUENCE_BITS = 12
+
+MAX_HOST_ID = (1 << HOST_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ENCODED_LENGTH = 17  # ceil(85 bits / 5 bits per character)
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32, ASCII ordered
+
+
+def _host_id():
+    host_id = getattr(settings, 'ID_GENERATOR_HOST_ID', None)
+    if host_id is None:
+        raise ImproperlyConfigured('ID_GENERATOR_HOST_ID must give every application host a distinct id')
+    if not 0 <= host_id <= MAX_HOST_ID:
+        raise ImproperlyConfigured(f'ID_GENERATOR_HOST_ID must be between 0 and {MAX_HOST_ID}')
+    return host_id
+
+
+class _Generator:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.node = 0
+        self.last_ms = -1
+        self.sequence = 0
+
+    def _reset(self, pid):
+        # New process (first use or after fork): take this process's node id
+        self.node = (_host_id() << PROCESS_BITS) | (pid & ((1 << PROCESS_BITS) - 1))
+        self.pid = pid
+        self.last_ms = -1
+        self.sequence = 0
+
+    def next_value(self):
+        with self.lock:
+            pid = os.getpid()
+            if pid != self.pid:
+                self._reset(pid)
+
+            now_ms = int(time.time() * 1000) - ID_EPOCH_MS
+            if now_ms > self.last_ms:
+                self.last_ms = now_ms
+                self.sequence = 0
+            else:
+                # Same millisecond, or the clock stepped back: keep counting
+                # from the last timestamp we used so IDs never go backwards
+                self.sequence += 1
+                if self.sequence > MAX_SEQUENCE:
+                    while now_ms <= self.last_ms:
+                        time.sleep(0.0001)
+                        now_ms = int(time.time() * 1000) - ID_EPOCH_MS
+                    self.last_ms = now_ms
+                    self.sequence = 0
+
+            return (
+                (self.last_ms << (HOST_BITS + PROCESS_BITS + SEQUENCE_BITS))
+                | (self.node << SEQUENCE_BITS)
+                | self.sequence
+            )
+
+
+_generator = _Generator()
+
+
+def encode(value):
+    """Fixed-width Crockford base32 encoding of an ID value"""
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        value, remainder = divmod(value, 32)
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def generate_id(prefix=''):
+    """Return a new unique, time-ordered reference such as ``TXN01HZX3K8Q2M0004R``"""
+    return f"{prefix}{encode(_generator.next_value())}"
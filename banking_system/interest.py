@@ -0,0 +1,148 @@
+# interest.py
+"""
+Daily interest accrual and monthly interest credits.
+
+accrue_interest(day) computes one day's interest for every active account
+whose account type pays interest and writes one InterestCalculation per
+account with bulk_create:
+
+    interest = end-of-day balance * AccountType.interest_rate / 100 / 365
+
+End-of-day balances come from balances.end_of_day_balances. The whole book
+is loaded into arrays and computed in one vectorised pass with NumPy when
+it is installed (plain Python otherwise). Both work on integers (balances in
+cents, rates in ten-thousandths of a percent) and round half up to a
+millionth of a shilling, so the result is exactly what Decimal arithmetic
+gives. Accruals are not rounded to the cent: a small balance earning a
+fraction of a cent a day still accrues it. Accounts already accrued for the
+day are skipped, so a rerun is safe.
+
+credit_interest(up_to) sums the uncredited accruals up to a date, rounds
+each account's total to the cent once, posts it as one interest_credit
+transaction per account (ledger.post_credits, in batches) and marks exactly
+the summed accruals credited in the same database transaction. Totals under
+half a cent stay uncredited and carry over to the next run.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Case, Exists, OuterRef, Value, When
+
+from .balances import end_of_day_balances
+from .ledger import post_credits
+from .models import BankAccount, InterestCalculation
+
+try:
+    import numpy as np
+except ImportError:  # vectorised accrual is optional
+    np = None
+
+DAYS_IN_YEAR = 365
+RATE_SCALE = 10000  # AccountType.interest_rate has four decimal places
+MICROS = 1000000  # InterestCalculation.interest_earned has six decimal places
+# cents * rate units / DIVISOR = interest in millionths of a shilling
+DIVISOR = 100 * RATE_SCALE * DAYS_IN_YEAR * 100 // MICROS
+INT64_MAX = 2 ** 63 - 1
+CENT = Decimal('0.01')
+MICRO = Decimal('0.000001')
+
+
+def daily_interest(balance, rate):
+    """
+    One day's interest on ``balance`` at annual percentage ``rate``, as
+    Decimal to a millionth of a shilling
+    """
+    return (balance * rate / 100 / DAYS_IN_YEAR).quantize(MICRO, rounding=ROUND_HALF_UP)
+
+
+def _python_interest_micros(balance_cents, rate_units):
+    half = DIVISOR // 2
+    return [(balance * rate + half) // DIVISOR for balance, rate in zip(balance_cents, rate_units)]
+
+
+def interest_micros(balance_cents, rate_units):
+    """
+    One day's interest in millionths of a shilling for parallel sequences of
+    balances (cents) and rates (ten-thousandths of a percent), rounded half up.
+    """
+    if np is None or (balance_cents and max(balance_cents) * max(rate_units) + DIVISOR // 2 > INT64_MAX):
+        # Python integers never overflow, for books int64 cannot hold
+        return _python_interest_micros(balance_cents, rate_units)
+    balances = np.asarray(balance_cents, dtype=np.int64)
+    rates = np.asarray(rate_units, dtype=np.int64)
+    return ((balances * rates + DIVISOR // 2) // DIVISOR).tolist()
+
+
+def accrual_accounts(day):
+    """Active interest-paying accounts not yet accrued for ``day``"""
+    return BankAccount.objects.filter(
+        status='active', account_type__interest_rate__gt=0,
+    ).exclude(Exists(InterestCalculation.objects.filter(account=OuterRef('pk'), calculation_date=day)))
+
+
+def accrue_interest(day, batch_size=5000):
+    """
+    Write ``day``'s InterestCalculation rows for every account that earns
+    interest. Returns (accounts accrued, total interest).
+    """
+    account_ids, balance_cents, rate_units = [], [], []
+    batches = end_of_day_balances(day, accrual_accounts(day), ('account_type__interest_rate',), batch_size)
+    for batch in batches:
+        for account_id, balance, rate in batch:
+            if balance > 0:
+                account_ids.append(account_id)
+                balance_cents.append(int(balance * 100))
+                rate_units.append(int(rate * RATE_SCALE))
+
+    earned = interest_micros(balance_cents, rate_units)
+    rows = [
+        InterestCalculation(
+            account_id=account_id, calculation_date=day,
+            balance=Decimal(balance) / 100, interest_rate=Decimal(rate) / RATE_SCALE,
+            interest_earned=Decimal(micros) / MICROS, days_calculated=1,
+        )
+        for account_id, balance, rate, micros in zip(account_ids, balance_cents, rate_units, earned)
+    ]
+    for start in range(0, len(rows), batch_size):
+        # A concurrent run may have accrued some accounts since they were read
+        InterestCalculation.objects.bulk_create(rows[start:start + batch_size], ignore_conflicts=True)
+    return len(rows), (Decimal(sum(earned)) / MICROS).quantize(MICRO)
+
+
+def credit_interest(up_to, batch_size=500):
+    """
+    Post every account's uncredited interest accrued up to ``up_to`` as an
+    interest_credit transaction. Accounts that are not active, or whose
+    total is still under half a cent, keep their accruals for a later run.
+    Returns (accounts credited, total credited).
+    """
+    pending = InterestCalculation.objects.filter(is_credited=False, calculation_date__lte=up_to)
+    account_ids = list(pending.order_by('account_id').values_list('account_id', flat=True).distinct())
+    description = f'Interest to {up_to}'
+
+    credited, total = 0, Decimal('0.00')
+    for start in range(0, len(account_ids), batch_size):
+        accrued, totals = {}, {}
+        for pk, account_id, earned in pending.filter(
+            account_id__in=account_ids[start:start + batch_size],
+        ).values_list('pk', 'account_id', 'interest_earned'):
+            accrued.setdefault(account_id, []).append(pk)
+            totals[account_id] = totals.get(account_id, Decimal('0')) + earned
+
+        def mark_credited(transactions):
+            # Only the accruals summed above; any written since stay pending
+            if transactions:
+                InterestCalculation.objects.filter(
+                    pk__in=[pk for txn in transactions for pk in accrued[txn.account_id]],
+                ).update(
+                    is_credited=True,
+                    transaction=Case(*(When(account_id=txn.account_id, then=Value(txn.pk))
+                                       for txn in transactions)),
+                )
+
+        transactions = post_credits(
+            {account_id: amount.quantize(CENT, rounding=ROUND_HALF_UP) for account_id, amount in totals.items()},
+            'interest_credit', 'branch', description, on_posted=mark_credited,
+        )
+        credited += len(transactions)
+        total += sum((txn.amount for txn in transactions), Decimal('0.00'))
+    return credited, total
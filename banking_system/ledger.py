@@ -0,0 +1,480 @@
+# ledger.py
+"""
+Ledger posting service.
+
+Every balance-changing operation (deposit, withdrawal, transfer) goes through
+this module. A posting locks the affected account rows, applies the balance
+change with a single UPDATE and writes the Transaction rows (with their
+notifications and daily summary counts, see notifications.py and
+analytics.py) inside the same database transaction, so concurrent postings
+can never lose an update.
+
+Account rows are always locked in primary key order, and postings that lose a
+deadlock or serialization race are retried with bounded backoff. Amounts and
+fees are rounded half up to the cent before anything is written, so the
+account balance and the Transaction rows always agree.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics import record_transactions
+from .models import (
+    AgentTransactionLimit, BankAccount, BankAgent, Transaction, UserTransactionLimit
+)
+from .notifications import queue_transaction_notification
+
+logger = logging.getLogger(__name__)
+
+# Retry policy for postings that hit a deadlock or serialization failure
+MAX_RETRIES = getattr(settings, 'LEDGER_MAX_RETRIES', 3)
+RETRY_BACKOFF_SECONDS = getattr(settings, 'LEDGER_RETRY_BACKOFF_SECONDS', 0.05)
+
+# SQLSTATE / error codes that mean "try the transaction again"
+RETRYABLE_SQLSTATES = {'40001', '40P01'}  # PostgreSQL serialization_failure, deadlock_detected
+RETRYABLE_MYSQL_ERRORS = {1205, 1213}  # lock wait timeout, deadlock
+
+CENT = Decimal('0.01')
+
+# Per-account retry counts for this process, used to spot contention hot spots
+_retry_counts = Counter()
+_retry_counts_lock = threading.Lock()
+
+
+class PostingError(Exception):
+    """Raised when a posting is rejected (inactive account, insufficient funds...)"""
+
+
+def _cents(value):
+    """``value`` rounded half up to the cent, as balances are stored"""
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _is_retryable(exc):
+    """Whether a database error is a deadlock / serialization failure"""
+    cause = exc.__cause__
+    sqlstate = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+    if sqlstate in RETRYABLE_SQLSTATES:
+        return True
+    args = getattr(cause, 'args', ())
+    if args and args[0] in RETRYABLE_MYSQL_ERRORS:
+        return True
+    return 'database is locked' in str(exc)
+
+
+def _record_retry(account_ids):
+    with _retry_counts_lock:
+        for account_id in account_ids:
+            _retry_counts[account_id] += 1
+
+
+def get_retry_counts(limit=None):
+    """
+    Return [(account_id, retries), ...] for the most contended accounts
+    seen by this process, busiest first.
+    """
+    with _retry_counts_lock:
+        return _retry_counts.most_common(limit)
+
+
+def reset_retry_counts():
+    with _retry_counts_lock:
+        _retry_counts.clear()
+
+
+def _run_posting(account_ids, posting):
+    """
+    Run ``posting`` (which opens its own atomic block), retrying it when it
+    loses a deadlock or serialization race. Retries are only attempted when
+    we own the outermost transaction; inside a caller's atomic block the
+    error is re-raised so the caller can roll back.
+    """
+    can_retry = not connection.in_atomic_block
+    attempt = 0
+    while True:
+        try:
+            return posting()
+        except DatabaseError as exc:
+            if not (can_retry and _is_retryable(exc)):
+                raise
+            if attempt >= MAX_RETRIES:
+                logger.warning(
+                    "Posting on accounts %s gave up after %d retries: %s",
+                    account_ids, attempt, exc
+                )
+                raise PostingError('Account is busy, please try again') from exc
+
+            attempt += 1
+            _record_retry(account_ids)
+            logger.info("Retrying posting on accounts %s (attempt %d): %s", account_ids, attempt, exc)
+            delay = RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1))
+            time.sleep(delay + random.uniform(0, delay))
+
+
+def _lock_accounts(*account_ids):
+    """
+    Lock account rows for the rest of the current transaction and return
+    them keyed by primary key. Rows are locked in ascending primary key
+    order so two postings touching the same pair of accounts can never
+    wait on each other in opposite order.
+    """
+    locked = {}
+    for account_id in sorted(set(account_ids)):
+        try:
+            locked[account_id] = BankAccount.objects.select_for_update().only(
+                'id', 'balance', 'available_balance', 'status'
+            ).get(pk=account_id)
+        except BankAccount.DoesNotExist:
+            raise PostingError('Account not found')
+    return locked
+
+
+def _apply_balance_change(locked, delta, now):
+    """Move the locked account's balances by ``delta`` and return (before, after)"""
+    if locked.status != 'active':
+        raise PostingError('Account is not active')
+
+    BankAccount.objects.filter(pk=locked.pk).update(
+        balance=F('balance') + delta,
+        available_balance=F('available_balance') + delta,
+        last_transaction_date=now,
+        updated_at=now,
+    )
+    return locked.balance, locked.balance + delta
+
+
+def _charge_user_limits(user_id, kind, amount, now):
+    """
+    Check ``amount`` against the customer's limits and add it to the running
+    daily / monthly counters. ``kind`` is 'withdrawal' or 'transfer'. The
+    limits row is locked, so the check is a single row read and the counters
+    stay exact under concurrent postings; stale counters are rolled over
+    lazily on the first posting of a new day or month.
+    """
+    limits, _ = UserTransactionLimit.objects.select_for_update().get_or_create(user_id=user_id)
+    reset = limits.roll_over(timezone.localdate(now))
+
+    if amount > limits.single_transaction_limit:
+        raise PostingError(
+            f'Amount exceeds single transaction limit of KES {limits.single_transaction_limit:,.2f}'
+        )
+
+    if kind == 'withdrawal':
+        counters = ['current_daily_withdrawals']
+        if limits.current_daily_withdrawals + amount > limits.daily_withdrawal_limit:
+            raise PostingError(f'Daily withdrawal limit of KES {limits.daily_withdrawal_limit:,.2f} exceeded')
+    else:
+        counters = ['current_daily_transfers', 'current_monthly_transfers']
+        if limits.current_daily_transfers + amount > limits.daily_transfer_limit:
+            raise PostingError(f'Daily transfer limit of KES {limits.daily_transfer_limit:,.2f} exceeded')
+        if limits.current_monthly_transfers + amount > limits.monthly_transfer_limit:
+            raise PostingError(f'Monthly transfer limit of KES {limits.monthly_transfer_limit:,.2f} exceeded')
+
+    updates = {field: Decimal('0.00') for field in reset}
+    for field in counters:
+        updates[field] = updates[field] + amount if field in reset else F(field) + amount
+    UserTransactionLimit.objects.filter(pk=limits.pk).update(
+        last_reset_date=limits.last_reset_date,
+        updated_at=now,
+        **updates
+    )
+
+
+def _charge_agent(agent_id, kind, amount, now):
+    """
+    Enforce the agent's single / daily / monthly limits for an agent-channel
+    ``kind`` ('deposit' or 'withdrawal') and add ``amount`` to the agent's
+    float counters. The limit check and the increment are one conditional
+    F() UPDATE, which only matches totals last reset today; the limits row
+    is only read to roll stale totals over or to explain a rejection.
+    """
+    today = timezone.localdate(now)
+    single_limit = f'single_{kind}_limit'
+    updated = AgentTransactionLimit.objects.filter(
+        agent_id=agent_id,
+        last_reset_date=today,
+        **{f'{single_limit}__gte': amount},
+        current_daily_total__lte=F('daily_transaction_limit') - amount,
+        current_monthly_total__lte=F('monthly_transaction_limit') - amount,
+    ).update(
+        current_daily_total=F('current_daily_total') + amount,
+        current_monthly_total=F('current_monthly_total') + amount,
+    )
+
+    if not updated:
+        limits, created = AgentTransactionLimit.objects.get_or_create(agent_id=agent_id)
+        last_reset_date = limits.last_reset_date
+        reset = limits.roll_over(today)
+        if reset:
+            # First posting of a new day or month; only one concurrent posting wins the reset
+            if AgentTransactionLimit.objects.filter(pk=limits.pk, last_reset_date=last_reset_date).update(
+                last_reset_date=today, **{field: getattr(limits, field) for field in reset}
+            ):
+                BankAgent.objects.filter(pk=agent_id).update(**{field: Decimal('0.00') for field in reset})
+            return _charge_agent(agent_id, kind, amount, now)
+        if created:
+            return _charge_agent(agent_id, kind, amount, now)
+        if amount > getattr(limits, single_limit):
+            raise PostingError(
+                f'Amount exceeds agent single {kind} limit of KES {getattr(limits, single_limit):,.2f}'
+            )
+        if limits.current_daily_total + amount > limits.daily_transaction_limit:
+            raise PostingError('Agent daily transaction limit exceeded')
+        raise PostingError('Agent monthly transaction limit exceeded')
+
+    BankAgent.objects.filter(pk=agent_id).update(
+        current_daily_total=F('current_daily_total') + amount,
+        current_monthly_total=F('current_monthly_total') + amount,
+    )
+
+
+def _sync_account(account, delta, now):
+    """Keep the caller's in-memory account instance in step with the database"""
+    account.balance += delta
+    account.available_balance += delta
+    account.last_transaction_date = now
+
+
+def _insert_transactions(rows):
+    """
+    Write Transaction rows, in one INSERT when the backend can return the
+    keys, and add them to the daily summary
+    """
+    for row in rows:
+        row.transaction_id = row.generate_transaction_id()
+    if len(rows) > 1 and connection.features.can_return_rows_from_bulk_insert:
+        rows = Transaction.objects.bulk_create(rows)
+    else:
+        for row in rows:
+            row.save(force_insert=True)
+    record_transactions(rows)
+    return rows
+
+
+def post_deposit(account, amount, fee, channel, description, notify=True, **fields):
+    """
+    Credit ``amount - fee`` to ``account`` and record the deposit.
+    Extra keyword arguments are stored on the Transaction row (agent, branch...);
+    deposits taken by an agent count against that agent's limits.
+    """
+    amount, fee = _cents(amount), _cents(fee)
+    credit = amount - fee
+    if credit <= 0:
+        raise PostingError('Amount does not cover the deposit fee')
+
+    agent = fields.get('agent')
+
+    def posting():
+        now = timezone.now()
+        with db_transaction.atomic():
+            locked = _lock_accounts(account.pk)[account.pk]
+            if agent is not None:
+                _charge_agent(agent.pk, 'deposit', amount, now)
+            balance_before, balance_after = _apply_balance_change(locked, credit, now)
+            txn, = _insert_transactions([Transaction(
+                account=account,
+                transaction_type='deposit',
+                amount=amount,
+                fee=fee,
+                total_amount=credit,
+                balance_before=balance_before,
+                balance_after=balance_after,
+                channel=channel,
+                description=description,
+                status='completed',
+                processed_at=now,
+                **fields
+            )])
+            if notify:
+                queue_transaction_notification(account.customer, txn, 'deposit')
+        return txn
+
+    txn = _run_posting([account.pk], posting)
+    _sync_account(account, credit, txn.processed_at)
+    return txn
+
+
+def post_withdrawal(account, amount, fee, channel, description, check_limits=True,
+                    notify=True, **fields):
+    """
+    Debit ``amount + fee`` from ``account`` and record the withdrawal.
+    Unless ``check_limits`` is False the amount is charged against the
+    customer's withdrawal limits in the same transaction; withdrawals paid
+    out by an agent always count against that agent's limits.
+    """
+    amount, fee = _cents(amount), _cents(fee)
+    debit = amount + fee
+    agent = fields.get('agent')
+
+    def posting():
+        now = timezone.now()
+        with db_transaction.atomic():
+            locked = _lock_accounts(account.pk)[account.pk]
+            if check_limits:
+                _charge_user_limits(account.customer_id, 'withdrawal', amount, now)
+            if agent is not None:
+                _charge_agent(agent.pk, 'withdrawal', amount, now)
+            if locked.available_balance < debit:
+                raise PostingError('Insufficient funds')
+            balance_before, balance_after = _apply_balance_change(locked, -debit, now)
+            txn, = _insert_transactions([Transaction(
+                account=account,
+                transaction_type='withdrawal',
+                amount=amount,
+                fee=fee,
+                total_amount=debit,
+                balance_before=balance_before,
+                balance_after=balance_after,
+                channel=channel,
+                description=description,
+                status='completed',
+                processed_at=now,
+                **fields
+            )])
+            if notify:
+                queue_transaction_notification(account.customer, txn, 'withdrawal')
+        return txn
+
+    txn = _run_posting([account.pk], posting)
+    _sync_account(account, -debit, txn.processed_at)
+    return txn
+
+
+def post_transfer(sender_account, beneficiary_account, amount, fee, channel,
+                  beneficiary_name, reference='', check_limits=True, notify=True, on_posted=None):
+    """
+    Move ``amount`` from sender to beneficiary, charging ``fee`` to the sender.
+    Unless ``check_limits`` is False the amount is charged against the
+    sender's transfer limits. ``on_posted(debit, credit)`` runs inside the
+    posting's database transaction. Returns the (debit, credit) Transaction pair.
+    """
+    if sender_account.pk == beneficiary_account.pk:
+        raise PostingError('Cannot transfer to same account')
+
+    amount, fee = _cents(amount), _cents(fee)
+    debit = amount + fee
+    sender_name = sender_account.customer.get_full_name()
+
+    def posting():
+        now = timezone.now()
+        with db_transaction.atomic():
+            locked = _lock_accounts(sender_account.pk, beneficiary_account.pk)
+            sender = locked[sender_account.pk]
+            beneficiary = locked[beneficiary_account.pk]
+
+            if check_limits:
+                _charge_user_limits(sender_account.customer_id, 'transfer', amount, now)
+            if sender.available_balance < debit:
+                raise PostingError('Insufficient funds')
+
+            sender_before, sender_after = _apply_balance_change(sender, -debit, now)
+            beneficiary_before, beneficiary_after = _apply_balance_change(beneficiary, amount, now)
+
+            debit_txn, credit_txn = _insert_transactions([
+                Transaction(
+                    account=sender_account,
+                    transaction_type='transfer',
+                    amount=amount,
+                    fee=fee,
+                    total_amount=debit,
+                    balance_before=sender_before,
+                    balance_after=sender_after,
+                    channel=channel,
+                    description=f'Transfer to {beneficiary_name}',
+                    reference_number=reference,
+                    status='completed',
+                    beneficiary_account=beneficiary_account,
+                    beneficiary_name=beneficiary_name,
+                    processed_at=now,
+                ),
+                Transaction(
+                    account=beneficiary_account,
+                    transaction_type='deposit',
+                    amount=amount,
+                    fee=Decimal('0'),
+                    total_amount=amount,
+                    balance_before=beneficiary_before,
+                    balance_after=beneficiary_after,
+                    channel=channel,
+                    description=f'Transfer from {sender_name}',
+                    reference_number=reference,
+                    status='completed',
+                    processed_at=now,
+                ),
+            ])
+            if on_posted is not None:
+                on_posted(debit_txn, credit_txn)
+            if notify:
+                queue_transaction_notification(sender_account.customer, debit_txn, 'transfer_sent')
+                queue_transaction_notification(
+                    beneficiary_account.customer, credit_txn, 'transfer_received'
+                )
+        return debit_txn, credit_txn
+
+    debit_txn, credit_txn = _run_posting(
+        [sender_account.pk, beneficiary_account.pk], posting
+    )
+    _sync_account(sender_account, -debit, debit_txn.processed_at)
+    _sync_account(beneficiary_account, amount, credit_txn.processed_at)
+    return debit_txn, credit_txn
+
+
+def post_credits(credits, transaction_type, channel, description, on_posted=None):
+    """
+    Credit many accounts at once, e.g. interest: ``credits`` maps account id
+    to amount. The accounts are locked with one SELECT ... FOR UPDATE (in
+    primary key order), their balances are written with one bulk UPDATE and
+    the Transaction rows with one INSERT. Accounts that are not active are
+    skipped. ``on_posted(transactions)`` runs inside the same database
+    transaction, so callers can mark their own rows as posted atomically.
+    Returns the Transaction rows.
+    """
+    credits = {account_id: _cents(amount) for account_id, amount in credits.items()}
+    account_ids = sorted(account_id for account_id, amount in credits.items() if amount > 0)
+
+    def posting():
+        now = timezone.now()
+        with db_transaction.atomic():
+            accounts = list(
+                BankAccount.objects.select_for_update()
+                .filter(pk__in=account_ids, status='active').order_by('pk')
+                .only('id', 'balance', 'available_balance', 'status', 'branch')
+            )
+            rows = []
+            for account in accounts:
+                amount = credits[account.pk]
+                balance_before = account.balance
+                account.balance += amount
+                account.available_balance += amount
+                account.last_transaction_date = account.updated_at = now
+                rows.append(Transaction(
+                    account=account,
+                    transaction_type=transaction_type,
+                    amount=amount,
+                    fee=Decimal('0'),
+                    total_amount=amount,
+                    balance_before=balance_before,
+                    balance_after=account.balance,
+                    channel=channel,
+                    description=description,
+                    status='completed',
+                    processed_at=now,
+                ))
+            # The rows are locked, so writing the computed balances back is safe
+            BankAccount.objects.bulk_update(
+                accounts, ['balance', 'available_balance', 'last_transaction_date', 'updated_at'],
+            )
+            rows = _insert_transactions(rows) if rows else rows
+            if on_posted is not None:
+                on_posted(rows)
+        return rows
+
+    return _run_posting(account_ids, posting)
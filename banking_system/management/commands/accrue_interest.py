@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from banking_system.interest import accrue_interest, credit_interest
+
+
+class Command(BaseCommand):
+    help = "Accrue daily interest on interest-paying accounts (run nightly, after midnight)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Local date to accrue, YYYY-MM-DD (default: yesterday)')
+        parser.add_argument('--days', type=int, default=1,
+                            help='Number of days ending at --date to accrue, for backfills (default: 1)')
+        parser.add_argument('--credit', action='store_true',
+                            help='Also post uncredited interest up to --date (run after month end)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Accounts per query and per INSERT (default: 5000)')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            day = parse_date(options['date'])
+            if day is None:
+                raise CommandError('--date must be YYYY-MM-DD')
+        else:
+            day = timezone.localdate() - timedelta(days=1)
+        if day >= timezone.localdate():
+            raise CommandError('Only days that have ended can be accrued')
+
+        for offset in reversed(range(options['days'])):
+            accrual_day = day - timedelta(days=offset)
+            accrued, total = accrue_interest(accrual_day, options['batch_size'])
+            self.stdout.write(f"{accrual_day}: {accrued:,} accounts, KES {total:,.2f}")
+
+        if options['credit']:
+            credited, total = credit_interest(day)
+            self.stdout.write(f"Credited KES {total:,.2f} of interest to {credited:,} accounts")
+
+        self.stdout.write(self.style.SUCCESS('Interest accrual complete.'))
@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from banking_system.analytics import (
+    rebuild_daily_summary, set_summary_coverage, summary_coverage_start
+)
+from banking_system.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyTransactionSummary rollup from Transaction for a range of dates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', type=date.fromisoformat,
+                            help='First local date to rebuild, YYYY-MM-DD (default: first transaction)')
+        parser.add_argument('--to', dest='to_date', type=date.fromisoformat,
+                            help='Last local date to rebuild, YYYY-MM-DD (default: yesterday; '
+                                 "today's rows are kept by the ledger)")
+        parser.add_argument('--days', type=int,
+                            help='Rebuild only the last N days (overrides --from)')
+        parser.add_argument('--chunk-days', type=int, default=31,
+                            help='Dates rebuilt per database transaction (default: 31)')
+
+    def handle(self, *args, **options):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        end = options['to_date'] or yesterday
+        if end > yesterday:
+            raise CommandError("--to must be before today: live postings are still updating today's rows")
+        if options['days']:
+            start = covered_from = end - timedelta(days=options['days'] - 1)
+        elif options['from_date']:
+            start = covered_from = options['from_date']
+        else:
+            first = Transaction.objects.aggregate(first=Min('created_at'))['first']
+            if first is None:
+                self.stdout.write('No transactions to summarise.')
+                return
+            start = timezone.localdate(first)
+            # Nothing happened before the first transaction: all history is covered
+            covered_from = date.min
+        # With no --from, history that starts today has nothing to rebuild
+        if start > end and covered_from != date.min:
+            raise CommandError('--from must not be after --to')
+
+        written = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=options['chunk_days'] - 1), end)
+            rows = rebuild_daily_summary(chunk_start, chunk_end)
+            written += rows
+            self.stdout.write(f"{chunk_start} to {chunk_end}: {rows} summary rows")
+            chunk_start = chunk_end + timedelta(days=1)
+
+        # The ledger keeps today's rows current, so a rebuild up to yesterday
+        # makes the rollup complete from its first date
+        coverage = summary_coverage_start()
+        if end >= yesterday and (coverage is None or covered_from < coverage):
+            set_summary_coverage(covered_from)
+            self.stdout.write(f"Rollup is now complete from {covered_from}.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {written} summary rows for {start} to {end}.'
+        ))
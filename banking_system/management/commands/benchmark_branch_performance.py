@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q, Sum
+
+from banking_system.analytics import branch_performance
+from banking_system.benchmarks import (
+    SEED_REFERENCE, analyze, delete_seeded_branches, seed_branches, seed_transactions, timed
+)
+from banking_system.models import Branch, Transaction
+
+
+def joined_branch_performance(status=None):
+    """The previous single-query version, which joins accounts to transactions"""
+    condition = Q(bankaccount__transactions__status=status) if status else Q()
+    return list(Branch.objects.annotate(
+        account_count=Count('bankaccount'),
+        transaction_count=Count('bankaccount__transactions', filter=condition),
+        total_amount=Sum('bankaccount__transactions__amount', filter=condition),
+    ).order_by('-account_count'))
+
+
+def cents(amount):
+    return Decimal(amount or 0).quantize(Decimal('0.01'))
+
+
+class Command(BaseCommand):
+    help = "Compare branch performance metrics from grouped queries against the joined annotate() query"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branches', type=int, default=100,
+                            help='Number of benchmark branches (default: 100)')
+        parser.add_argument('--accounts-per-branch', type=int, default=50,
+                            help='Accounts per benchmark branch (default: 50)')
+        parser.add_argument('--transactions', type=int, default=5000000,
+                            help='Number of seeded transactions (default: 5000000)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per query; the best time is reported (default: 3)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the benchmark branches, accounts and transactions')
+
+    def handle(self, *args, **options):
+        accounts = seed_branches(options['branches'], options['accounts_per_branch'])
+        existing = Transaction.objects.filter(reference_number=SEED_REFERENCE).count()
+        missing = options['transactions'] - existing
+        if missing > 0:
+            self.stdout.write(f"Seeding {missing:,} transactions over {len(accounts):,} accounts...")
+            seed_transactions(missing, accounts, progress=self.report_progress)
+        analyze(Transaction)
+
+        try:
+            for status in (None, 'completed'):
+                joined = joined_branch_performance(status)
+                grouped = branch_performance(status=status)
+                joined_ms = timed(lambda: joined_branch_performance(status), options['repeat'])
+                grouped_ms = timed(lambda: branch_performance(status=status), options['repeat'])
+
+                expected = {branch.pk: branch for branch in grouped}
+                wrong_accounts = sum(
+                    branch.account_count != expected[branch.pk].account_count for branch in joined
+                )
+                # Compare to the cent: SQLite sums decimals as floats
+                wrong_totals = sum(
+                    branch.transaction_count != expected[branch.pk].transaction_count
+                    or cents(branch.total_amount) != cents(expected[branch.pk].total_amount)
+                    for branch in joined
+                )
+                self.stdout.write(
+                    f"status={status or 'any':<10} joined: {joined_ms:>10.1f} ms   "
+                    f"grouped: {grouped_ms:>8.1f} ms   ({joined_ms / grouped_ms:.1f}x)   "
+                    f"branches with inflated account counts: {wrong_accounts}, "
+                    f"with different transaction totals: {wrong_totals}"
+                )
+        finally:
+            if not options['keep']:
+                delete_seeded_branches()
+
+        self.stdout.write(self.style.SUCCESS('Branch performance benchmark complete.'))
+
+    def report_progress(self, created):
+        if created % 500000 == 0:
+            self.stdout.write(f"  {created:,} rows")
@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from banking_system.benchmarks import (
+    SEED_REFERENCE, analyze, benchmark_accounts, delete_seeded, seed_transactions, timed
+)
+from banking_system.dates import local_date_range, on_local_date
+from banking_system.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Compare created_at__date lookups with local-date range filters on seeded Transaction rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000,
+                            help='Number of seeded transactions to benchmark against (default: 2000000)')
+        parser.add_argument('--accounts', type=int, default=1000,
+                            help='Number of active accounts to spread rows over (default: 1000)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs per query; the best time is reported (default: 5)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded rows for the next run')
+
+    def handle(self, *args, **options):
+        accounts = benchmark_accounts(options['accounts'])
+        if not accounts:
+            raise CommandError('No active accounts found. Run seed_data first.')
+
+        existing = Transaction.objects.filter(reference_number=SEED_REFERENCE).count()
+        missing = options['rows'] - existing
+        if missing > 0:
+            self.stdout.write(f"Seeding {missing:,} transactions over {len(accounts)} accounts...")
+            seed_transactions(missing, accounts, progress=self.report_progress)
+        analyze(Transaction)
+
+        try:
+            self.stdout.write(f"{'query':<16}{'__date (ms)':>13}{'range (ms)':>12}{'speedup':>10}  plans")
+            for name, (date_lookup, date_range) in self.query_pairs().items():
+                if list(date_lookup) != list(date_range):
+                    raise CommandError(f'{name}: the two filters returned different results')
+                before = timed(lambda: list(date_lookup.all()), options['repeat'])
+                after = timed(lambda: list(date_range.all()), options['repeat'])
+                self.stdout.write(f"{name:<16}{before:>13.2f}{after:>12.2f}{before / after:>9.1f}x")
+                for label, queryset in (('__date', date_lookup), ('range', date_range)):
+                    plan = ' | '.join(line.strip() for line in queryset.explain().splitlines())
+                    self.stdout.write(f"    {label:<8}{plan}")
+        finally:
+            if not options['keep']:
+                delete_seeded()
+
+        self.stdout.write(self.style.SUCCESS('Date filter benchmark complete.'))
+
+    def report_progress(self, created):
+        if created % 100000 == 0:
+            self.stdout.write(f"  {created:,} rows")
+
+    def query_pairs(self):
+        """The same grouped query filtered with a __date lookup and with a local-date range"""
+        today = timezone.localdate()
+        week_ago = today - timedelta(days=7)
+        month_ago = today - timedelta(days=30)
+        filters = {
+            'today': ({'created_at__date': today}, on_local_date('created_at', today)),
+            'last_7_days': ({'created_at__date__gte': week_ago},
+                            local_date_range('created_at', week_ago)),
+            'last_30_days': ({'created_at__date__gte': month_ago, 'created_at__date__lte': today},
+                             local_date_range('created_at', month_ago, today)),
+        }
+        return {
+            name: tuple(
+                Transaction.objects.filter(**lookup).values('status').annotate(
+                    count=Count('id'), total=Sum('amount'),
+                ).order_by('status')
+                for lookup in pair
+            )
+            for name, pair in filters.items()
+        }
@@ -0,0 +1,85 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Value
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from banking_system import interest
+from banking_system.balances import end_of_day_balances
+from banking_system.benchmarks import SEED_BRANCH_PREFIX, delete_seeded_branches, seed_branches
+from banking_system.models import AccountType, BankAccount, InterestCalculation
+
+BENCHMARK_ACCOUNT_TYPE = 'BENCHINT'
+
+
+def seconds(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Time the daily interest accrual over a large book, vectorised against row-by-row Decimal"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branches', type=int, default=200,
+                            help='Number of benchmark branches (default: 200)')
+        parser.add_argument('--accounts-per-branch', type=int, default=5000,
+                            help='Accounts per benchmark branch (default: 5000)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the benchmark branches and accounts')
+
+    def handle(self, *args, **options):
+        total = options['branches'] * options['accounts_per_branch']
+        self.stdout.write(f"Seeding {total:,} accounts...")
+        seed_branches(options['branches'], options['accounts_per_branch'])
+        account_type, _ = AccountType.objects.get_or_create(
+            code=BENCHMARK_ACCOUNT_TYPE,
+            defaults=dict(name='Benchmark Interest Savings', interest_rate=Decimal('3.5000')),
+        )
+        day = timezone.localdate() - timedelta(days=1)
+        seeded = BankAccount.objects.filter(branch__branch_code__startswith=SEED_BRANCH_PREFIX)
+        # Balances from 0.00 to 99,999.99, opened before the accrual day
+        seeded.update(
+            account_type=account_type, status='active',
+            balance=Mod(F('id') * Value(7919), Value(10000000)) / Value(100),
+            created_at=timezone.now() - timedelta(days=2),
+        )
+        InterestCalculation.objects.filter(account__in=seeded, calculation_date=day).delete()
+
+        try:
+            batches, load_s = seconds(lambda: list(end_of_day_balances(
+                day, interest.accrual_accounts(day), ('account_type__interest_rate',), 5000,
+            )))
+            rows = [(balance, rate) for batch in batches for _, balance, rate in batch if balance > 0]
+            balance_cents = [int(balance * 100) for balance, _ in rows]
+            rate_units = [int(rate * interest.RATE_SCALE) for _, rate in rows]
+            self.stdout.write(f"Loaded {len(rows):,} end-of-day balances in {load_s:.1f}s")
+
+            expected, decimal_s = seconds(lambda: [
+                int(interest.daily_interest(balance, rate) * interest.MICROS) for balance, rate in rows
+            ])
+            python, python_s = seconds(lambda: interest._python_interest_micros(balance_cents, rate_units))
+            vectorised, vectorised_s = seconds(lambda: interest.interest_micros(balance_cents, rate_units))
+            engine = 'NumPy' if interest.np is not None else 'Python (NumPy not installed)'
+            self.stdout.write(f"{'Decimal per row':<32}{decimal_s * 1000:>10.1f} ms")
+            self.stdout.write(f"{'Python integers':<32}{python_s * 1000:>10.1f} ms   "
+                              f"mismatches: {sum(a != b for a, b in zip(python, expected))}")
+            self.stdout.write(f"{'interest_micros: ' + engine:<32}{vectorised_s * 1000:>10.1f} ms   "
+                              f"mismatches: {sum(a != b for a, b in zip(vectorised, expected))}")
+
+            (accrued, accrued_total), accrue_s = seconds(lambda: interest.accrue_interest(day))
+            self.stdout.write(
+                f"accrue_interest({day}): {accrued:,} InterestCalculation rows, KES {accrued_total:,.2f} "
+                f"in {accrue_s:.1f}s ({accrued / accrue_s:,.0f} accounts/sec)"
+            )
+        finally:
+            if not options['keep']:
+                InterestCalculation.objects.filter(account__in=seeded).delete()
+                delete_seeded_branches()
+                account_type.delete()
+
+        self.stdout.write(self.style.SUCCESS('Interest accrual benchmark complete.'))
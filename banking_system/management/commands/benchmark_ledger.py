@@ -0,0 +1,108 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction as db_transaction
+
+from banking_system.analytics import remove_transactions
+from banking_system.ledger import (
+    get_retry_counts, post_deposit, post_withdrawal, reset_retry_counts
+)
+from banking_system.models import BankAccount, Transaction
+
+
+class Command(BaseCommand):
+    help = "Measure ledger throughput (postings/sec) at different numbers of concurrent workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,8,32',
+                            help='Comma separated list of worker counts to run (default: 1,8,32)')
+        parser.add_argument('--postings', type=int, default=2000,
+                            help='Postings per run (default: 2000)')
+        parser.add_argument('--accounts', type=int, default=50,
+                            help='Number of active accounts to spread postings over (default: 50)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the benchmark Transaction rows instead of deleting them')
+
+    def handle(self, *args, **options):
+        worker_counts = [int(w) for w in options['workers'].split(',') if w.strip()]
+        account_ids = list(
+            BankAccount.objects.filter(status='active')
+            .order_by('id')
+            .values_list('id', flat=True)[:options['accounts']]
+        )
+        if not account_ids:
+            raise CommandError('No active accounts found. Run seed_data first.')
+
+        # Each posting pair is a deposit followed by a withdrawal of the same
+        # amount with no fee, so account balances are unchanged after the run.
+        reference = f"BENCH{uuid.uuid4().hex[:12].upper()}"
+        pairs = max(options['postings'] // 2, 1)
+
+        self.stdout.write(
+            f"Posting {pairs * 2} transactions over {len(account_ids)} accounts ({connection.vendor})"
+        )
+        try:
+            for workers in worker_counts:
+                reset_retry_counts()
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(
+                        lambda worker: self.run_worker(worker, workers, pairs, account_ids, reference),
+                        range(workers)
+                    ))
+                elapsed = time.perf_counter() - started
+
+                posted = sum(ok for ok, _ in results)
+                failed = sum(err for _, err in results)
+                self.stdout.write(
+                    f"{workers:>4} workers: {posted / elapsed:>10,.0f} postings/sec "
+                    f"({posted} posted, {failed} failed, {elapsed:.2f}s)"
+                )
+                hot_spots = get_retry_counts(5)
+                if hot_spots:
+                    self.stdout.write('      retries by account: ' + ', '.join(
+                        f"{account_id}={retries}" for account_id, retries in hot_spots
+                    ))
+        finally:
+            if not options['keep']:
+                postings = Transaction.objects.filter(reference_number=reference)
+                with db_transaction.atomic():
+                    # Take the deleted postings back out of today's summary rows
+                    remove_transactions(postings.select_related('account').iterator())
+                    postings.delete()
+
+        self.stdout.write(self.style.SUCCESS('Ledger benchmark complete.'))
+
+    def run_worker(self, worker, workers, pairs, account_ids, reference):
+        """Run this worker's share of deposit/withdrawal pairs on its own connection"""
+        accounts = list(BankAccount.objects.filter(id__in=account_ids).order_by('id'))
+        amount = Decimal('1.00')
+        posted = failed = 0
+        try:
+            for i in range(worker, pairs, workers):
+                account = accounts[i % len(accounts)]
+                try:
+                    post_deposit(account, amount, Decimal('0'), channel='branch',
+                                 description='Ledger benchmark', notify=False,
+                                 reference_number=reference)
+                except Exception:
+                    failed += 1
+                    continue
+                posted += 1
+
+                # Keep retrying the matching withdrawal so balances net out
+                for attempt in range(10):
+                    try:
+                        post_withdrawal(account, amount, Decimal('0'), channel='branch',
+                                        description='Ledger benchmark', check_limits=False,
+                                        notify=False, reference_number=reference)
+                        posted += 1
+                        break
+                    except Exception:
+                        failed += 1
+        finally:
+            connection.close()
+        return posted, failed
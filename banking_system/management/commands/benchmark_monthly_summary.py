@@ -0,0 +1,95 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.db.models import Avg, Count, Sum
+from django.utils import timezone
+
+from banking_system.analytics import (
+    monthly_totals_from_summary, monthly_totals_from_transactions, rebuild_daily_summary
+)
+from banking_system.benchmarks import (
+    SEED_REFERENCE, analyze, benchmark_accounts, delete_seeded, seed_transactions, timed
+)
+from banking_system.models import Transaction
+
+
+def date_format_months(start_date):
+    """The previous MySQL-only query"""
+    return list(Transaction.objects.filter(
+        created_at__date__gte=start_date,
+        status='completed'
+    ).extra(
+        {'month': "DATE_FORMAT(created_at, '%%Y-%%m')"}
+    ).values('month').annotate(
+        transaction_count=Count('id'),
+        total_amount=Sum('amount'),
+        avg_amount=Avg('amount')
+    ).order_by('month'))
+
+
+def cents(amount):
+    return Decimal(amount or 0).quantize(Decimal('0.01'))
+
+
+class Command(BaseCommand):
+    help = "Compare the monthly summary query: DATE_FORMAT, TruncMonth on Transaction and the daily rollup"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000,
+                            help='Number of seeded transactions over the last year (default: 1000000)')
+        parser.add_argument('--accounts', type=int, default=1000,
+                            help='Number of active accounts to spread rows over (default: 1000)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per query; the best time is reported (default: 3)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded rows (and their rollup rows) for the next run')
+
+    def handle(self, *args, **options):
+        accounts = benchmark_accounts(options['accounts'])
+        if not accounts:
+            raise CommandError('No active accounts found. Run seed_data first.')
+
+        existing = Transaction.objects.filter(reference_number=SEED_REFERENCE).count()
+        missing = options['rows'] - existing
+        if missing > 0:
+            self.stdout.write(f"Seeding {missing:,} transactions over {len(accounts)} accounts...")
+            seed_transactions(missing, accounts, days=365)
+        analyze(Transaction)
+
+        # Today's rollup rows belong to the ledger, so rebuild and compare up to yesterday
+        end = timezone.localdate() - timedelta(days=1)
+        start = end.replace(day=1) - timedelta(days=365)
+        repeat = options['repeat']
+        self.stdout.write(f"Backend: {connection.vendor}")
+
+        try:
+            try:
+                date_format_ms = timed(lambda: date_format_months(start), repeat)
+                self.stdout.write(f"{'DATE_FORMAT (old)':<28}{date_format_ms:>10.1f} ms")
+            except DatabaseError as exc:
+                self.stdout.write(f"{'DATE_FORMAT (old)':<28}{'unsupported':>10}  ({exc})")
+
+            raw = monthly_totals_from_transactions(start, end, status='completed')
+            raw_ms = timed(lambda: monthly_totals_from_transactions(start, end, status='completed'), repeat)
+            self.stdout.write(f"{'TruncMonth on Transaction':<28}{raw_ms:>10.1f} ms")
+
+            backfill_ms = timed(lambda: rebuild_daily_summary(start, end), 1)
+            rollup = monthly_totals_from_summary(start, end, status='completed')
+            rollup_ms = timed(lambda: monthly_totals_from_summary(start, end, status='completed'), repeat)
+            self.stdout.write(
+                f"{'Daily rollup':<28}{rollup_ms:>10.1f} ms  (one-off backfill {backfill_ms / 1000:.1f}s)"
+            )
+
+            mismatched = sum(
+                a['month'] != b['month'] or a['count'] != b['count'] or cents(a['amount']) != cents(b['amount'])
+                for a, b in zip(raw, rollup)
+            ) + abs(len(raw) - len(rollup))
+            self.stdout.write(f"{len(raw)} months to {end}, {mismatched} differ between Transaction and rollup")
+        finally:
+            if not options['keep']:
+                # Seeded rows bypass the ledger, so only the rebuilt days hold them
+                delete_seeded()
+                rebuild_daily_summary(start, end)
+        self.stdout.write(self.style.SUCCESS('Monthly summary benchmark complete.'))
@@ -0,0 +1,50 @@
+import time
+from itertools import cycle, islice
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from banking_system.models import Transaction
+from banking_system.notifications import NotificationBatch
+
+
+class Command(BaseCommand):
+    help = "Benchmark NotificationBatch against the locmem email backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000,
+                            help='Number of transaction notifications to write (default: 100000)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='bulk_create chunk size (default: 1000)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Commit the Notification rows instead of rolling them back')
+
+    def handle(self, *args, **options):
+        sample = list(
+            Transaction.objects.select_related('account__customer').order_by('-id')[:1000]
+        )
+        if not sample:
+            raise CommandError('No transactions found. Run seed_data first.')
+
+        templates = {'deposit': 'deposit', 'withdrawal': 'withdrawal', 'transfer': 'transfer_sent'}
+        connection = get_connection('django.core.mail.backends.locmem.EmailBackend')
+        batch = NotificationBatch(chunk_size=options['chunk_size'], connection=connection)
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            batch.add_many(
+                (txn.account.customer, txn, templates.get(txn.transaction_type, 'deposit'))
+                for txn in islice(cycle(sample), options['count'])
+            )
+            created, sent, failed = batch.flush()
+            elapsed = time.perf_counter() - started
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"{options['count']} notifications: {created} rows, {sent} emails sent, "
+            f"{failed} failed in {elapsed:.2f}s ({options['count'] / elapsed:,.0f} notifications/sec)"
+        )
+        self.stdout.write(self.style.SUCCESS('Notification benchmark complete.'))
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.http import JsonResponse
+from django.utils import timezone
+
+from banking_system.benchmarks import (
+    SEED_REFERENCE, benchmark_accounts, delete_seeded, seed_transactions
+)
+from banking_system.dates import local_date_range
+from banking_system.models import Transaction
+from banking_system.streaming import streaming_json_response
+from banking_system.views import TRANSACTION_EXPORT_FIELDS, transaction_export_rows
+
+MODES = ('jsonresponse', 'streaming')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = "Compare peak memory of a transaction export built as one JsonResponse and as a streamed response"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000,
+                            help='Number of seeded transactions to export (default: 1000000)')
+        parser.add_argument('--accounts', type=int, default=1000,
+                            help='Number of active accounts to spread rows over (default: 1000)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded rows for the next run')
+        # Internal: run one mode in this process and print its measurements
+        parser.add_argument('--measure', choices=MODES, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['measure']:
+            self.measure(options['measure'])
+            return
+
+        accounts = benchmark_accounts(options['accounts'])
+        if not accounts:
+            raise CommandError('No active accounts found. Run seed_data first.')
+
+        existing = Transaction.objects.filter(reference_number=SEED_REFERENCE).count()
+        missing = options['rows'] - existing
+        if missing > 0:
+            self.stdout.write(f"Seeding {missing:,} transactions over {len(accounts)} accounts...")
+            seed_transactions(missing, accounts, progress=self.report_progress)
+
+        try:
+            self.stdout.write(f"{'mode':<14}{'rows':>12}{'body (MB)':>12}{'seconds':>10}{'peak RSS growth (MB)':>24}")
+            # A fresh interpreter per mode, so one mode's peak cannot hide the other's
+            env = dict(os.environ, PYTHONPATH=str(settings.BASE_DIR))
+            for mode in MODES:
+                result = subprocess.run(
+                    [sys.executable, '-m', 'django', 'benchmark_streaming_export', '--measure', mode],
+                    capture_output=True, text=True, env=env, check=True,
+                )
+                measured = json.loads(result.stdout.splitlines()[-1])
+                self.stdout.write(
+                    f"{mode:<14}{measured['rows']:>12,}{measured['bytes'] / 2**20:>12.1f}"
+                    f"{measured['seconds']:>10.1f}{measured['peak_growth_mb']:>24.1f}"
+                )
+        finally:
+            if not options['keep']:
+                delete_seeded()
+
+        self.stdout.write(self.style.SUCCESS('Streaming export benchmark complete.'))
+
+    def report_progress(self, created):
+        if created % 100000 == 0:
+            self.stdout.write(f"  {created:,} rows")
+
+    def measure(self, mode):
+        end_date = timezone.localdate()
+        start_date = end_date - timedelta(days=400)
+        rows = Transaction.objects.filter(**local_date_range('created_at', start_date, end_date)).count()
+        baseline = peak_rss_mb()
+        started = time.perf_counter()
+
+        if mode == 'jsonresponse':
+            response = JsonResponse({
+                'fields': TRANSACTION_EXPORT_FIELDS,
+                'rows': [list(row) for row in transaction_export_rows(start_date, end_date)],
+            })
+            size = len(response.content)
+        else:
+            response = streaming_json_response({
+                'fields': TRANSACTION_EXPORT_FIELDS,
+                'rows': transaction_export_rows(start_date, end_date),
+            })
+            size = sum(len(chunk) for chunk in response.streaming_content)
+
+        self.stdout.write(json.dumps({
+            'rows': rows,
+            'bytes': size,
+            'seconds': time.perf_counter() - started,
+            'peak_growth_mb': peak_rss_mb() - baseline,
+        }))
@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from banking_system.benchmarks import (
+    SEED_REFERENCE, analyze, benchmark_accounts, delete_seeded, seed_transactions, timed
+)
+from banking_system.dates import local_day_start, local_month_start
+from banking_system.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Seed Transaction rows and compare hot query plans and timings with and without the Transaction indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000,
+                            help='Number of seeded transactions to benchmark against (default: 2000000)')
+        parser.add_argument('--accounts', type=int, default=1000,
+                            help='Number of active accounts to spread rows over (default: 1000)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs per query; the best time is reported (default: 5)')
+        parser.add_argument('--plans', action='store_true',
+                            help='Print the full query plan for every query')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded rows for the next run')
+
+    def handle(self, *args, **options):
+        accounts = benchmark_accounts(options['accounts'])
+        if not accounts:
+            raise CommandError('No active accounts found. Run seed_data first.')
+
+        existing = Transaction.objects.filter(reference_number=SEED_REFERENCE).count()
+        missing = options['rows'] - existing
+        if missing > 0:
+            self.stdout.write(f"Seeding {missing:,} transactions over {len(accounts)} accounts...")
+            seed_transactions(missing, accounts, progress=self.report_progress)
+        analyze(Transaction)
+
+        queries = self.hot_queries(accounts[0][0])
+        indexes = Transaction._meta.indexes
+        results = {}
+        try:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(Transaction, index)
+            analyze(Transaction)
+            results['without'] = self.run(queries, 'without indexes', options)
+        finally:
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(Transaction, index)
+            analyze(Transaction)
+
+        results['with'] = self.run(queries, 'with indexes', options)
+
+        self.stdout.write(f"\n{'query':<24}{'without (ms)':>14}{'with (ms)':>12}{'speedup':>10}")
+        for name in queries:
+            before, after = results['without'][name], results['with'][name]
+            self.stdout.write(f"{name:<24}{before:>14.2f}{after:>12.2f}{before / after:>9.1f}x")
+
+        if not options['keep']:
+            delete_seeded()
+        self.stdout.write(self.style.SUCCESS('Transaction index benchmark complete.'))
+
+    def report_progress(self, created):
+        if created % 100000 == 0:
+            self.stdout.write(f"  {created:,} rows")
+
+    def hot_queries(self, account_id):
+        """The access paths the indexes are meant for, as unevaluated querysets"""
+        now = timezone.now()
+        start_of_day = local_day_start(timezone.localdate())
+        start_of_month = local_month_start()
+        return {
+            'customer_recent': Transaction.objects.filter(
+                account_id=account_id).order_by('-created_at')[:10],
+            'daily_limit_sum': Transaction.objects.filter(
+                account_id=account_id, transaction_type='withdrawal', status='completed',
+                created_at__gte=start_of_day).values('account_id').annotate(total=Sum('amount')),
+            'monthly_by_type': Transaction.objects.filter(
+                account_id=account_id, status='completed', created_at__gte=start_of_month,
+            ).values('transaction_type').annotate(total=Sum('amount')),
+            'dashboard_30_days': Transaction.objects.filter(
+                status='completed', created_at__gte=now - timedelta(days=30),
+            ).values('status').annotate(count=Count('id'), total=Sum('amount')),
+            'recent_activity': Transaction.objects.order_by('-created_at')[:100],
+        }
+
+    def run(self, queries, label, options):
+        self.stdout.write(f"\n== {label} ==")
+        timings = {}
+        for name, queryset in queries.items():
+            plan = queryset.explain()
+            timings[name] = timed(lambda: list(queryset.all()), options['repeat'])
+            shown = plan if options['plans'] else ' | '.join(line.strip() for line in plan.splitlines())
+            self.stdout.write(f"{name:<24}{timings[name]:>10.2f} ms  {shown}")
+        return timings
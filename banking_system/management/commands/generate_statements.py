@@ -0,0 +1,107 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from banking_system.models import AccountStatement, BankAccount, SystemConfiguration
+from banking_system.statements import FORMATS, build_statement, pdf_available, statement_accounts
+
+
+def _close_connections():
+    # Each worker opens its own database connection instead of sharing the parent's socket
+    connections.close_all()
+
+
+def _build_chunk(account_ids, from_date, to_date, formats):
+    """Statements for one chunk of accounts, skipping ones already generated"""
+    done = set(AccountStatement.objects.filter(
+        account_id__in=account_ids, from_date=from_date, to_date=to_date,
+    ).values_list('account_id', flat=True))
+    accounts = BankAccount.objects.filter(pk__in=set(account_ids) - done).order_by('pk')
+    return [build_statement(account, from_date, to_date, formats) for account in accounts]
+
+
+def _month(value):
+    try:
+        year, month = (int(part) for part in value.split('-'))
+        return date(year, month, 1)
+    except ValueError:
+        raise CommandError('--month must be YYYY-MM')
+
+
+class Command(BaseCommand):
+    help = "Generate month-end AccountStatements and statement files for every account"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Statement month, YYYY-MM (default: last month)')
+        parser.add_argument('--formats', default='csv',
+                            help=f"Comma-separated file formats from {', '.join(FORMATS)} (default: csv)")
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Worker processes (default: CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Accounts per task (default: 200)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint and start from the first account')
+
+    def handle(self, *args, **options):
+        from_date = (_month(options['month']) if options['month']
+                     else (timezone.localdate().replace(day=1) - timedelta(days=1)).replace(day=1))
+        to_date = (from_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        if to_date >= timezone.localdate():
+            raise CommandError('Statements can only be generated for months that have ended')
+
+        formats = [fmt.strip() for fmt in options['formats'].split(',') if fmt.strip()]
+        if not formats or set(formats) - set(FORMATS):
+            raise CommandError(f"--formats must be taken from {', '.join(FORMATS)}")
+        if 'pdf' in formats and not pdf_available():
+            raise CommandError('PDF statements need reportlab: pip install reportlab')
+
+        checkpoint_key = f'statements.checkpoint.{from_date:%Y-%m}'
+        checkpoint = 0 if options['restart'] else int(
+            SystemConfiguration.objects.filter(key=checkpoint_key).values_list('value', flat=True).first() or 0
+        )
+        account_ids = list(
+            statement_accounts(from_date, to_date).filter(pk__gt=checkpoint)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        chunk = options['chunk_size']
+        chunks = [account_ids[start:start + chunk] for start in range(0, len(account_ids), chunk)]
+        if checkpoint:
+            self.stdout.write(f"Resuming after account {checkpoint}")
+        self.stdout.write(
+            f"Generating {from_date:%Y-%m} statements for {len(account_ids):,} accounts "
+            f"({', '.join(formats)}) with {options['processes']} processes..."
+        )
+
+        created = processed = 0
+        started = time.perf_counter()
+        build = partial(_build_chunk, from_date=from_date, to_date=to_date, formats=formats)
+        _close_connections()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=options['processes'], mp_context=context,
+                                 initializer=_close_connections) as pool:
+            # map() yields in submission order, so the checkpoint only ever
+            # moves past chunks whose statements are stored
+            for ids, statements in zip(chunks, pool.map(build, chunks)):
+                AccountStatement.objects.bulk_create(statements, ignore_conflicts=True)
+                SystemConfiguration.objects.update_or_create(key=checkpoint_key, defaults=dict(
+                    value=str(ids[-1]), config_type='general', is_active=True,
+                    description=f'Last account with a {from_date:%Y-%m} statement',
+                ))
+                created += len(statements)
+                processed += len(ids)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"  {processed:,}/{len(account_ids):,} accounts ({processed / elapsed:,.0f}/s)"
+                )
+
+        elapsed = time.perf_counter() - started
+        rate = len(account_ids) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {created:,} statements in {elapsed:.1f}s ({rate:,.0f} accounts/sec)."
+        ))
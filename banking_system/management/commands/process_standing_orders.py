@@ -0,0 +1,62 @@
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from banking_system.standing_orders import due_orders, execute_orders, partition_by_account
+
+
+def _close_connections():
+    # Each worker opens its own database connection instead of sharing the parent's socket
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Execute due standing orders (run hourly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Execute orders due up to this local date, YYYY-MM-DD (default: today)')
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Worker processes (default: CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Orders per task; one source account never spans two tasks (default: 100)')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['date']:
+            today = parse_date(options['date'])
+            if today is None:
+                raise CommandError('--date must be YYYY-MM-DD')
+            if today > timezone.localdate():
+                raise CommandError('Orders cannot be executed ahead of their date')
+
+        chunks = partition_by_account(
+            due_orders(today).values_list('pk', 'account_id'), options['chunk_size'],
+        )
+        count = sum(len(chunk) for chunk in chunks)
+        self.stdout.write(
+            f"Executing {count:,} due standing orders in {len(chunks):,} chunks "
+            f"with {options['processes']} processes..."
+        )
+
+        results = Counter()
+        started = time.perf_counter()
+        _close_connections()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=options['processes'], mp_context=context,
+                                 initializer=_close_connections) as pool:
+            for chunk_results in pool.map(partial(execute_orders, today=today), chunks):
+                results.update(chunk_results)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Executed {results['executed']:,}, failed {results['failed']:,}, "
+            f"expired {results['expired']:,}, skipped {results['skipped']:,} "
+            f"in {elapsed:.1f}s."
+        ))
@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from banking_system.dates import local_day_start, local_month_start
+from banking_system.models import Transaction, UserTransactionLimit
+
+
+class Command(BaseCommand):
+    help = "Recompute UserTransactionLimit usage counters from completed Transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Limit rows locked and updated per transaction (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report counters that are out of step without saving')
+
+    def handle(self, *args, **options):
+        fields = ['current_daily_withdrawals', 'current_daily_transfers',
+                  'current_monthly_transfers', 'last_reset_date']
+        limit_ids = list(UserTransactionLimit.objects.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+
+        for start in range(0, len(limit_ids), batch_size):
+            with transaction.atomic():
+                limits = UserTransactionLimit.objects.filter(pk__in=limit_ids[start:start + batch_size])
+                if not options['dry_run']:
+                    # Postings lock the same rows (in pk order here, so no deadlock)
+                    # before writing their Transaction, so the sums read below
+                    # cannot miss a posting that commits before the update.
+                    limits = limits.select_for_update()
+                self.reconcile_batch(list(limits.only('id', 'user_id', *fields).order_by('pk')),
+                                     fields, options['dry_run'])
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled transaction limits for {len(limit_ids)} users."))
+
+    def reconcile_batch(self, batch, fields, dry_run):
+        today = timezone.localdate()
+        day_start = local_day_start(today)
+        month_start = local_month_start(today)
+
+        # One grouped pass over this month's withdrawals and transfers of the batch's users
+        usage = {
+            row['account__customer_id']: row
+            for row in Transaction.objects.filter(
+                status='completed',
+                transaction_type__in=['withdrawal', 'transfer'],
+                created_at__gte=month_start,
+                account__customer_id__in=[limits.user_id for limits in batch],
+            ).values('account__customer_id').annotate(
+                daily_withdrawals=Sum('amount', filter=Q(
+                    transaction_type='withdrawal', created_at__gte=day_start)),
+                daily_transfers=Sum('amount', filter=Q(
+                    transaction_type='transfer', created_at__gte=day_start)),
+                monthly_transfers=Sum('amount', filter=Q(transaction_type='transfer')),
+            )
+        }
+
+        zero = Decimal('0.00')
+        changed = []
+        for limits in batch:
+            row = usage.get(limits.user_id, {})
+            expected = (
+                row.get('daily_withdrawals') or zero,
+                row.get('daily_transfers') or zero,
+                row.get('monthly_transfers') or zero,
+                today,
+            )
+            current = tuple(getattr(limits, field) for field in fields)
+            if current == expected:
+                continue
+
+            (limits.current_daily_withdrawals, limits.current_daily_transfers,
+             limits.current_monthly_transfers, limits.last_reset_date) = expected
+            changed.append(limits)
+            if dry_run:
+                self.stdout.write(f"User {limits.user_id}: {current[:3]} -> {expected[:3]}")
+
+        if changed and not dry_run:
+            UserTransactionLimit.objects.bulk_update(changed, fields)
@@ -0,0 +1,32 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from banking_system.models import AgentTransactionLimit, BankAgent
+
+
+class Command(BaseCommand):
+    help = "Reset agent daily (and, at month start, monthly) float totals. Run nightly."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--monthly', action='store_true',
+                            help='Also reset monthly totals (done automatically on the 1st)')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        zero = Decimal('0.00')
+
+        totals = {'current_daily_total': zero}
+        if options['monthly'] or today.day == 1:
+            totals['current_monthly_total'] = zero
+
+        # One UPDATE per table instead of a save() per agent
+        with transaction.atomic():
+            agents = BankAgent.objects.update(**totals)
+            limits = AgentTransactionLimit.objects.update(last_reset_date=today, **totals)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reset {', '.join(totals)} for {agents} agents and {limits} agent limit records."
+        ))
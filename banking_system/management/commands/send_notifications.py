@@ -0,0 +1,44 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from banking_system.notifications import send_pending_emails
+
+
+class Command(BaseCommand):
+    help = "Drain the notification outbox: send pending email notifications in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Notifications claimed per batch (default: 100)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new notifications instead of exiting when empty')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between polls with --loop (default: 5)')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+
+        # One mail server connection is reused for every batch
+        connection = get_connection(fail_silently=True)
+        connection.open()
+        try:
+            while True:
+                sent, failed = send_pending_emails(options['batch_size'], connection)
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent}, failed {failed}")
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Notification outbox drained: {total_sent} sent, {total_failed} failed."
+        ))
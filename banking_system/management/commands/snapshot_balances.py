@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from banking_system.balances import snapshot_balances
+
+
+class Command(BaseCommand):
+    help = "Write end-of-day balance snapshots for every account (run nightly, after midnight)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Local date to snapshot, YYYY-MM-DD (default: yesterday)')
+        parser.add_argument('--days', type=int, default=1,
+                            help='Number of days ending at --date to snapshot, for backfills (default: 1)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Accounts per batch (default: 1000)')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            day = parse_date(options['date'])
+            if day is None:
+                raise CommandError('--date must be YYYY-MM-DD')
+        else:
+            day = timezone.localdate() - timedelta(days=1)
+        if day >= timezone.localdate():
+            raise CommandError('Only days that have ended can be snapshotted')
+
+        for offset in range(options['days']):
+            snapshot_day = day - timedelta(days=offset)
+            written = snapshot_balances(snapshot_day, options['batch_size'])
+            self.stdout.write(f"{snapshot_day}: {written:,} account balances")
+
+        self.stdout.write(self.style.SUCCESS('Balance snapshots complete.'))
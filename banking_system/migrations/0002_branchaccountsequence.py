@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchAccountSequence',
+            fields=[
+                ('branch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='account_sequence', serialize=False, to='banking_system.branch')),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
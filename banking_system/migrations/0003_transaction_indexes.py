@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0002_branchaccountsequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'transaction_type', 'status', 'created_at'], name='txn_acct_type_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', '-created_at'], name='txn_acct_created'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'created_at', 'amount'], name='txn_status_created_amount'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-created_at'], name='txn_created'),
+        ),
+    ]
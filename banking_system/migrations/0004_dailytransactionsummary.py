@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:07
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0003_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTransactionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('channel', models.CharField(choices=[('atm', 'ATM'), ('mobile', 'Mobile Banking'), ('internet', 'Internet Banking'), ('ussd', 'USSD'), ('agent', 'Agent Banking'), ('branch', 'Branch'), ('pos', 'Point of Sale')], max_length=10)),
+                ('transaction_type', models.CharField(choices=[('deposit', 'Deposit'), ('withdrawal', 'Withdrawal'), ('transfer', 'Transfer'), ('bill_payment', 'Bill Payment'), ('airtime_purchase', 'Airtime Purchase'), ('loan_disbursement', 'Loan Disbursement'), ('loan_repayment', 'Loan Repayment'), ('fee_charge', 'Fee Charge'), ('interest_credit', 'Interest Credit'), ('reversal', 'Reversal')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled'), ('reversed', 'Reversed')], max_length=15)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('min_amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('max_amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to='banking_system.branch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'date'], name='txn_summary_status_date')],
+                'unique_together': {('date', 'branch', 'channel', 'transaction_type', 'status')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+def populate_latest_rates(apps, schema_editor):
+    ForexRate = apps.get_model('banking_system', 'ForexRate')
+    LatestForexRate = apps.get_model('banking_system', 'LatestForexRate')
+    latest = {}
+    for rate in ForexRate.objects.order_by('effective_date').iterator():
+        latest[rate.base_currency, rate.target_currency] = rate
+    LatestForexRate.objects.bulk_create([
+        LatestForexRate(
+            base_currency=rate.base_currency, target_currency=rate.target_currency,
+            buy_rate=rate.buy_rate, sell_rate=rate.sell_rate, mid_rate=rate.mid_rate,
+            effective_date=rate.effective_date,
+        )
+        for rate in latest.values()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0004_dailytransactionsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestForexRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_currency', models.CharField(max_length=3)),
+                ('target_currency', models.CharField(max_length=3)),
+                ('buy_rate', models.DecimalField(decimal_places=6, max_digits=10)),
+                ('sell_rate', models.DecimalField(decimal_places=6, max_digits=10)),
+                ('mid_rate', models.DecimalField(decimal_places=6, max_digits=10)),
+                ('effective_date', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('base_currency', 'target_currency')},
+            },
+        ),
+        migrations.RunPython(populate_latest_rates, migrations.RunPython.noop),
+    ]
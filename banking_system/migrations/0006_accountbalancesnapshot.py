@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0005_latestforexrate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='banking_system.bankaccount')),
+            ],
+            options={
+                'unique_together': {('account', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0006_accountbalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='interestcalculation',
+            unique_together={('account', 'calculation_date')},
+        ),
+        migrations.AddIndex(
+            model_name='interestcalculation',
+            index=models.Index(fields=['is_credited', 'calculation_date'], name='interest_credited_date'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0007_interest_calculation_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='standingorder',
+            index=models.Index(fields=['status', 'next_execution_date'], name='standing_order_due'),
+        ),
+    ]
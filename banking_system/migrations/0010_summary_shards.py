@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0009_notification_claims'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='dailytransactionsummary',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='dailytransactionsummary',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailytransactionsummary',
+            unique_together={('date', 'branch', 'channel', 'transaction_type', 'status', 'shard')},
+        ),
+    ]
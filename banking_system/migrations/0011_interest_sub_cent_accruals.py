@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0010_summary_shards'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='interestcalculation',
+            name='interest_earned',
+            field=models.DecimalField(decimal_places=6, max_digits=19),
+        ),
+    ]
@@ -8,6 +8,8 @@ from datetime import datetime, timedelta
 import secrets
 import string
 
+from .ids import generate_id
+
 # Custom User Model
 class User(AbstractUser):
     USER_TYPES = (
@@ -169,14 +171,24 @@ class BankAccount(models.Model):
         super().save(*args, **kwargs)
 
     def generate_account_number(self):
-        # Generate account number based on branch code and sequential number
-        import random
-        return f"{self.branch.branch_code}{random.randint(1000000, 9999999)}"
+        # Branch code + per-branch sequence + check digit, see account_numbers.py
+        from .account_numbers import allocate_account_numbers
+        return allocate_account_numbers(self.branch_id, 1)[0]
 
     def __str__(self):
         return f"{self.account_number} - {self.customer.username}"
 
 
+# Per-branch account number sequence (allocated in blocks, see account_numbers.py)
+class BranchAccountSequence(models.Model):
+    branch = models.OneToOneField(Branch, on_delete=models.CASCADE, primary_key=True, related_name='account_sequence')
+    next_value = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.branch.branch_code} - next {self.next_value}"
+
+
 # ATM Machine Model
 class ATMMachine(models.Model):
     ATM_STATUS = (
@@ -279,31 +291,83 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Per-account limit sums and monthly summaries by type/status/date
+            models.Index(fields=['account', 'transaction_type', 'status', 'created_at'],
+                         name='txn_acct_type_status_created'),
+            # Customer recent transactions / statements
+            models.Index(fields=['account', '-created_at'], name='txn_acct_created'),
+            # Dashboard totals and trends; amount is included so SUMs read only the index
+            models.Index(fields=['status', 'created_at', 'amount'], name='txn_status_created_amount'),
+            # Recent activity lists and the admin changelist
+            models.Index(fields=['-created_at'], name='txn_created'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.transaction_id:
             self.transaction_id = self.generate_transaction_id()
         super().save(*args, **kwargs)
 
     def generate_transaction_id(self):
-        return f"TXN{datetime.now().strftime('%Y%m%d%H%M%S')}{secrets.randbelow(1000):03d}"
+        return generate_id('TXN')
 
     def __str__(self):
         return f"{self.transaction_id} - {self.get_transaction_type_display()}: KES {self.amount}"
     
 
+# Daily transaction rollup for dashboards and charts (see analytics.py)
+class DailyTransactionSummary(models.Model):
+    date = models.DateField()
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='daily_summaries')
+    channel = models.CharField(max_length=10, choices=Transaction.CHANNELS)
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    status = models.CharField(max_length=15, choices=Transaction.TRANSACTION_STATUS)
+    # Postings spread over SUMMARY_SHARDS rows per bucket by account (see analytics.py)
+    shard = models.PositiveSmallIntegerField(default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    min_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    max_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['date', 'branch', 'channel', 'transaction_type', 'status', 'shard']
+        indexes = [
+            models.Index(fields=['status', 'date'], name='txn_summary_status_date'),
+        ]
+
+    @property
+    def average_amount(self):
+        return self.total_amount / self.transaction_count if self.transaction_count else Decimal('0.00')
+
+    def __str__(self):
+        return (f"{self.date} {self.branch_id} {self.channel}/{self.transaction_type}/{self.status}"
+                f"[{self.shard}]: {self.transaction_count}")
+
+
 # Interest Calculations
 class InterestCalculation(models.Model):
     account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name='interest_calculations')
     calculation_date = models.DateField()
     balance = models.DecimalField(max_digits=15, decimal_places=2)
     interest_rate = models.DecimalField(max_digits=5, decimal_places=4)
-    interest_earned = models.DecimalField(max_digits=15, decimal_places=2)
+    # Kept to a millionth of a shilling; rounded to the cent when credited
+    interest_earned = models.DecimalField(max_digits=19, decimal_places=6)
     days_calculated = models.IntegerField()
     is_credited = models.BooleanField(default=False)
     transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # One accrual per account per day (see interest.py)
+        unique_together = ['account', 'calculation_date']
+        indexes = [
+            # Uncredited accruals up to a date, for the monthly credit run
+            models.Index(fields=['is_credited', 'calculation_date'], name='interest_credited_date'),
+        ]
+
     def __str__(self):
         return f"{self.account.account_number} - {self.calculation_date}: KES {self.interest_earned}"
 
@@ -328,6 +392,20 @@ class AccountStatement(models.Model):
     def __str__(self):
         return f"{self.account.account_number} - {self.from_date} to {self.to_date}"
 
+
+# End-of-day balance per account, written nightly (see balances.py)
+class AccountBalanceSnapshot(models.Model):
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name='balance_snapshots')
+    date = models.DateField()
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['account', 'date']
+
+    def __str__(self):
+        return f"{self.account_id} {self.date}: KES {self.balance}"
+
 # Forex Rates (for multi-currency support)
 class ForexRate(models.Model):
     base_currency = models.CharField(max_length=3, default='KES')  # Kenyan Shilling
@@ -344,6 +422,23 @@ class ForexRate(models.Model):
     def __str__(self):
         return f"{self.base_currency}/{self.target_currency} - {self.mid_rate}"
 
+
+# Current rate per currency pair, kept up to date from ForexRate (see forex.py)
+class LatestForexRate(models.Model):
+    base_currency = models.CharField(max_length=3)
+    target_currency = models.CharField(max_length=3)
+    buy_rate = models.DecimalField(max_digits=10, decimal_places=6)
+    sell_rate = models.DecimalField(max_digits=10, decimal_places=6)
+    mid_rate = models.DecimalField(max_digits=10, decimal_places=6)
+    effective_date = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['base_currency', 'target_currency']
+
+    def __str__(self):
+        return f"{self.base_currency}/{self.target_currency} - {self.mid_rate} ({self.effective_date})"
+
 # Notifications
 class Notification(models.Model):
     NOTIFICATION_TYPES = (
@@ -358,6 +453,7 @@ class Notification(models.Model):
     
     STATUS_CHOICES = (
         ('pending', 'Pending'),
+        ('sending', 'Sending'),
         ('sent', 'Sent'),
         ('failed', 'Failed'),
         ('read', 'Read'),
@@ -382,6 +478,8 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, blank=True)
     read_at = models.DateTimeField(null=True, blank=True)
+    # When an outbox worker took the row for sending (see notifications.py)
+    claimed_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.title}"
@@ -550,7 +648,7 @@ class SupportTicket(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.ticket_number:
-            self.ticket_number = f"TKT{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            self.ticket_number = generate_id('TKT')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -593,6 +691,22 @@ class UserTransactionLimit(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def roll_over(self, today):
+        """
+        Zero the usage counters (in memory) if they were last reset on an
+        earlier day / month. Returns the names of the fields that were reset.
+        """
+        if self.last_reset_date == today:
+            return []
+
+        reset = ['current_daily_transfers', 'current_daily_withdrawals']
+        if (self.last_reset_date.year, self.last_reset_date.month) != (today.year, today.month):
+            reset.append('current_monthly_transfers')
+        for field in reset:
+            setattr(self, field, Decimal('0.00'))
+        self.last_reset_date = today
+        return reset
+
     def __str__(self):
         return f"Limits for {self.user.username}"
 
@@ -634,9 +748,15 @@ class StandingOrder(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Due orders for the scheduler (see standing_orders.py)
+            models.Index(fields=['status', 'next_execution_date'], name='standing_order_due'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.order_id:
-            self.order_id = f"SO{datetime.now().strftime('%Y%m%d%H%M%S')}{secrets.randbelow(100):02d}"
+            self.order_id = generate_id('SO')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -755,7 +875,7 @@ class LoanApplication(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.application_id:
-            self.application_id = f"LA{datetime.now().strftime('%Y%m%d%H%M%S')}{secrets.randbelow(100):02d}"
+            self.application_id = generate_id('LA')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -800,7 +920,7 @@ class Loan(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.loan_number:
-            self.loan_number = f"LN{datetime.now().strftime('%Y%m%d%H%M%S')}{secrets.randbelow(100):02d}"
+            self.loan_number = generate_id('LN')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -831,7 +951,7 @@ class LoanPayment(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.payment_id:
-            self.payment_id = f"LP{datetime.now().strftime('%Y%m%d%H%M%S')}{secrets.randbelow(100):02d}"
+            self.payment_id = generate_id('LP')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -888,7 +1008,7 @@ class BillPayment(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.payment_id:
-            self.payment_id = f"BP{datetime.now().strftime('%Y%m%d%H%M%S')}{secrets.randbelow(100):02d}"
+            self.payment_id = generate_id('BP')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -939,4 +1059,20 @@ class AgentTransactionLimit(models.Model):
     current_monthly_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
     last_reset_date = models.DateField(auto_now_add=True)
     
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def roll_over(self, today):
+        """
+        Zero the running totals (in memory) if they were last reset on an
+        earlier day / month. Returns the names of the fields that were reset.
+        """
+        if self.last_reset_date == today:
+            return []
+
+        reset = ['current_daily_total']
+        if (self.last_reset_date.year, self.last_reset_date.month) != (today.year, today.month):
+            reset.append('current_monthly_total')
+        for field in reset:
+            setattr(self, field, Decimal('0.00'))
+        self.last_reset_date = today
+        return reset
@@ -0,0 +1,312 @@
+# notifications.py
+"""
+Transaction notification outbox.
+
+Postings never talk to the mail server. They write Notification rows in the
+same database transaction as the posting: the in-app notification is
+delivered as soon as the posting commits, while the email notification is
+left ``pending``. The ``send_notifications`` management command drains
+pending emails in batches over a single SMTP connection: each batch is
+claimed (marked ``sending``) in one short transaction, sent with no
+transaction open, and marked ``sent`` or ``failed`` in a second one.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# A worker that has not finished sending its claimed batch after this long
+# is presumed dead and its rows go back to the outbox
+CLAIM_TIMEOUT_SECONDS = getattr(settings, 'NOTIFICATION_CLAIM_TIMEOUT_SECONDS', 600)
+
+TRANSACTION_TEMPLATES = {
+    'deposit': {
+        'title': 'Money Received',
+        'message': 'You have received KES {amount:,.2f} in your account {account_number}. '
+                   'Your new balance is KES {balance_after:,.2f}.',
+        'email_subject': 'Equity Bank - Money Received',
+    },
+    'withdrawal': {
+        'title': 'Money Withdrawn',
+        'message': 'You have withdrawn KES {amount:,.2f} from your account {account_number}. '
+                   'Fee: KES {fee:,.2f}. Your new balance is KES {balance_after:,.2f}.',
+        'email_subject': 'Equity Bank - Withdrawal Confirmation',
+    },
+    'transfer_sent': {
+        'title': 'Money Sent',
+        'message': 'You have sent KES {amount:,.2f} to {beneficiary_name}. '
+                   'Fee: KES {fee:,.2f}. Your new balance is KES {balance_after:,.2f}.',
+        'email_subject': 'Equity Bank - Transfer Sent',
+    },
+    'transfer_received': {
+        'title': 'Money Received',
+        'message': 'You have received KES {amount:,.2f} from {sender_name}. '
+                   'Your new balance is KES {balance_after:,.2f}.',
+        'email_subject': 'Equity Bank - Money Received',
+    },
+}
+
+DEFAULT_TEMPLATE = {
+    'title': 'Transaction Alert',
+    'message': 'Transaction of KES {amount:,.2f} processed.',
+    'email_subject': 'Equity Bank - Transaction Alert',
+}
+
+EMAIL_TEMPLATE = """
+Dear {customer_name},
+
+{message}
+
+Transaction Details:
+- Transaction ID: {transaction_id}
+- Date: {date}
+- Channel: {channel}
+
+For any inquiries, please contact our customer service.
+
+Best regards,
+Equity Bank Kenya
+            """
+
+
+def _render_message(template, transaction):
+    return template['message'].format(
+        amount=transaction.amount,
+        fee=transaction.fee,
+        balance_after=transaction.balance_after,
+        account_number=transaction.account.account_number,
+        beneficiary_name=transaction.beneficiary_name,
+        sender_name=transaction.description.replace('Transfer from ', ''),
+    )
+
+
+def _render_email(user, transaction, message):
+    return EMAIL_TEMPLATE.format(
+        customer_name=user.get_full_name() or user.username,
+        message=message,
+        transaction_id=transaction.transaction_id,
+        date=transaction.created_at.strftime('%d/%m/%Y %H:%M:%S'),
+        channel=transaction.get_channel_display(),
+    )
+
+
+def build_transaction_notifications(user, transaction, notification_type, now=None):
+    """Return the unsaved in-app (and, if the user has an email, email) notifications"""
+    template = TRANSACTION_TEMPLATES.get(notification_type, DEFAULT_TEMPLATE)
+    message = _render_message(template, transaction)
+
+    notifications = [Notification(
+        user=user,
+        notification_type='transaction',
+        channel='in_app',
+        title=template['title'],
+        message=message,
+        status='sent',
+        related_transaction=transaction,
+        sent_at=now or timezone.now(),
+    )]
+
+    if user.email:
+        notifications.append(Notification(
+            user=user,
+            notification_type='transaction',
+            channel='email',
+            title=template['email_subject'],
+            message=_render_email(user, transaction, message),
+            status='pending',
+            related_transaction=transaction,
+        ))
+    return notifications
+
+
+def queue_transaction_notification(user, transaction, notification_type):
+    """Write the notifications for a posting; call inside the posting's transaction"""
+    return Notification.objects.bulk_create(
+        build_transaction_notifications(user, transaction, notification_type)
+    )
+
+
+def send_email_notifications(notifications, connection=None):
+    """
+    Send email notifications over one connection and record the outcome on
+    each row with two bulk UPDATEs. Returns (sent, failed) counts.
+    Call outside any database transaction: the mail server round trip must
+    not hold database locks.
+    """
+    connection = connection or get_connection(fail_silently=True)
+    sent_ids, failed_ids = [], []
+
+    # open() returns True only when it opened a new connection; a caller's
+    # already-open connection is left open for the next batch
+    opened = connection.open()
+    try:
+        for notification in notifications:
+            if not notification.user.email:
+                failed_ids.append(notification.pk)
+                continue
+            message = EmailMessage(
+                subject=notification.title,
+                body=notification.message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[notification.user.email],
+            )
+            if connection.send_messages([message]):
+                sent_ids.append(notification.pk)
+            else:
+                failed_ids.append(notification.pk)
+    finally:
+        if opened:
+            connection.close()
+
+    with db_transaction.atomic():
+        if sent_ids:
+            Notification.objects.filter(pk__in=sent_ids).update(status='sent', sent_at=timezone.now())
+        if failed_ids:
+            Notification.objects.filter(pk__in=failed_ids).update(status='failed')
+    if failed_ids:
+        logger.warning("Failed to send %d email notifications", len(failed_ids))
+    return len(sent_ids), len(failed_ids)
+
+
+def claim_pending_emails(batch_size=100):
+    """
+    Mark up to ``batch_size`` pending email notifications as ``sending`` and
+    return them. The claim is one short transaction; the UPDATE only takes
+    rows that are still claimable, so two workers never claim the same row
+    even on backends without SKIP LOCKED. Rows left ``sending`` by a worker
+    that died are claimable again after CLAIM_TIMEOUT_SECONDS.
+    """
+    now = timezone.now()
+    claimable = Notification.objects.filter(channel='email').filter(
+        Q(status='pending') | Q(status='sending', claimed_at__lt=now - timedelta(seconds=CLAIM_TIMEOUT_SECONDS))
+    )
+    with db_transaction.atomic():
+        ids = list(
+            claimable.select_for_update(skip_locked=True)
+            .order_by('id').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        claimable.filter(pk__in=ids).update(status='sending', claimed_at=now)
+    return list(
+        Notification.objects.filter(pk__in=ids, status='sending', claimed_at=now)
+        .select_related('user').order_by('id')
+    )
+
+
+def send_pending_emails(batch_size=100, connection=None):
+    """
+    Claim up to ``batch_size`` pending email notifications and send them
+    outside any transaction, so several workers can drain the outbox side by
+    side without holding locks during the mail server round trip.
+    Returns (sent, failed) counts; (0, 0) when the outbox is empty.
+    """
+    batch = claim_pending_emails(batch_size)
+    if not batch:
+        return 0, 0
+    return send_email_notifications(batch, connection)
+
+
+class NotificationBatch:
+    """
+    Bulk notification writer for month-end runs (interest credits, statements).
+
+        batch = NotificationBatch()
+        for txn in transactions:  # select_related('account__customer')
+            batch.add(txn.account.customer, txn, 'deposit')
+        created, sent, failed = batch.flush()
+
+    Rows are inserted with ``bulk_create`` in chunks. Email rows are written
+    as ``pending`` first and then sent through one mail connection, so a
+    crash part way through leaves the rest in the outbox for
+    ``send_notifications`` to pick up. Messages queued with ``add_message``
+    are rendered once and shared by all of their recipients.
+    """
+
+    def __init__(self, chunk_size=1000, send_email=True, connection=None):
+        self.chunk_size = chunk_size
+        self.send_email = send_email
+        self.connection = connection
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, user, transaction, template):
+        """Queue a transaction notification using one of TRANSACTION_TEMPLATES"""
+        self._items.append((user, transaction, template))
+
+    def add_many(self, items):
+        """Queue an iterable of (user, transaction, template) tuples"""
+        self._items.extend(items)
+
+    def add_message(self, users, title, message, notification_type='system', email_subject=None):
+        """Queue one pre-rendered message (e.g. 'your statement is ready') for many users"""
+        self._items.extend((user, None, (notification_type, title, message, email_subject))
+                           for user in users)
+
+    def _build(self, items, now):
+        rows = []
+        for user, transaction, template in items:
+            if transaction is not None:
+                rows.extend(build_transaction_notifications(user, transaction, template, now))
+                continue
+
+            notification_type, title, message, email_subject = template
+            rows.append(Notification(
+                user=user, notification_type=notification_type, channel='in_app',
+                title=title, message=message, status='sent', sent_at=now,
+            ))
+            if email_subject and user.email:
+                rows.append(Notification(
+                    user=user, notification_type=notification_type, channel='email',
+                    title=email_subject, message=message, status='pending',
+                ))
+        return rows
+
+    def flush(self):
+        """Write and send everything queued so far. Returns (created, sent, failed)."""
+        created = sent = failed = 0
+        items, self._items = self._items, []
+        if not items:
+            return created, sent, failed
+
+        connection = None
+        if self.send_email:
+            connection = self.connection or get_connection(fail_silently=True)
+            opened = connection.open()
+
+        try:
+            now = timezone.now()
+            # Emails this batch sends itself are written already claimed, so
+            # an outbox worker running meanwhile cannot send them a second time
+            claim = connection is not None and db_connection.features.can_return_rows_from_bulk_insert
+            for start in range(0, len(items), self.chunk_size):
+                rows = self._build(items[start:start + self.chunk_size], now)
+                if claim:
+                    for row in rows:
+                        if row.channel == 'email':
+                            row.status, row.claimed_at = 'sending', now
+                rows = Notification.objects.bulk_create(rows, batch_size=self.chunk_size)
+                created += len(rows)
+
+                # Backends that cannot return primary keys from bulk_create
+                # leave their emails to the send_notifications outbox worker
+                emails = [row for row in rows if row.channel == 'email' and row.pk is not None]
+                if connection is not None and emails:
+                    chunk_sent, chunk_failed = send_email_notifications(emails, connection)
+                    sent += chunk_sent
+                    failed += chunk_failed
+        finally:
+            if connection is not None and opened:
+                connection.close()
+
+        return created, sent, failed
@@ -0,0 +1,29 @@
+# signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import fees, forex
+from .models import FeeStructure, ForexRate
+
+
+@receiver([post_save, post_delete], sender=FeeStructure)
+def invalidate_fee_schedule(sender, **kwargs):
+    """Fee tables changed: make every process reload its cached fee schedule"""
+    fees.invalidate()
+
+
+@receiver(post_save, sender=ForexRate)
+def update_latest_forex_rate(sender, instance, created, **kwargs):
+    """Keep LatestForexRate pointing at each pair's newest rate and drop cached rate history"""
+    forex.invalidate_history()
+    if created:
+        forex.record_rate(instance)
+    else:
+        # An edit may have moved the rate back in time: recompute the pair
+        forex.refresh_latest_rate(instance.base_currency, instance.target_currency)
+
+
+@receiver(post_delete, sender=ForexRate)
+def remove_latest_forex_rate(sender, instance, **kwargs):
+    forex.invalidate_history()
+    forex.refresh_latest_rate(instance.base_currency, instance.target_currency)
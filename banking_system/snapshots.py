@@ -0,0 +1,88 @@
+# snapshots.py
+"""
+Dashboard snapshot cache with stale-while-revalidate.
+
+    data = get_snapshot('transaction-data', {'days': 30}, lambda: build(30))
+
+A snapshot younger than FRESH_SECONDS is returned as is. An older one is
+still returned immediately, and one background thread rebuilds it. Only one
+rebuild per snapshot runs at a time (a cache.add() lock), so a burst of
+dashboard loads costs one recomputation. When there is no snapshot at all
+the first caller builds it and the rest wait briefly for that result.
+
+Snapshots live in the default cache, so with a shared cache (Redis,
+Memcached) all workers share both the data and the lock. Values must be
+picklable; querysets are evaluated when stored.
+"""
+import logging
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+FRESH_SECONDS = getattr(settings, 'DASHBOARD_SNAPSHOT_FRESH_SECONDS', 30)
+# Snapshots older than this are not served at all, even while a rebuild runs
+MAX_AGE_SECONDS = getattr(settings, 'DASHBOARD_SNAPSHOT_MAX_AGE_SECONDS', 600)
+LOCK_SECONDS = 60
+COLD_WAIT_SECONDS = 5
+
+
+def _key(name, params):
+    return f"snapshot:{name}:{urlencode(sorted((params or {}).items()))}"
+
+
+def _store(key, compute):
+    value = compute()
+    cache.set(key, (time.time(), value), MAX_AGE_SECONDS)
+    return value
+
+
+def _rebuild_in_background(key, lock_key, compute):
+    def run():
+        try:
+            _store(key, compute)
+        except Exception:
+            logger.exception("Rebuilding dashboard snapshot %s failed", key)
+        finally:
+            cache.delete(lock_key)
+            connection.close()
+
+    threading.Thread(target=run, name=f'snapshot {key}', daemon=True).start()
+
+
+def get_snapshot(name, params, compute):
+    """Return the cached result of ``compute()`` for ``name``/``params``"""
+    key = _key(name, params)
+    lock_key = f"{key}:lock"
+
+    entry = cache.get(key)
+    if entry is not None:
+        built_at, value = entry
+        if time.time() - built_at > FRESH_SECONDS and cache.add(lock_key, 1, LOCK_SECONDS):
+            _rebuild_in_background(key, lock_key, compute)
+        return value
+
+    if cache.add(lock_key, 1, LOCK_SECONDS):
+        try:
+            return _store(key, compute)
+        finally:
+            cache.delete(lock_key)
+
+    # Someone else is building it: wait for their result rather than piling on
+    deadline = time.monotonic() + COLD_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+    return compute()
+
+
+def invalidate_snapshot(name, params=None):
+    """Drop a snapshot so the next request rebuilds it"""
+    cache.delete(_key(name, params))
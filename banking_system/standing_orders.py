@@ -0,0 +1,155 @@
+# standing_orders.py
+"""
+Standing order execution.
+
+The process_standing_orders command runs this hourly. due_orders(today) reads
+the active orders whose next_execution_date has come through the
+(status, next_execution_date) index. partition_by_account() splits them into
+chunks that never share a source account, so parallel workers never queue
+on the same account row lock, and each worker calls execute_orders() on its
+chunks.
+
+Each execution is an ordinary ledger transfer carrying the order's
+reference. Like every other transfer it is charged against the customer's
+transfer limits, so reconcile_transaction_limits, which counts every
+completed transfer, agrees with the live counters. The order's counters and
+next_execution_date are updated in the transfer's own database transaction,
+conditional on the date the run started from, so two overlapping runs can
+never pay the same occurrence twice. A rejected transfer (insufficient
+funds, transfer limit reached, closed account, unknown beneficiary...) adds
+one to failed_count and moves on to the next occurrence; it never stops the
+rest of the batch. Orders that missed several occurrences (e.g. the
+scheduler was down) are caught up one occurrence at a time. Orders past
+their end_date expire.
+"""
+import calendar
+import logging
+from collections import Counter
+from datetime import date, timedelta
+
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from .fees import calculate_fees
+from .ledger import PostingError, post_transfer
+from .models import BankAccount, StandingOrder, Transaction
+
+logger = logging.getLogger(__name__)
+
+FREQUENCY_DAYS = {'daily': 1, 'weekly': 7}
+FREQUENCY_MONTHS = {'monthly': 1, 'quarterly': 3, 'annually': 12}
+TRANSFER_FEE_TYPE = 'mobile_transfer_own'
+CHANNEL = 'internet'
+REFERENCE_LENGTH = Transaction._meta.get_field('reference_number').max_length
+
+
+class AlreadyExecuted(Exception):
+    """Another run executed this occurrence first; the transfer is rolled back"""
+
+
+def next_execution_date(order, after):
+    """
+    The execution date following ``after``. Monthly, quarterly and annual
+    orders keep the start date's day of the month, or the month's last day
+    when it is shorter.
+    """
+    if order.frequency in FREQUENCY_DAYS:
+        return after + timedelta(days=FREQUENCY_DAYS[order.frequency])
+    months = after.month - 1 + FREQUENCY_MONTHS[order.frequency]
+    year, month = after.year + months // 12, months % 12 + 1
+    return date(year, month, min(order.start_date.day, calendar.monthrange(year, month)[1]))
+
+
+def due_orders(today=None):
+    """Active orders with an execution due on or before ``today``"""
+    return StandingOrder.objects.filter(status='active', next_execution_date__lte=today or timezone.localdate())
+
+
+def partition_by_account(orders, chunk_size):
+    """
+    Split (order id, account id) pairs into lists of order ids of about
+    ``chunk_size``, keeping every order of one source account in one chunk
+    """
+    by_account = {}
+    for order_id, account_id in orders:
+        by_account.setdefault(account_id, []).append(order_id)
+
+    chunks, chunk = [], []
+    for account_id in sorted(by_account):
+        chunk.extend(by_account[account_id])
+        if len(chunk) >= chunk_size:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _advance(order, due, **updates):
+    """Move ``order`` past ``due``; False if another run already did"""
+    following = next_execution_date(order, due)
+    status = 'expired' if order.end_date and following > order.end_date else 'active'
+    advanced = StandingOrder.objects.filter(pk=order.pk, status='active', next_execution_date=due).update(
+        next_execution_date=following, status=status, updated_at=timezone.now(), **updates
+    )
+    order.next_execution_date, order.status = following, status
+    return bool(advanced)
+
+
+def _execute(order, beneficiary, fee, due):
+    """Pay one occurrence of ``order``; returns 'executed', 'failed' or 'skipped'"""
+    def record(debit, credit):
+        if not _advance(order, due, execution_count=F('execution_count') + 1, last_execution_date=due):
+            raise AlreadyExecuted
+
+    try:
+        if beneficiary is None:
+            raise PostingError('Beneficiary account not found')
+        post_transfer(
+            order.account, beneficiary, order.amount, fee, CHANNEL,
+            beneficiary_name=order.beneficiary_name,
+            reference=(order.reference or order.order_id)[:REFERENCE_LENGTH],
+            on_posted=record,
+        )
+        return 'executed'
+    except AlreadyExecuted:
+        return 'skipped'
+    except (PostingError, DatabaseError) as exc:
+        logger.info("Standing order %s due %s failed: %s", order.order_id, due, exc)
+        return 'failed' if _advance(order, due, failed_count=F('failed_count') + 1) else 'skipped'
+
+
+def execute_orders(order_ids, today=None):
+    """
+    Execute every due occurrence of the given orders, up to ``today``.
+    Returns a Counter of 'executed', 'failed', 'expired' and 'skipped'.
+    """
+    today = today or timezone.localdate()
+    orders = list(
+        due_orders(today).filter(pk__in=order_ids).select_related('account__customer').order_by('account', 'pk')
+    )
+    beneficiaries = BankAccount.objects.filter(
+        account_number__in={order.beneficiary_account_number for order in orders}, status='active',
+    ).select_related('customer').in_bulk(field_name='account_number')
+    fees = dict(zip(
+        (order.pk for order in orders),
+        calculate_fees(TRANSFER_FEE_TYPE, [order.amount for order in orders]),
+    ))
+
+    results = Counter()
+    for order in orders:
+        beneficiary = beneficiaries.get(order.beneficiary_account_number)
+        while order.status == 'active' and order.next_execution_date <= today:
+            due = order.next_execution_date
+            if order.end_date and due > order.end_date:
+                StandingOrder.objects.filter(pk=order.pk, status='active').update(
+                    status='expired', updated_at=timezone.now(),
+                )
+                results['expired'] += 1
+                break
+            outcome = _execute(order, beneficiary, fees[order.pk], due)
+            results[outcome] += 1
+            if outcome == 'skipped':
+                break
+    return results
@@ -0,0 +1,155 @@
+# statements.py
+"""
+Account statements.
+
+build_statement() works in two passes over one account's completed
+postings for a period, both on the txn_acct_created index: one aggregate
+query for the credit and debit totals that go in the header, then an
+ordered range scan per format that streams the lines into the file. The
+opening balance comes from balances.balance_as_of and the files go to the
+default storage. It returns an unsaved AccountStatement so callers can
+bulk_create many at once (see the generate_statements command).
+
+Lines are read with a server-side iterator and files are written to a
+spooled temporary file and handed to the storage as a stream, so large
+statements never sit in memory. CSV is always
+available; PDF needs reportlab.
+"""
+import csv
+import io
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .balances import balance_as_of
+from .dates import local_date_range, local_day_start
+from .models import AccountStatement, BankAccount, Transaction
+from .streaming import CHUNK_SIZE
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+except ImportError:  # PDF statements are optional
+    canvas = None
+
+FORMATS = ('csv', 'pdf')
+COLUMNS = ('Date', 'Reference', 'Type', 'Description', 'Debit', 'Credit', 'Balance')
+SPOOL_BYTES = 1024 * 1024
+ZERO = Decimal('0.00')
+
+
+def pdf_available():
+    return canvas is not None
+
+
+def _postings(account_id, from_date, to_date):
+    return Transaction.objects.filter(
+        account_id=account_id, status='completed',
+        **local_date_range('created_at', from_date, to_date),
+    )
+
+
+def _totals(account_id, from_date, to_date):
+    """(credits, debits) for the period, summed by the database"""
+    totals = _postings(account_id, from_date, to_date).aggregate(
+        credits=Sum(F('balance_after') - F('balance_before'),
+                    filter=Q(balance_after__gt=F('balance_before'))),
+        debits=Sum(F('balance_before') - F('balance_after'),
+                   filter=Q(balance_after__lt=F('balance_before'))),
+    )
+    return totals['credits'] or ZERO, totals['debits'] or ZERO
+
+
+def _lines(account_id, from_date, to_date):
+    """Statement lines, oldest first: (created_at, reference, type, description, debit, credit, balance)"""
+    postings = _postings(account_id, from_date, to_date).order_by('created_at', 'pk').values_list(
+        'created_at', 'transaction_id', 'transaction_type', 'description',
+        'balance_before', 'balance_after',
+    ).iterator(chunk_size=CHUNK_SIZE)
+    for created_at, reference, transaction_type, description, before, after in postings:
+        change = after - before
+        yield (created_at, reference, transaction_type, description,
+               -change if change < 0 else ZERO, change if change > 0 else ZERO, after)
+
+
+def _write_csv(out, header, lines):
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    for row in header:
+        writer.writerow(row)
+    writer.writerow(COLUMNS)
+    for created_at, *rest in lines:
+        writer.writerow([timezone.localtime(created_at).isoformat(), *rest])
+    text.flush()
+    text.detach()
+
+
+def _write_pdf(out, header, lines):
+    pdf = canvas.Canvas(out, pagesize=A4)
+    width, height = A4
+    y = height - 50
+    for label, value in header:
+        pdf.drawString(40, y, f"{label}: {value}")
+        y -= 14
+    for created_at, reference, transaction_type, description, debit, credit, balance in lines:
+        if y < 50:
+            pdf.showPage()
+            y = height - 50
+        pdf.drawString(40, y, f"{timezone.localtime(created_at):%Y-%m-%d %H:%M}  {reference}  {description[:40]}")
+        pdf.drawRightString(width - 40, y, f"-{debit}  +{credit}  {balance}")
+        y -= 14
+    pdf.save()
+
+
+WRITERS = {'csv': _write_csv, 'pdf': _write_pdf}
+
+
+def _save(name, write, header, lines):
+    if default_storage.exists(name):
+        default_storage.delete(name)  # a regenerated statement replaces the old file
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as out:
+        write(out, header, lines)
+        out.seek(0)
+        return default_storage.save(name, File(out, name=name))
+
+
+def build_statement(account, from_date, to_date, formats=('csv',)):
+    """
+    Render ``account``'s statement for local dates from_date..to_date in
+    each of ``formats`` and return the unsaved AccountStatement. Its
+    statement_file is the first format; the others are stored next to it.
+    """
+    opening = balance_as_of(account, local_day_start(from_date) - timedelta(microseconds=1))
+    credits, debits = _totals(account.pk, from_date, to_date)
+    closing = opening + credits - debits
+
+    header = [
+        ('Account', account.account_number),
+        ('Period', f"{from_date} to {to_date}"),
+        ('Opening balance', opening),
+        ('Total credits', credits),
+        ('Total debits', debits),
+        ('Closing balance', closing),
+    ]
+    stem = f"statements/{from_date:%Y-%m}/{account.account_number}-{from_date}-{to_date}"
+    # Each format streams its own scan of the lines rather than sharing a list
+    names = [_save(f"{stem}.{fmt}", WRITERS[fmt], header, _lines(account.pk, from_date, to_date))
+             for fmt in formats]
+    return AccountStatement(
+        account=account, statement_date=to_date, from_date=from_date, to_date=to_date,
+        opening_balance=opening, closing_balance=closing,
+        total_credits=credits, total_debits=debits,
+        statement_file=names[0], is_generated=True,
+    )
+
+
+def statement_accounts(from_date, to_date):
+    """Accounts that need a statement: opened by the end of the period and not closed"""
+    return BankAccount.objects.filter(
+        created_at__lt=local_day_start(to_date + timedelta(days=1)),
+    ).exclude(status='closed')
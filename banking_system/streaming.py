@@ -0,0 +1,61 @@
+# streaming.py
+"""
+Streaming JSON responses.
+
+    return streaming_json_response({
+        'fields': fields,
+        'rows': queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE),
+    })
+
+JsonResponse encodes the whole document into one string, so a large export
+holds every model row, its encoded form and the final body in memory at
+once. streaming_json_response writes the top-level object key by key and
+emits any iterator value (a generator or a queryset .iterator()) as a JSON
+array, CHUNK_SIZE items per yielded chunk. Memory stays flat however many
+rows are exported.
+
+Plain values (dicts, lists, strings, numbers) are encoded as usual. Errors
+raised while streaming cannot change the status code any more, so validate
+the request before building the response.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+CHUNK_SIZE = 2000
+
+
+def _is_stream(value):
+    return hasattr(value, '__iter__') and not isinstance(value, (str, bytes, dict, list, tuple))
+
+
+def _iter_array(items, encode, chunk_size):
+    yield '['
+    batch, separator = [], ''
+    for item in items:
+        batch.append(encode(item))
+        if len(batch) == chunk_size:
+            yield separator + ','.join(batch)
+            batch, separator = [], ','
+    if batch:
+        yield separator + ','.join(batch)
+    yield ']'
+
+
+def iter_json(payload, chunk_size=CHUNK_SIZE):
+    """Encode the ``payload`` dict as JSON text chunks, streaming iterator values"""
+    encode = DjangoJSONEncoder().encode
+    yield '{'
+    for position, (key, value) in enumerate(payload.items()):
+        prefix = f"{',' if position else ''}{encode(key)}:"
+        if _is_stream(value):
+            yield prefix
+            yield from _iter_array(value, encode, chunk_size)
+        else:
+            yield prefix + encode(value)
+    yield '}'
+
+
+def streaming_json_response(payload, chunk_size=CHUNK_SIZE, **kwargs):
+    """StreamingHttpResponse for ``payload``, encoded by iter_json"""
+    kwargs.setdefault('content_type', 'application/json')
+    return StreamingHttpResponse(iter_json(payload, chunk_size), **kwargs)
@@ -1,3 +1,1315 @@
-from django.test import TestCase
+import csv
+import json
+from datetime import date, datetime, timedelta
+from io import StringIO, TextIOWrapper
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction as db_transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .analytics import (
+    branch_performance, monthly_totals, monthly_totals_from_summary, monthly_totals_from_transactions,
+    rebuild_daily_summary, remove_transactions, set_summary_coverage, summary_coverage_start
+)
+from .balances import balance_as_of, balances_as_of, snapshot_balances
+from .dates import local_date_range
+from .fees import calculate_fee, calculate_fees
+from .interest import accrue_interest, credit_interest, daily_interest
+from . import account_numbers, fees, forex, ids, interest, ledger
+from .ledger import PostingError, post_deposit, post_transfer, post_withdrawal
+from .notifications import NotificationBatch, claim_pending_emails, send_pending_emails
+from .models import (
+    AccountStatement, AccountType, AgentTransactionLimit, ATMMachine, BankAccount, BankAgent, Branch,
+    BranchAccountSequence, DailyTransactionSummary, FeeStructure, ForexRate, InterestCalculation, Loan,
+    LoanApplication, LoanType, Notification, StandingOrder, SupportTicket, SystemConfiguration, Transaction, User,
+    UserTransactionLimit
+)
+from .standing_orders import execute_orders, next_execution_date
+from .statements import COLUMNS, build_statement
+from .streaming import CHUNK_SIZE, iter_json
+from .views import get_admin_dashboard_context
+
+# Queries allowed for the admin dashboard page when its snapshot has to be
+# built, including the session and user lookups made by the auth middleware.
+# Raise it deliberately when a new widget needs another query; never to
+# absorb a per-row (N+1) query.
+ADMIN_DASHBOARD_QUERY_BUDGET = 11
+# Session and user lookups only: everything else comes from the snapshot
+SNAPSHOT_QUERY_BUDGET = 2
+# Session, user, account, month totals, recent transactions, limits, notifications
+CUSTOMER_DASHBOARD_QUERY_BUDGET = 7
+
+
+def create_branch(branch_code='001', name='HQ'):
+    return Branch.objects.create(
+        name=name, branch_code=branch_code, address='Moi Avenue', city='Nairobi',
+        county='Nairobi', phone_number='0700000000', email='hq@example.com',
+    )
+
+
+def create_customer(username='customer', number=1, **fields):
+    """A user whose phone number and national ID are unique per ``number``"""
+    return User.objects.create(
+        username=username, phone_number=f'+2547000{number:05d}', national_id=f'ID{number}',
+        address='Nairobi', city='Nairobi', postal_code='00100', **fields
+    )
+
+
+def create_savings_type(**fields):
+    return AccountType.objects.create(name='Savings', code='SAV', **fields)
+
+
+def create_account(customer, branch, account_type, **fields):
+    fields.setdefault('status', 'active')
+    return BankAccount.objects.create(customer=customer, account_type=account_type, branch=branch, **fields)
+
+
+class AdminDashboardQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch = create_branch()
+        account_type = create_savings_type()
+        accounts = []
+        for i in range(6):
+            customer = create_customer(f'customer{i}', i)
+            accounts.append(create_account(customer, branch, account_type,
+                                           status='active' if i < 5 else 'dormant'))
+            SupportTicket.objects.create(
+                customer=customer, subject='Card issue', description='Card retained',
+                category='card',
+            )
+
+        for account in accounts[:5]:
+            post_deposit(account, Decimal('1000.00'), Decimal('0'), channel='branch',
+                         description='Cash deposit', notify=False)
+        post_transfer(accounts[0], accounts[1], Decimal('250.00'), Decimal('0'), channel='mobile',
+                      beneficiary_name='Customer 1', check_limits=False, notify=False)
+
+        for i, status in enumerate(['online', 'online', 'offline', 'maintenance']):
+            ATMMachine.objects.create(
+                atm_id=f'ATM{i}', location_name='Mall', address='Mall', city='Nairobi',
+                county='Nairobi', branch=branch, status=status,
+            )
+
+        loan_type = LoanType.objects.create(
+            name='Personal Loan', code='PL', description='Unsecured personal loan',
+            min_amount=Decimal('1000'), max_amount=Decimal('100000'),
+            min_tenure_months=1, max_tenure_months=12, interest_rate=Decimal('9.5'),
+        )
+        application_fields = dict(
+            loan_type=loan_type, tenure_months=6, purpose='School fees',
+            monthly_income=Decimal('50000'), employment_details='Teacher',
+        )
+        LoanApplication.objects.create(
+            applicant=accounts[0].customer, account=accounts[0],
+            requested_amount=Decimal('5000'), **application_fields,
+        )
+        approved = LoanApplication.objects.create(
+            applicant=accounts[1].customer, account=accounts[1],
+            requested_amount=Decimal('8000'), status='approved', **application_fields,
+        )
+        today = timezone.localdate()
+        Loan.objects.create(
+            application=approved, borrower=accounts[1].customer, account=accounts[1],
+            loan_type=loan_type, principal_amount=Decimal('8000'), interest_rate=Decimal('9.5'),
+            tenure_months=6, monthly_installment=Decimal('1400'),
+            outstanding_principal=Decimal('8000'), disbursement_date=timezone.now(),
+            first_payment_date=today + timedelta(days=30),
+            maturity_date=today + timedelta(days=180),
+        )
+
+        cls.admin = create_customer('admin', 99999, user_type='admin')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_context_statistics(self):
+        context = get_admin_dashboard_context()
+
+        self.assertEqual(context['total_customers'], 6)
+        self.assertEqual(context['total_accounts'], 5)
+        self.assertEqual(context['total_transactions_today'], 7)
+        self.assertEqual(context['total_amount_today'], Decimal('5500.00'))
+        self.assertEqual(context['atm_stats'], {
+            'total_atms': 4, 'online_atms': 2, 'offline_atms': 1, 'maintenance_atms': 1,
+        })
+        self.assertEqual(context['loan_stats'], {
+            'total_applications': 2, 'pending_applications': 1,
+            'active_loans': 1, 'total_disbursed': Decimal('8000.00'),
+        })
+
+    def test_admin_dashboard_query_budget(self):
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(ADMIN_DASHBOARD_QUERY_BUDGET):
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_dashboard_served_from_snapshot(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('admin_dashboard'))
+        with self.assertNumQueries(SNAPSHOT_QUERY_BUDGET):
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_accounts'], 5)
+
+    def test_analytics_endpoint_revalidates(self):
+        self.client.force_login(self.admin)
+        url = reverse('api_analytics')
+        response = self.client.get(url, {'group_by': 'channel'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['labels']), 30)
+        totals = {series['key']: sum(series['amounts']) for series in data['series']}
+        self.assertEqual(totals, {'branch': 5000.0, 'mobile': 500.0})
+
+        response = self.client.get(url, {'group_by': 'channel'},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_transaction_export_streams_json(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('api_export_transactions'), {'status': 'completed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['fields'][:2], ['transaction_id', 'created_at'])
+        self.assertEqual(len(data['rows']), 7)
+        self.assertEqual(sum(Decimal(row[data['fields'].index('amount')]) for row in data['rows']),
+                         Decimal('5500.00'))
+
+        response = self.client.get(reverse('api_export_transactions'), {'status': 'unknown'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_analytics_endpoint_caps_points(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('api_analytics'),
+                                   {'from': '2016-01-01', 'granularity': 'hour'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['granularity'], 'month')
+
+
+class CustomerDashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch = create_branch()
+        account_type = create_savings_type()
+        cls.customer = create_customer()
+        UserTransactionLimit.objects.create(user=cls.customer)
+        cls.account = create_account(cls.customer, branch, account_type)
+        other = create_account(create_customer('other', 2), branch, account_type)
+        post_deposit(cls.account, Decimal('1000.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False)
+        post_transfer(cls.account, other, Decimal('300.00'), Decimal('0'), channel='mobile',
+                      beneficiary_name='Other', check_limits=False, notify=False)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.customer)
+
+    def test_monthly_totals(self):
+        response = self.client.get(reverse('customer_dashboard'))
+        self.assertEqual(response.context['monthly_deposits'], Decimal('1000.00'))
+        self.assertEqual(response.context['monthly_withdrawals'], Decimal('0'))
+        self.assertEqual(response.context['monthly_transfers'], Decimal('300.00'))
+
+    def test_query_budget_and_cached_month_totals(self):
+        with self.assertNumQueries(CUSTOMER_DASHBOARD_QUERY_BUDGET):
+            self.client.get(reverse('customer_dashboard'))
+        with self.assertNumQueries(CUSTOMER_DASHBOARD_QUERY_BUDGET - 1):
+            self.client.get(reverse('customer_dashboard'))
+
+    def test_posting_refreshes_month_totals(self):
+        self.client.get(reverse('customer_dashboard'))
+        post_deposit(self.account, Decimal('50.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False)
+        response = self.client.get(reverse('customer_dashboard'))
+        self.assertEqual(response.context['monthly_deposits'], Decimal('1050.00'))
+
+
+class StreamingJsonTests(SimpleTestCase):
+    def test_chunk_boundaries(self):
+        chunks = list(iter_json({'rows': iter(range(7))}, chunk_size=3))
+        self.assertEqual(chunks, ['{', '"rows":', '[', '0,1,2', ',3,4,5', ',6', ']', '}'])
+        self.assertEqual(list(iter_json({'rows': iter(range(6))}, chunk_size=3))[3:6], ['0,1,2', ',3,4,5', ']'])
+
+    def test_valid_json_for_any_row_count(self):
+        for count in (0, 1, CHUNK_SIZE + 1):
+            with self.subTest(count=count):
+                rows = [(number, f'TXN{number}', Decimal('1.50'), date(2027, 1, 1)) for number in range(count)]
+                payload = {'fields': ['id', 'reference', 'amount', 'date'], 'count': count, 'rows': iter(rows)}
+                self.assertEqual(json.loads(''.join(iter_json(payload))), {
+                    'fields': ['id', 'reference', 'amount', 'date'],
+                    'count': count,
+                    'rows': [[number, f'TXN{number}', '1.50', '2027-01-01'] for number in range(count)],
+                })
+
+
+class SerialExecutor:
+    """ProcessPoolExecutor stand-in that runs tasks in this process and test transaction"""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, func, *iterables):
+        return map(func, *iterables)
+
+
+@override_settings(STORAGES={**settings.STORAGES, 'default': {
+    'BACKEND': 'django.core.files.storage.InMemoryStorage',
+}})
+class StatementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.from_date = (timezone.localdate().replace(day=1) - timedelta(days=1)).replace(day=1)
+        cls.to_date = timezone.localdate().replace(day=1) - timedelta(days=1)
+        branch, account_type = create_branch(), create_savings_type()
+        cls.accounts = [create_account(create_customer(f'customer{i}', i), branch, account_type) for i in range(3)]
+        BankAccount.objects.update(created_at=cls.at(-40))
+        account = cls.accounts[0]
+        post_deposit(account, Decimal('1000.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False)
+        post_deposit(account, Decimal('500.00'), Decimal('0'), channel='branch',
+                     description='Salary', notify=False)
+        post_withdrawal(account, Decimal('200.00'), Decimal('5.00'), channel='branch',
+                        description='Cash withdrawal', check_limits=False, notify=False)
+        for days, txn in zip((-10, 4, 5), Transaction.objects.filter(account=account).order_by('pk')):
+            Transaction.objects.filter(pk=txn.pk).update(created_at=cls.at(days))
+        # Posted after the period: not on the statement
+        post_deposit(account, Decimal('50.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False)
+
+    @classmethod
+    def at(cls, days):
+        """Noon local time ``days`` after the first of the statement month"""
+        day = cls.from_date + timedelta(days=days)
+        return timezone.make_aware(datetime(day.year, day.month, day.day, 12))
+
+    def test_csv_totals(self):
+        statement = build_statement(self.accounts[0], self.from_date, self.to_date)
+        self.assertEqual(
+            (statement.opening_balance, statement.total_credits, statement.total_debits, statement.closing_balance),
+            (Decimal('1000.00'), Decimal('500.00'), Decimal('205.00'), Decimal('1295.00')),
+        )
+        with default_storage.open(statement.statement_file.name) as statement_file:
+            rows = list(csv.reader(TextIOWrapper(statement_file, encoding='utf-8')))
+        header, lines = dict(rows[:6]), rows[7:]
+        self.assertEqual((header['Opening balance'], header['Closing balance']), ('1000.00', '1295.00'))
+        self.assertEqual(rows[6], list(COLUMNS))
+        self.assertEqual([line[2:] for line in lines], [
+            ['deposit', 'Salary', '0.00', '500.00', '1500.00'],
+            ['withdrawal', 'Cash withdrawal', '205.00', '0.00', '1295.00'],
+        ])
+
+    def test_totals_match_the_lines(self):
+        account = self.accounts[1]
+        for _ in range(30):
+            post_deposit(account, Decimal('0.10'), Decimal('0'), channel='branch',
+                         description='Cash deposit', notify=False)
+        post_withdrawal(account, Decimal('1.00'), Decimal('0.01'), channel='branch',
+                        description='Cash withdrawal', check_limits=False, notify=False)
+        Transaction.objects.filter(account=account).update(created_at=self.at(3))
+        statement = build_statement(account, self.from_date, self.to_date)
+        self.assertEqual((statement.total_credits, statement.total_debits, statement.closing_balance),
+                         (Decimal('3.00'), Decimal('1.01'), Decimal('1.99')))
+        with default_storage.open(statement.statement_file.name) as statement_file:
+            lines = list(csv.reader(TextIOWrapper(statement_file, encoding='utf-8')))[7:]
+        self.assertEqual(len(lines), 31)
+        self.assertEqual(sum(Decimal(line[5]) for line in lines), statement.total_credits)
+        self.assertEqual(lines[-1][-1], '1.99')
+
+    @mock.patch('banking_system.management.commands.generate_statements.ProcessPoolExecutor', SerialExecutor)
+    def test_command_resumes_from_checkpoint(self):
+        month = f'{self.from_date:%Y-%m}'
+        SystemConfiguration.objects.create(key=f'statements.checkpoint.{month}', value=str(self.accounts[0].pk),
+                                           config_type='general')
+        out = StringIO()
+        call_command('generate_statements', '--month', month, '--chunk-size', '1', stdout=out)
+        self.assertIn(f'Resuming after account {self.accounts[0].pk}', out.getvalue())
+        self.assertEqual(set(AccountStatement.objects.values_list('account_id', flat=True)),
+                         {account.pk for account in self.accounts[1:]})
+        self.assertEqual(SystemConfiguration.objects.get(key=f'statements.checkpoint.{month}').value,
+                         str(self.accounts[-1].pk))
+
+        # --restart goes back to the first account; finished statements are skipped
+        call_command('generate_statements', '--month', month, '--restart', stdout=StringIO())
+        self.assertEqual(AccountStatement.objects.count(), 3)
+        self.assertEqual(AccountStatement.objects.get(account=self.accounts[0]).closing_balance, Decimal('1295.00'))
+
+
+@mock.patch.object(account_numbers, 'BLOCK_SIZE', 10)
+@mock.patch.dict(account_numbers._blocks, clear=True)
+class AccountNumberTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = create_branch()
+
+    def next_value(self):
+        return BranchAccountSequence.objects.get(branch=self.branch).next_value
+
+    def test_check_digit(self):
+        self.assertEqual(account_numbers.luhn_check_digit('7992739871'), '3')
+        for branch_code in ('001', 'BR001'):
+            number = account_numbers.format_account_number(branch_code, 42)
+            self.assertEqual(number[:-1], f'{branch_code}0000042')
+            self.assertTrue(account_numbers.is_valid_account_number(number))
+            # Any one mistyped digit fails the check
+            for position, char in enumerate(number):
+                if not char.isdigit():
+                    continue
+                for digit in '0123456789'.replace(char, ''):
+                    altered = number[:position] + digit + number[position + 1:]
+                    self.assertFalse(account_numbers.is_valid_account_number(altered), altered)
+        self.assertFalse(account_numbers.is_valid_account_number(''))
+        self.assertFalse(account_numbers.is_valid_account_number('001-0000042'))
+
+    def test_numbers_come_from_reserved_blocks(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = account_numbers.allocate_account_numbers(self.branch.pk, 3)
+        self.assertEqual(self.next_value(), 11)
+
+        # The rest of the block is handed out from memory
+        with self.assertNumQueries(0):
+            second = account_numbers.allocate_account_numbers(self.branch.pk, 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            third = account_numbers.allocate_account_numbers(self.branch.pk, 4)
+        self.assertEqual(self.next_value(), 21)
+        self.assertEqual(first + second + third,
+                         [account_numbers.format_account_number('001', value) for value in range(1, 13)])
+
+    def test_rolled_back_block_is_not_reused(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with db_transaction.atomic():
+                    rolled_back = account_numbers.allocate_account_numbers(self.branch.pk, 1)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertNotIn(self.branch.pk, account_numbers._blocks)
+
+        # The reservation rolled back too, so the numbers are reserved afresh
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(account_numbers.allocate_account_numbers(self.branch.pk, 1), rolled_back)
+        self.assertEqual(account_numbers._blocks[self.branch.pk][1:], [2, 11])
+
+
+class BalanceAsOfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch = create_branch()
+        customer = create_customer()
+        cls.account = create_account(customer, branch, create_savings_type())
+        cls.now = timezone.now()
+        BankAccount.objects.filter(pk=cls.account.pk).update(created_at=cls.now - timedelta(days=10))
+        # One posting a day, three days ago (+1000), two days ago (-101) and today (+500)
+        post_deposit(cls.account, Decimal('1000.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False)
+        post_withdrawal(cls.account, Decimal('100.00'), Decimal('1.00'), channel='branch',
+                        description='Cash withdrawal', check_limits=False, notify=False)
+        post_deposit(cls.account, Decimal('500.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False)
+        for days, txn in zip((3, 2, 0), Transaction.objects.filter(account=cls.account).order_by('pk')):
+            Transaction.objects.filter(pk=txn.pk).update(created_at=cls.now - timedelta(days=days))
+
+    def assertBalances(self):
+        for days, expected in ((4, '0.00'), (3, '1000.00'), (1, '899.00'), (0, '1399.00')):
+            at = self.now - timedelta(days=days)
+            self.assertEqual(balance_as_of(self.account, at), Decimal(expected))
+            self.assertEqual(balances_as_of([self.account.pk], at), {self.account.pk: Decimal(expected)})
+
+    def test_without_snapshots(self):
+        self.assertBalances()
+
+    def test_with_snapshots(self):
+        today = timezone.localdate()
+        for days in range(1, 6):
+            snapshot_balances(today - timedelta(days=days))
+        self.assertEqual(self.account.balance_snapshots.count(), 5)
+        self.assertBalances()
+
+
+class InterestAccrualTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch = create_branch()
+        customer = create_customer()
+        savings = create_savings_type(interest_rate=Decimal('3.5000'))
+        current = AccountType.objects.create(name='Current', code='CUR')
+        cls.accounts = [
+            create_account(customer, branch, account_type) for account_type in (savings, savings, current)
+        ]
+        BankAccount.objects.update(created_at=timezone.now() - timedelta(days=10))
+        for account, amount in zip(cls.accounts, ('12345.67', '10.00', '50000.00')):
+            post_deposit(account, Decimal(amount), Decimal('0'), channel='branch',
+                         description='Cash deposit', notify=False)
+        Transaction.objects.update(created_at=timezone.now() - timedelta(days=5))
+
+    def test_accrue_and_credit(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        days = [yesterday - timedelta(days=1), yesterday]
+        for day in days:
+            accrue_interest(day)
+        # Reruns skip accounts already accrued
+        self.assertEqual(accrue_interest(yesterday), (0, Decimal('0.000000')))
+
+        rich, poor, current = self.accounts
+        earned = daily_interest(Decimal('12345.67'), Decimal('3.5'))
+        self.assertEqual(earned, Decimal('1.183831'))
+        self.assertEqual(
+            list(rich.interest_calculations.order_by('calculation_date')
+                 .values_list('calculation_date', 'interest_earned')),
+            [(day, earned) for day in days],
+        )
+        # 10.00 at 3.5% earns under a cent a day, which still accrues; current accounts earn nothing
+        self.assertEqual(list(poor.interest_calculations.values_list('interest_earned', flat=True)),
+                         [Decimal('0.000959')] * 2)
+        self.assertFalse(current.interest_calculations.exists())
+
+        # Rounded to the cent once, on the total; poor's 0.0019 stays pending
+        self.assertEqual(credit_interest(yesterday), (1, Decimal('2.37')))
+        rich.refresh_from_db()
+        self.assertEqual(rich.balance, Decimal('12348.04'))
+        credit = Transaction.objects.get(account=rich, transaction_type='interest_credit')
+        self.assertEqual(credit.balance_after, rich.balance)
+        self.assertEqual(rich.interest_calculations.filter(is_credited=True, transaction=credit).count(), 2)
+        self.assertEqual(credit_interest(yesterday), (0, Decimal('0.00')))
+
+        # Once enough has carried over, it is credited
+        InterestCalculation.objects.bulk_create([
+            InterestCalculation(account=poor, calculation_date=yesterday - timedelta(days=offset),
+                                balance=Decimal('10.00'), interest_rate=Decimal('3.5'),
+                                interest_earned=Decimal('0.000959'), days_calculated=1)
+            for offset in range(2, 6)
+        ])
+        self.assertEqual(credit_interest(yesterday), (1, Decimal('0.01')))
+        self.assertFalse(poor.interest_calculations.filter(is_credited=False).exists())
+
+    def test_credit_marks_only_the_summed_accruals(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        accrue_interest(yesterday)
+        rich = self.accounts[0]
+        post_credits = interest.post_credits
+
+        def accrue_meanwhile(credits, *args, **kwargs):
+            # An accrual written after the totals were read
+            InterestCalculation.objects.create(
+                account=rich, calculation_date=yesterday - timedelta(days=1), balance=Decimal('12345.67'),
+                interest_rate=Decimal('3.5'), interest_earned=Decimal('1.183831'), days_calculated=1,
+            )
+            return post_credits(credits, *args, **kwargs)
+
+        with mock.patch.object(interest, 'post_credits', accrue_meanwhile):
+            self.assertEqual(credit_interest(yesterday), (1, Decimal('1.18')))
+        self.assertEqual(
+            list(rich.interest_calculations.order_by('calculation_date').values_list('is_credited', flat=True)),
+            [False, True],
+        )
+
+
+class FeeScheduleTests(TestCase):
+    def test_fee_edits_apply_without_clearing_the_cache(self):
+        self.assertEqual(calculate_fee('agent_withdrawal', Decimal('1000.00')), Decimal('35.00'))
+        structure = FeeStructure.objects.create(
+            transaction_type='agent_withdrawal', fixed_fee=Decimal('30.00'), percentage_fee=Decimal('1.0000'),
+            maximum_fee=Decimal('200.00'), effective_from=timezone.now() - timedelta(days=1),
+        )
+        self.assertEqual(calculate_fee('agent_withdrawal', Decimal('1000.00')), Decimal('30.00'))
+        self.assertEqual(calculate_fees('agent_withdrawal', [Decimal('5000.00'), Decimal('50000.00')]),
+                         [Decimal('50.00'), Decimal('200.00')])
+
+        structure.fixed_fee = Decimal('45.00')
+        structure.save()
+        self.assertEqual(calculate_fee('agent_withdrawal', Decimal('1000.00')), Decimal('45.00'))
+
+        # An edit saved by another process only changes the shared version token
+        FeeStructure.objects.filter(pk=structure.pk).update(fixed_fee=Decimal('60.00'))
+        self.assertEqual(calculate_fee('agent_withdrawal', Decimal('1000.00')), Decimal('45.00'))
+        cache.set(fees.VERSION_CACHE_KEY, 'saved elsewhere', timeout=None)
+        self.assertEqual(calculate_fee('agent_withdrawal', Decimal('1000.00')), Decimal('60.00'))
+
+        structure.delete()
+        self.assertEqual(calculate_fee('agent_withdrawal', Decimal('1000.00')), Decimal('35.00'))
+
+
+def create_rate(target_currency, mid_rate, effective_date, base_currency='KES'):
+    mid_rate = Decimal(mid_rate)
+    return ForexRate.objects.create(
+        base_currency=base_currency, target_currency=target_currency, buy_rate=mid_rate - 1,
+        sell_rate=mid_rate + 1, mid_rate=mid_rate, effective_date=effective_date,
+    )
+
+
+class LatestForexRateTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def latest_mid_rate(self, target_currency='USD'):
+        latest = forex.get_latest_rate(target_currency)
+        return latest and latest.mid_rate
+
+    def test_latest_rate_never_moves_backwards(self):
+        newest = create_rate('USD', '130.00', self.now)
+        older = create_rate('USD', '120.00', self.now - timedelta(days=1))
+        self.assertEqual(self.latest_mid_rate(), Decimal('130.00'))
+        forex.record_rate(older)
+        self.assertEqual(self.latest_mid_rate(), Decimal('130.00'))
+
+        forex.record_rate(newest)
+        create_rate('EUR', '140.00', self.now)
+        self.assertEqual([(rate.target_currency, rate.mid_rate) for rate in forex.latest_rates()],
+                         [('EUR', Decimal('140.00')), ('USD', Decimal('130.00'))])
+
+    def test_edits_and_deletes_recompute_the_pair(self):
+        newest = create_rate('USD', '130.00', self.now)
+        older = create_rate('USD', '120.00', self.now - timedelta(days=1))
+
+        newest.effective_date = self.now - timedelta(days=2)
+        newest.save()
+        self.assertEqual(self.latest_mid_rate(), Decimal('120.00'))
+
+        older.delete()
+        self.assertEqual(self.latest_mid_rate(), Decimal('130.00'))
+        newest.delete()
+        self.assertIsNone(forex.get_latest_rate('USD'))
+
+    def test_rebuild_after_bulk_writes(self):
+        ForexRate.objects.bulk_create([
+            ForexRate(target_currency='USD', buy_rate=Decimal('129'), sell_rate=Decimal('131'),
+                      mid_rate=Decimal('130'), effective_date=self.now - timedelta(hours=hours))
+            for hours in range(3)
+        ])
+        self.assertIsNone(forex.get_latest_rate('USD'))
+        self.assertEqual(forex.rebuild_latest_rates(), 1)
+        self.assertEqual(forex.get_latest_rate('USD').effective_date, self.now)
+
+
+class ForexHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        cls.monday, cls.tuesday = cls.now - timedelta(days=2), cls.now - timedelta(days=1)
+        cls.monday_rate = create_rate('USD', '128.00', cls.monday)
+        cls.tuesday_rate = create_rate('USD', '130.00', cls.tuesday)
+
+    def setUp(self):
+        forex.invalidate_history()
+
+    def test_rate_at_boundaries(self):
+        microsecond = timedelta(microseconds=1)
+        self.assertIsNone(forex.rate_at(('KES', 'USD'), self.monday - microsecond))
+        self.assertEqual(forex.rate_at(('KES', 'USD'), self.monday), self.monday_rate)
+        self.assertEqual(forex.rate_at('KES/USD', self.tuesday - microsecond), self.monday_rate)
+        self.assertEqual(forex.rate_at('KES/USD', self.tuesday), self.tuesday_rate)
+        self.assertEqual(forex.rate_at('KES/USD'), self.tuesday_rate)
+        self.assertIsNone(forex.rate_at('KES/EUR'))
+
+    def test_history_is_cached_until_a_rate_changes(self):
+        self.assertEqual(forex.rate_at('KES/USD', self.now), self.tuesday_rate)
+        with self.assertNumQueries(0):
+            self.assertEqual(forex.rate_at('KES/USD', self.tuesday - timedelta(hours=1)), self.monday_rate)
+
+        # Saving a rate drops every process's cached history through the version token
+        wednesday_rate = create_rate('USD', '131.00', self.now - timedelta(hours=1))
+        self.assertEqual(forex.rate_at('KES/USD', self.now), wednesday_rate)
+        wednesday_rate.delete()
+        self.assertEqual(forex.rate_at('KES/USD', self.now), self.tuesday_rate)
+
+        # Lookups older than the cached window extend it
+        with mock.patch.object(forex, 'HISTORY_CACHE_DAYS', 1):
+            forex.invalidate_history()
+            self.assertEqual(forex.rate_at('KES/USD', self.now), self.tuesday_rate)
+            self.assertEqual(forex.rate_at('KES/USD', self.monday), self.monday_rate)
+
+    def test_convert(self):
+        self.assertEqual(forex.convert(Decimal('10.00'), 'USD', self.now), Decimal('1300.00'))
+        self.assertEqual(
+            forex.convert_many([
+                (Decimal('10.00'), 'USD', self.monday), ('0.333', 'USD', self.tuesday),
+                (Decimal('12.3'), 'KES', self.now),
+            ]),
+            [Decimal('1280.00'), Decimal('43.29'), Decimal('12.30')],
+        )
+        self.assertEqual(str(forex.convert('12.341', 'KES')), '12.34')
+        with self.assertRaises(ValueError):
+            forex.convert(Decimal('10.00'), 'XYZ')
+        with self.assertRaises(ValueError):
+            forex.convert(Decimal('10.00'), 'USD', self.monday - timedelta(days=1))
+
+
+class StandingOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch = create_branch()
+        customer = create_customer()
+        account_type = create_savings_type()
+        cls.payer, cls.payee = [create_account(customer, branch, account_type) for _ in range(2)]
+        post_deposit(cls.payer, Decimal('1000.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False)
+
+    def order(self, amount, frequency, start, beneficiary=None, reference='Rent', **fields):
+        return StandingOrder.objects.create(
+            account=self.payer, beneficiary_name='Landlord', amount=Decimal(amount),
+            beneficiary_account_number=beneficiary or self.payee.account_number,
+            frequency=frequency, reference=reference, start_date=start, next_execution_date=start, **fields
+        )
+
+    def test_next_execution_date_keeps_day_of_month(self):
+        order = StandingOrder(frequency='monthly', start_date=date(2027, 1, 31))
+        self.assertEqual(next_execution_date(order, date(2027, 1, 31)), date(2027, 2, 28))
+        self.assertEqual(next_execution_date(order, date(2027, 2, 28)), date(2027, 3, 31))
+        order.frequency = 'quarterly'
+        self.assertEqual(next_execution_date(order, date(2027, 11, 30)), date(2028, 2, 29))
+
+    def test_execute_catches_up_and_records_failures(self):
+        today = timezone.localdate()
+        weekly = self.order('100.00', 'weekly', today - timedelta(days=14))
+        unknown = self.order('10.00', 'daily', today, beneficiary='0000000000')
+        too_big = self.order('5000.00', 'monthly', today)
+        ended = self.order('1.00', 'daily', today - timedelta(days=5), end_date=today - timedelta(days=6))
+
+        results = execute_orders([weekly.pk, unknown.pk, too_big.pk, ended.pk], today)
+        self.assertEqual(results, {'executed': 3, 'failed': 2, 'expired': 1})
+
+        weekly.refresh_from_db()
+        self.assertEqual((weekly.execution_count, weekly.last_execution_date, weekly.next_execution_date),
+                         (3, today, today + timedelta(days=7)))
+        self.assertEqual(
+            list(StandingOrder.objects.filter(pk__in=[unknown.pk, too_big.pk])
+                 .order_by('pk').values_list('failed_count', 'execution_count', 'status')),
+            [(1, 0, 'active'), (1, 0, 'active')],
+        )
+        self.assertEqual(StandingOrder.objects.get(pk=ended.pk).status, 'expired')
+        self.payee.refresh_from_db()
+        self.assertEqual(self.payee.balance, Decimal('300.00'))
+
+        # Nothing is due any more, so a second run pays nothing twice
+        self.assertEqual(execute_orders([weekly.pk, unknown.pk, too_big.pk], today), {})
+
+    def test_execution_counts_against_transfer_limits(self):
+        today = timezone.localdate()
+        UserTransactionLimit.objects.create(user_id=self.payer.customer_id, daily_transfer_limit=Decimal('250.00'))
+        rent = self.order('100.00', 'monthly', today)
+        gym = self.order('100.00', 'monthly', today, reference='')
+        water = self.order('100.00', 'monthly', today)
+
+        self.assertEqual(execute_orders([rent.pk, gym.pk, water.pk], today), {'executed': 2, 'failed': 1})
+        self.assertEqual(
+            list(Transaction.objects.filter(account=self.payer, transaction_type='transfer')
+                 .order_by('pk').values_list('reference_number', flat=True)),
+            ['Rent', gym.order_id],
+        )
+        limits = UserTransactionLimit.objects.get(user_id=self.payer.customer_id)
+        self.assertEqual(limits.current_daily_transfers, Decimal('200.00'))
+
+        # Reconciliation counts the same transfers, so it agrees with the live counters
+        call_command('reconcile_transaction_limits', stdout=StringIO())
+        limits.refresh_from_db()
+        self.assertEqual((limits.current_daily_transfers, limits.current_monthly_transfers),
+                         (Decimal('200.00'), Decimal('200.00')))
+
+
+class TransactionLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account(create_customer(), create_branch(), create_savings_type())
+        post_deposit(cls.account, Decimal('1000.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False)
+        post_withdrawal(cls.account, Decimal('100.00'), Decimal('0'), channel='branch',
+                        description='Cash withdrawal', notify=False)
+
+    def test_roll_over(self):
+        limits = UserTransactionLimit(
+            last_reset_date=date(2027, 3, 31), current_daily_withdrawals=Decimal('10.00'),
+            current_daily_transfers=Decimal('20.00'), current_monthly_transfers=Decimal('30.00'),
+        )
+        self.assertEqual(limits.roll_over(date(2027, 3, 31)), [])
+        self.assertEqual(limits.current_daily_withdrawals, Decimal('10.00'))
+
+        limits.last_reset_date = date(2027, 3, 30)
+        self.assertEqual(limits.roll_over(date(2027, 3, 31)),
+                         ['current_daily_transfers', 'current_daily_withdrawals'])
+        self.assertEqual((limits.current_daily_withdrawals, limits.current_daily_transfers,
+                          limits.current_monthly_transfers, limits.last_reset_date),
+                         (Decimal('0.00'), Decimal('0.00'), Decimal('30.00'), date(2027, 3, 31)))
+
+        self.assertEqual(limits.roll_over(date(2027, 4, 1)), [
+            'current_daily_transfers', 'current_daily_withdrawals', 'current_monthly_transfers',
+        ])
+        self.assertEqual((limits.current_monthly_transfers, limits.last_reset_date),
+                         (Decimal('0.00'), date(2027, 4, 1)))
+
+    def test_reconcile_recomputes_drifted_counters(self):
+        UserTransactionLimit.objects.filter(user_id=self.account.customer_id).update(
+            current_daily_withdrawals=Decimal('999.00'), current_monthly_transfers=Decimal('5.00'),
+            last_reset_date=timezone.localdate() - timedelta(days=1),
+        )
+        out = StringIO()
+        call_command('reconcile_transaction_limits', '--dry-run', stdout=out)
+        self.assertIn('999.00', out.getvalue())
+        limits = UserTransactionLimit.objects.get(user_id=self.account.customer_id)
+        self.assertEqual(limits.current_daily_withdrawals, Decimal('999.00'))
+
+        call_command('reconcile_transaction_limits', '--batch-size', '1', stdout=StringIO())
+        limits.refresh_from_db()
+        self.assertEqual((limits.current_daily_withdrawals, limits.current_daily_transfers,
+                          limits.current_monthly_transfers, limits.last_reset_date),
+                         (Decimal('100.00'), Decimal('0.00'), Decimal('0.00'), timezone.localdate()))
+
+    def test_views_show_todays_usage(self):
+        UserTransactionLimit.objects.filter(user_id=self.account.customer_id).update(
+            current_daily_withdrawals=Decimal('100.00'), current_daily_transfers=Decimal('50.00'),
+            last_reset_date=timezone.localdate() - timedelta(days=1),
+        )
+        self.client.force_login(self.account.customer)
+        for name in ('customer_dashboard', 'withdrawal', 'transfer'):
+            with self.subTest(view=name):
+                limits = self.client.get(reverse(name)).context['limits']
+                self.assertEqual((limits.current_daily_withdrawals, limits.current_daily_transfers),
+                                 (Decimal('0.00'), Decimal('0.00')))
+        # The rollover is display-only; the stored row is reset by the next posting
+        stored = UserTransactionLimit.objects.get(user_id=self.account.customer_id)
+        self.assertEqual(stored.current_daily_withdrawals, Decimal('100.00'))
+
+
+class FakeMailConnection:
+    """Mail connection stub that records the open atomic blocks at send time"""
+
+    def __init__(self, accept=True, on_send=None):
+        self.accept = accept
+        self.on_send = on_send
+        self.sent = []
+        self.atomic_depths = []
+
+    def open(self):
+        return False
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        self.atomic_depths.append(len(connection.atomic_blocks))
+        if self.on_send:
+            self.on_send(messages)
+        if not self.accept:
+            return 0
+        self.sent.extend(messages)
+        return len(messages)
+
+
+class NotificationOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = create_account(create_customer(email='customer@example.com'), create_branch(),
+                                     create_savings_type())
+        for _ in range(3):
+            post_deposit(cls.account, Decimal('100.00'), Decimal('0'), channel='branch',
+                         description='Cash deposit')
+
+    def emails(self, status):
+        return Notification.objects.filter(channel='email', status=status)
+
+    def test_workers_never_claim_the_same_rows(self):
+        first = claim_pending_emails(batch_size=2)
+        second = claim_pending_emails(batch_size=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({row.pk for row in first} & {row.pk for row in second})
+        self.assertEqual(claim_pending_emails(), [])
+        self.assertEqual(self.emails('sending').count(), 3)
+
+    def test_stale_claims_return_to_the_outbox(self):
+        claim_pending_emails()
+        self.emails('sending').update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(len(claim_pending_emails()), 3)
+
+    def test_sends_outside_the_claim_transaction(self):
+        mail = FakeMailConnection()
+        depth = len(connection.atomic_blocks)
+        self.assertEqual(send_pending_emails(connection=mail), (3, 0))
+        self.assertEqual(mail.atomic_depths, [depth] * 3)
+        self.assertEqual(self.emails('sent').count(), 3)
+        self.assertEqual(send_pending_emails(connection=mail), (0, 0))
+
+    def test_rejected_emails_are_marked_failed(self):
+        with self.assertLogs('banking_system.notifications', 'WARNING'):
+            self.assertEqual(send_pending_emails(connection=FakeMailConnection(accept=False)), (0, 3))
+        self.assertEqual(self.emails('failed').count(), 3)
+        self.assertEqual(send_pending_emails(connection=FakeMailConnection()), (0, 0))
+
+
+class NotificationBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch, account_type = create_branch(), create_savings_type()
+        cls.customers = [create_customer(f'customer{i}', i, email=f'customer{i}@example.com') for i in range(2)]
+        cls.customers.append(create_customer('customer2', 2))
+        cls.postings = [
+            post_deposit(create_account(customer, branch, account_type), Decimal('100.00'), Decimal('0'),
+                         channel='branch', description='Cash deposit', notify=False)
+            for customer in cls.customers
+        ]
+
+    def batch(self, **options):
+        batch = NotificationBatch(**options)
+        for txn in self.postings:
+            batch.add(txn.account.customer, txn, 'deposit')
+        return batch
+
+    def emails(self, status):
+        return Notification.objects.filter(channel='email', status=status)
+
+    def test_writes_in_chunks(self):
+        mail = FakeMailConnection()
+        with mock.patch.object(Notification.objects, 'bulk_create',
+                               wraps=Notification.objects.bulk_create) as bulk_create:
+            self.assertEqual(self.batch(chunk_size=2, connection=mail).flush(), (5, 2, 0))
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [4, 1])
+        self.assertEqual(Notification.objects.filter(channel='in_app', status='sent').count(), 3)
+        self.assertEqual(self.emails('sent').count(), 2)
+        self.assertEqual(len(mail.sent), 2)
+
+    def test_emails_are_claimed_while_sending(self):
+        seen = []
+
+        def on_send(messages):
+            seen.append((list(Notification.objects.filter(channel='email').values_list('status', flat=True)),
+                         claim_pending_emails()))
+
+        self.assertEqual(self.batch(connection=FakeMailConnection(on_send=on_send)).flush(), (5, 2, 0))
+        self.assertEqual(seen, [(['sending', 'sending'], [])] * 2)
+        self.assertEqual(self.emails('sent').count(), 2)
+
+    def test_rejected_emails_are_marked_failed(self):
+        with self.assertLogs('banking_system.notifications', 'WARNING'):
+            self.assertEqual(self.batch(connection=FakeMailConnection(accept=False)).flush(), (5, 0, 2))
+        self.assertEqual(self.emails('failed').count(), 2)
+        self.assertEqual(claim_pending_emails(), [])
+
+    def test_add_message_fans_out(self):
+        mail = FakeMailConnection()
+        batch = NotificationBatch(connection=mail)
+        batch.add_message(self.customers, 'Statement ready', 'Your statement is ready.',
+                          email_subject='Equity Bank - Statement')
+        batch.add_message(self.customers, 'Maintenance', 'Online banking is down on Sunday.')
+        self.assertEqual(len(batch), 6)
+        self.assertEqual(batch.flush(), (8, 2, 0))
+        self.assertEqual(len(batch), 0)
+
+        in_app = Notification.objects.filter(channel='in_app', notification_type='system')
+        self.assertEqual(in_app.filter(title='Statement ready').count(), 3)
+        self.assertEqual(in_app.filter(title='Maintenance').count(), 3)
+        self.assertEqual(sorted(self.emails('sent').values_list('user__username', 'title')), [
+            ('customer0', 'Equity Bank - Statement'), ('customer1', 'Equity Bank - Statement'),
+        ])
+        self.assertEqual({message.body for message in mail.sent}, {'Your statement is ready.'})
+
+    def test_send_email_false_leaves_emails_pending(self):
+        mail = FakeMailConnection()
+        self.assertEqual(self.batch(send_email=False, connection=mail).flush(), (5, 0, 0))
+        self.assertEqual(mail.sent, [])
+        self.assertEqual(self.emails('pending').count(), 2)
+        self.assertEqual(send_pending_emails(connection=mail), (2, 0))
+
+    def test_backends_without_returned_keys_leave_emails_to_the_outbox(self):
+        mail = FakeMailConnection()
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False):
+            self.assertEqual(self.batch(connection=mail).flush(), (5, 0, 0))
+        self.assertEqual(mail.sent, [])
+        self.assertEqual(self.emails('pending').count(), 2)
+        self.assertEqual(send_pending_emails(connection=mail), (2, 0))
+
+
+class DailySummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch, account_type = create_branch(), create_savings_type()
+        cls.accounts = [create_account(create_customer(f'customer{i}', i), branch, account_type)
+                        for i in range(2)]
+        for account, amount in zip(cls.accounts * 2, ('100.00', '200.00', '300.00', '400.00')):
+            post_deposit(account, Decimal(amount), Decimal('0'), channel='branch',
+                         description='Cash deposit', notify=False)
+
+    def totals(self, day):
+        return DailyTransactionSummary.objects.filter(date=day).aggregate(
+            count=Sum('transaction_count'), total=Sum('total_amount'),
+            low=Min('min_amount'), high=Max('max_amount'),
+        )
+
+    def test_postings_update_one_shard_per_account(self):
+        today = timezone.localdate()
+        self.assertEqual(self.totals(today), {
+            'count': 4, 'total': Decimal('1000.00'), 'low': Decimal('100.00'), 'high': Decimal('400.00'),
+        })
+        self.assertEqual(DailyTransactionSummary.objects.filter(date=today).count(), 2)
+
+    def test_remove_transactions(self):
+        today = timezone.localdate()
+        postings = Transaction.objects.filter(account=self.accounts[0])
+        with db_transaction.atomic():
+            self.assertEqual(remove_transactions(postings.filter(amount=Decimal('100.00'))), 1)
+            postings.filter(amount=Decimal('100.00')).delete()
+        self.assertEqual(self.totals(today)['count'], 3)
+        self.assertEqual(self.totals(today)['total'], Decimal('900.00'))
+
+        remove_transactions(Transaction.objects.all())
+        self.assertFalse(DailyTransactionSummary.objects.exists())
+
+    def test_benchmarks_rebuild_only_past_days(self):
+        out = StringIO()
+        call_command('benchmark_monthly_summary', '--rows', '300', '--accounts', '2', '--repeat', '1', stdout=out)
+        self.assertIn(', 0 differ between Transaction and rollup', out.getvalue())
+        self.assertEqual(Transaction.objects.count(), 4)
+        # Today's ledger-kept rows are untouched
+        self.assertEqual(self.totals(timezone.localdate())['count'], 4)
+        self.assertEqual(DailyTransactionSummary.objects.exclude(date=timezone.localdate()).count(), 0)
+
+    def test_rebuild_past_days(self):
+        day = timezone.localdate() - timedelta(days=2)
+        Transaction.objects.update(created_at=timezone.now() - timedelta(days=2))
+        DailyTransactionSummary.objects.all().delete()
+
+        self.assertEqual(rebuild_daily_summary(day, day + timedelta(days=1)), 1)
+        self.assertEqual(self.totals(day), {
+            'count': 4, 'total': Decimal('1000.00'), 'low': Decimal('100.00'), 'high': Decimal('400.00'),
+        })
+        with self.assertRaises(ValueError):
+            rebuild_daily_summary(day, timezone.localdate())
+
+        call_command('backfill_transaction_summary', stdout=StringIO())
+        self.assertEqual(self.totals(day)['count'], 4)
+        self.assertEqual(summary_coverage_start(), date.min)
+
+
+class BranchPerformanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account_type = create_savings_type()
+        cls.city, cls.town = create_branch('001', 'City'), create_branch('002', 'Town')
+        city_accounts = [create_account(create_customer(f'city{i}', i), cls.city, account_type)
+                         for i in range(3)]
+        town_account = create_account(create_customer('town', 10), cls.town, account_type)
+        for account, amount in zip(city_accounts + city_accounts[:1], ('100.00', '200.00', '300.00', '400.00')):
+            post_deposit(account, Decimal(amount), Decimal('0'), channel='branch',
+                         description='Cash deposit', notify=False)
+        for amount in ('10.00', '20.00'):
+            post_deposit(town_account, Decimal(amount), Decimal('0'), channel='branch',
+                         description='Cash deposit', notify=False)
+        # Paid in over the City counter: counts toward City, not the account's branch
+        post_deposit(town_account, Decimal('5.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False, branch=cls.city)
+
+    def test_each_branch_gets_exact_totals(self):
+        performance = {branch.pk: branch for branch in branch_performance()}
+        self.assertEqual(list(performance), [self.city.pk, self.town.pk])
+        self.assertEqual(
+            [(branch.account_count, branch.transaction_count, branch.total_amount)
+             for branch in performance.values()],
+            [(3, 5, Decimal('1005.00')), (1, 2, Decimal('30.00'))],
+        )
+        # Same attribution as the daily rollup
+        rollup = dict(DailyTransactionSummary.objects.values_list('branch').annotate(Sum('transaction_count')))
+        self.assertEqual(rollup, {self.city.pk: 5, self.town.pk: 2})
+
+
+class MonthlyTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.localdate()
+        cls.this_month = today.replace(day=1)
+        cls.last_month = (cls.this_month - timedelta(days=1)).replace(day=1)
+        cls.month_before = (cls.last_month - timedelta(days=1)).replace(day=1)
+        account = create_account(create_customer(), create_branch(), create_savings_type())
+        # Local times: 00:30 on the 1st is still the previous month in UTC
+        for when, amount in [
+            (datetime.combine(cls.last_month - timedelta(days=1), datetime.min.time()).replace(hour=23), '100.00'),
+            (datetime.combine(cls.last_month, datetime.min.time()).replace(minute=30), '200.00'),
+            (datetime.combine(cls.last_month + timedelta(days=14), datetime.min.time()).replace(hour=12), '300.00'),
+        ]:
+            txn = post_deposit(account, Decimal(amount), Decimal('0'), channel='branch',
+                               description='Cash deposit', notify=False)
+            Transaction.objects.filter(pk=txn.pk).update(created_at=timezone.make_aware(when))
+        DailyTransactionSummary.objects.all().delete()
+        post_deposit(account, Decimal('400.00'), Decimal('0'), channel='branch',
+                     description='Cash deposit', notify=False)
+
+        # The rollup is complete from last month onwards; the month before is missing from it
+        rebuild_daily_summary(cls.last_month, today - timedelta(days=1))
+        set_summary_coverage(cls.last_month)
+        cls.admin = create_customer('admin', 99999, user_type='admin')
+
+    def setUp(self):
+        cache.clear()
+
+    def months(self, totals):
+        return [(item['month'], item['count'], item['amount']) for item in totals]
+
+    def truncated(self, start_date):
+        """The reference answer: Transaction grouped by local calendar month"""
+        months = Transaction.objects.filter(**local_date_range('created_at', start_date)).annotate(
+            month=TruncMonth('created_at'),
+        ).values('month').annotate(count=Count('id'), amount=Sum('amount')).order_by('month')
+        return [(item['month'].date(), item['count'], item['amount']) for item in months]
+
+    def test_rollup_matches_transaction_months(self):
+        expected = [(self.last_month, 2, Decimal('500.00')), (self.this_month, 1, Decimal('400.00'))]
+        self.assertEqual(self.truncated(self.last_month), expected)
+        self.assertEqual(self.months(monthly_totals_from_summary(self.last_month)), expected)
+        self.assertEqual(self.months(monthly_totals_from_transactions(self.last_month)), expected)
+        self.assertEqual(monthly_totals(self.last_month)[0]['avg_amount'], Decimal('250.00'))
+
+    def test_falls_back_to_transaction_before_coverage(self):
+        start = self.month_before
+        self.assertEqual(self.months(monthly_totals_from_summary(start))[0][0], self.last_month)
+        self.assertEqual(self.months(monthly_totals(start)), self.truncated(start))
+        self.assertEqual(self.months(monthly_totals(start)), [
+            (self.month_before, 1, Decimal('100.00')), (self.last_month, 2, Decimal('500.00')),
+            (self.this_month, 1, Decimal('400.00')),
+        ])
+
+    def test_monthly_summary_api(self):
+        self.client.force_login(self.admin)
+        data = self.client.get(reverse('api_monthly_summary')).json()
+        self.assertEqual(data['months'], [day.strftime('%Y-%m') for day in
+                                          (self.month_before, self.last_month, self.this_month)])
+        self.assertEqual(data['transaction_counts'], [1, 2, 1])
+        self.assertEqual(data['total_amounts'], [100.0, 500.0, 400.0])
+
+
+class LedgerPostingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch, account_type = create_branch(), create_savings_type()
+        cls.sender = create_account(create_customer(), branch, account_type)
+        cls.beneficiary = create_account(create_customer('beneficiary', 2), branch, account_type)
+        post_deposit(cls.sender, Decimal('1000.00'), Decimal('10.00'), channel='branch',
+                     description='Cash deposit', notify=False)
+
+    def assertBalance(self, account, expected):
+        account.refresh_from_db()
+        self.assertEqual((account.balance, account.available_balance), (Decimal(expected), Decimal(expected)))
+
+    def test_fee_and_balance_arithmetic(self):
+        deposit = Transaction.objects.get(account=self.sender)
+        self.assertEqual((deposit.amount, deposit.fee, deposit.total_amount), (
+            Decimal('1000.00'), Decimal('10.00'), Decimal('990.00')))
+        self.assertEqual((deposit.balance_before, deposit.balance_after), (Decimal('0.00'), Decimal('990.00')))
+
+        withdrawal = post_withdrawal(self.sender, Decimal('100.00'), Decimal('5.00'), channel='branch',
+                                     description='Cash withdrawal', check_limits=False, notify=False)
+        self.assertEqual((withdrawal.total_amount, withdrawal.balance_after), (Decimal('105.00'), Decimal('885.00')))
+
+        debit, credit = post_transfer(self.sender, self.beneficiary, Decimal('200.00'), Decimal('25.00'),
+                                      channel='mobile', beneficiary_name='Beneficiary',
+                                      check_limits=False, notify=False)
+        self.assertEqual((debit.total_amount, debit.balance_before, debit.balance_after),
+                         (Decimal('225.00'), Decimal('885.00'), Decimal('660.00')))
+        self.assertEqual((credit.total_amount, credit.balance_after), (Decimal('200.00'), Decimal('200.00')))
+        self.assertBalance(self.sender, '660.00')
+        self.assertBalance(self.beneficiary, '200.00')
+        # The caller's instances are kept in step with the database
+        self.assertEqual(self.sender.balance, Decimal('660.00'))
+
+    def test_percentage_fees_are_charged_to_the_cent(self):
+        FeeStructure.objects.create(
+            transaction_type='agent_withdrawal', percentage_fee=Decimal('1.4815'),
+            effective_from=timezone.now() - timedelta(days=1),
+        )
+        fee = calculate_fee('agent_withdrawal', Decimal('1250.00'))
+        self.assertEqual(str(fee), '18.52')
+
+        withdrawal = post_withdrawal(self.sender, Decimal('100.00'), Decimal('1.481455'), channel='agent',
+                                     description='Agent withdrawal', check_limits=False, notify=False)
+        deposit = post_deposit(self.sender, Decimal('1250.00'), Decimal('18.518550'), channel='agent',
+                               description='Agent deposit', notify=False)
+        self.assertEqual((withdrawal.fee, withdrawal.total_amount, withdrawal.balance_after),
+                         (Decimal('1.48'), Decimal('101.48'), Decimal('888.52')))
+        self.assertEqual((deposit.fee, deposit.total_amount, deposit.balance_after),
+                         (Decimal('18.52'), Decimal('1231.48'), Decimal('2120.00')))
+        # The account row and the ledger agree to the last digit
+        self.assertEqual(str(BankAccount.objects.get(pk=self.sender.pk).balance), '2120.00')
+        self.assertBalance(self.sender, '2120.00')
+
+    def test_insufficient_funds_change_nothing(self):
+        with self.assertRaisesMessage(PostingError, 'Insufficient funds'):
+            post_withdrawal(self.sender, Decimal('990.00'), Decimal('1.00'), channel='branch',
+                            description='Cash withdrawal', check_limits=False, notify=False)
+        with self.assertRaisesMessage(PostingError, 'Insufficient funds'):
+            post_transfer(self.sender, self.beneficiary, Decimal('990.00'), Decimal('1.00'),
+                          channel='mobile', beneficiary_name='Beneficiary', check_limits=False, notify=False)
+        self.assertBalance(self.sender, '990.00')
+        self.assertBalance(self.beneficiary, '0.00')
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_rejects_inactive_accounts_and_self_transfers(self):
+        BankAccount.objects.filter(pk=self.beneficiary.pk).update(status='frozen')
+        with self.assertRaisesMessage(PostingError, 'Account is not active'):
+            post_deposit(self.beneficiary, Decimal('10.00'), Decimal('0'), channel='branch',
+                         description='Cash deposit', notify=False)
+        with self.assertRaisesMessage(PostingError, 'Account is not active'):
+            post_transfer(self.sender, self.beneficiary, Decimal('10.00'), Decimal('0'), channel='mobile',
+                          beneficiary_name='Beneficiary', check_limits=False, notify=False)
+        with self.assertRaisesMessage(PostingError, 'Cannot transfer to same account'):
+            post_transfer(self.sender, self.sender, Decimal('10.00'), Decimal('0'), channel='mobile',
+                          beneficiary_name='Self', check_limits=False, notify=False)
+        self.assertBalance(self.sender, '990.00')
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_no_retry_inside_callers_transaction(self):
+        posting = mock.Mock(side_effect=OperationalError('database is locked'))
+        with self.assertRaises(OperationalError):
+            ledger._run_posting([self.sender.pk], posting)
+        self.assertEqual(posting.call_count, 1)
+
+
+class AgentLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        branch = create_branch()
+        cls.account = create_account(create_customer(), branch, create_savings_type())
+        cls.agent = BankAgent.objects.create(
+            user=create_customer('agent', 2, user_type='agent'), agent_code='AG001', branch=branch,
+            business_name='Corner Shop', business_address='Nairobi', business_phone='+254700000099',
+            license_number='LIC001',
+        )
+        AgentTransactionLimit.objects.create(
+            agent=cls.agent, single_deposit_limit=Decimal('1000.00'),
+            daily_transaction_limit=Decimal('1500.00'), monthly_transaction_limit=Decimal('5000.00'),
+        )
+
+    def deposit(self, amount):
+        return post_deposit(self.account, Decimal(amount), Decimal('0'), channel='agent',
+                            description='Agent deposit', notify=False, agent=self.agent)
+
+    def assertTotals(self, daily, monthly):
+        limits = AgentTransactionLimit.objects.get(agent=self.agent)
+        agent = BankAgent.objects.get(pk=self.agent.pk)
+        self.assertEqual((limits.current_daily_total, limits.current_monthly_total), (Decimal(daily), Decimal(monthly)))
+        self.assertEqual((agent.current_daily_total, agent.current_monthly_total), (Decimal(daily), Decimal(monthly)))
+
+    def test_rejects_over_single_and_daily_limits(self):
+        with self.assertRaisesMessage(PostingError, 'Amount exceeds agent single deposit limit of KES 1,000.00'):
+            self.deposit('1000.01')
+        self.deposit('1000.00')
+        with self.assertRaisesMessage(PostingError, 'Agent daily transaction limit exceeded'):
+            self.deposit('500.01')
+        self.deposit('500.00')
+        self.assertTotals('1500.00', '1500.00')
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('1500.00'))
+
+    def test_totals_roll_over_on_first_posting_of_a_day(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        totals = dict(current_daily_total=Decimal('1500.00'), current_monthly_total=Decimal('4000.00'))
+        AgentTransactionLimit.objects.filter(agent=self.agent).update(last_reset_date=yesterday, **totals)
+        BankAgent.objects.filter(pk=self.agent.pk).update(**totals)
+
+        self.deposit('600.00')
+        if yesterday.month == today.month:
+            self.assertTotals('600.00', '4600.00')
+        else:
+            self.assertTotals('600.00', '600.00')
+        self.assertEqual(AgentTransactionLimit.objects.get(agent=self.agent).last_reset_date, today)
+
+    def test_totals_roll_over_on_first_posting_of_a_month(self):
+        last_month = timezone.localdate().replace(day=1) - timedelta(days=1)
+        totals = dict(current_daily_total=Decimal('1500.00'), current_monthly_total=Decimal('5000.00'))
+        AgentTransactionLimit.objects.filter(agent=self.agent).update(last_reset_date=last_month, **totals)
+        BankAgent.objects.filter(pk=self.agent.pk).update(**totals)
+
+        self.deposit('600.00')
+        self.assertTotals('600.00', '600.00')
+
+
+@mock.patch.object(ledger, 'RETRY_BACKOFF_SECONDS', 0)
+class LedgerRetryTests(SimpleTestCase):
+    def setUp(self):
+        ledger.reset_retry_counts()
+
+    def test_retries_then_gives_up(self):
+        posting = mock.Mock(side_effect=OperationalError('database is locked'))
+        with self.assertRaisesMessage(PostingError, 'Account is busy'), self.assertLogs('banking_system.ledger'):
+            ledger._run_posting([7, 8], posting)
+        self.assertEqual(posting.call_count, ledger.MAX_RETRIES + 1)
+        self.assertEqual(dict(ledger.get_retry_counts()), {7: ledger.MAX_RETRIES, 8: ledger.MAX_RETRIES})
+
+    def test_retry_succeeds(self):
+        posting = mock.Mock(side_effect=[OperationalError('database is locked'), 'posted'])
+        self.assertEqual(ledger._run_posting([7], posting), 'posted')
+        self.assertEqual(ledger.get_retry_counts(), [(7, 1)])
+
+    def test_other_errors_are_not_retried(self):
+        posting = mock.Mock(side_effect=OperationalError('no such table'))
+        with self.assertRaises(OperationalError):
+            ledger._run_posting([7], posting)
+        self.assertEqual(posting.call_count, 1)
+
+
+class FakeClock:
+    """time module stub for ids: a frozen clock that sleep() moves forward"""
+
+    def __init__(self, ms):
+        self.ms = ms
+
+    def time(self):
+        return (ids.ID_EPOCH_MS + self.ms) / 1000
+
+    def sleep(self, seconds):
+        self.ms += 1
+
+
+class IdGeneratorTests(SimpleTestCase):
+    TIMESTAMP_SHIFT = ids.HOST_BITS + ids.PROCESS_BITS + ids.SEQUENCE_BITS
+
+    def setUp(self):
+        self.clock = FakeClock(1000)
+        patcher = mock.patch.object(ids, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.generator = ids._Generator()
+
+    def test_unique_and_increasing_within_a_millisecond(self):
+        values = [self.generator.next_value() for _ in range(1000)]
+        self.assertEqual(values, sorted(set(values)))
+        self.assertEqual({value >> self.TIMESTAMP_SHIFT for value in values}, {1000})
+
+    def test_sequence_overflow_waits_for_next_millisecond(self):
+        values = [self.generator.next_value() for _ in range(ids.MAX_SEQUENCE + 2)]
+        self.assertEqual(values, sorted(set(values)))
+        self.assertEqual(values[-2] & ids.MAX_SEQUENCE, ids.MAX_SEQUENCE)
+        self.assertEqual((values[-1] >> self.TIMESTAMP_SHIFT, values[-1] & ids.MAX_SEQUENCE), (1001, 0))
+
+    def test_clock_moving_backwards(self):
+        first = self.generator.next_value()
+        self.clock.ms -= 5
+        second = self.generator.next_value()
+        self.assertGreater(second, first)
+        self.assertEqual((second >> self.TIMESTAMP_SHIFT, second & ids.MAX_SEQUENCE), (1000, 1))
+
+    def test_encoded_ids_fit_their_fields(self):
+        ticket_number = ids.generate_id('TKT')
+        self.assertEqual(len(ticket_number), 3 + ids.ENCODED_LENGTH)
+        self.assertEqual(len(ticket_number), SupportTicket._meta.get_field('ticket_number').max_length)
+
+    def test_host_id_is_required(self):
+        for host_id in (None, ids.MAX_HOST_ID + 1):
+            with self.subTest(host_id=host_id), override_settings(ID_GENERATOR_HOST_ID=host_id):
+                with self.assertRaises(ImproperlyConfigured):
+                    ids._Generator().next_value()
@@ -20,6 +20,8 @@ urlpatterns = [
     path('api/branch-performance/', views.get_branch_performance_data, name='api_branch_performance'),
     path('api/forex-data/', views.get_forex_data, name='api_forex_data'),
     path('api/monthly-summary/', views.get_monthly_summary_data, name='api_monthly_summary'),
+    path('api/analytics/', views.get_analytics_data, name='api_analytics'),
+    path('api/transactions/export/', views.export_transactions, name='api_export_transactions'),
 
     # Transaction Views
     path('deposit/', views.deposit_view, name='deposit'),
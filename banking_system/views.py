@@ -4,19 +4,32 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Count, Sum, Avg, Q
-from django.db.models.functions import TruncDate, TruncMonth
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.db.models import Count, Sum, Q
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date
 from datetime import datetime, timedelta
 from decimal import Decimal
+import hashlib
 import json
+import time
 
 from .models import (
-    User, BankAccount, Transaction, Branch, BankAgent, ATMMachine,
-    Loan, LoanApplication, SupportTicket, ForexRate, Notification,
+    User, BankAccount, Transaction, BankAgent, ATMMachine,
+    Loan, LoanApplication, SupportTicket, Notification,
     SecurityEvent, KYCDocument, BillPayment, InterestCalculation
 )
+from .analytics import (
+    GRANULARITIES, GROUP_BY_FIELDS, account_month_totals, branch_performance, daily_totals,
+    monthly_totals, transaction_series
+)
+from .dates import local_date_range
+from .forex import latest_rates
+from .snapshots import get_snapshot
+from .streaming import CHUNK_SIZE, streaming_json_response
 
 
 from django.shortcuts import render, redirect
@@ -124,8 +137,8 @@ def admin_dashboard(request):
         messages.error(request, 'Access denied. Admin privileges required.')
         return redirect('login')
     
-    # Calculate dashboard statistics
-    context = get_admin_dashboard_context()
+    # Calculate dashboard statistics (cached, refreshed in the background)
+    context = get_snapshot('admin-dashboard', None, get_admin_dashboard_context)
     return render(request, 'dashboards/admin_dashboard.html', context)
 
 @login_required
@@ -137,12 +150,8 @@ def staff_dashboard(request):
         messages.error(request, 'Access denied. Staff privileges required.')
         return redirect('login')
     
-    context = {
-        'user': request.user,
-        'pending_kyc': KYCDocument.objects.filter(status='pending').count(),
-        'support_tickets': SupportTicket.objects.filter(status='open').count(),
-        'recent_transactions': Transaction.objects.order_by('-created_at')[:10],
-    }
+    context = dict(get_snapshot('staff-dashboard', None, get_staff_dashboard_context))
+    context['user'] = request.user
     return render(request, 'dashboards/staff_dashboard.html', context)
 
 @login_required
@@ -172,63 +181,45 @@ def agent_dashboard(request):
 
 def get_admin_dashboard_context():
     """
-    Get comprehensive dashboard context for admin
+    Get comprehensive dashboard context for admin.
+    Each model is read once, using conditional aggregates for its statistics.
     """
-    today = timezone.now().date()
-    thirty_days_ago = today - timedelta(days=30)
+    today = timezone.localdate()
     
     # Basic statistics
     total_customers = User.objects.filter(user_type='customer').count()
     total_accounts = BankAccount.objects.filter(status='active').count()
-    total_transactions_today = Transaction.objects.filter(created_at__date=today).count()
-    total_amount_today = Transaction.objects.filter(
-        created_at__date=today,
-        status='completed'
-    ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
-    
-    # Account type distribution
-    account_types = BankAccount.objects.values(
-        'account_type__name'
-    ).annotate(count=Count('id')).order_by('-count')
-    
-    # Transaction trends (last 30 days)
-    transaction_trends = Transaction.objects.filter(
-        created_at__date__gte=thirty_days_ago
-    ).extra(
-        {'date': "date(created_at)"}
-    ).values('date').annotate(
-        count=Count('id'),
-        amount=Sum('amount')
-    ).order_by('date')
-    
-    # Branch performance
-    branch_performance = Branch.objects.annotate(
-        account_count=Count('bankaccount'),
-        transaction_count=Count('bankaccount__transactions'),
-        total_amount=Sum('bankaccount__transactions__amount')
-    ).order_by('-account_count')
+    
+    # Today's totals, from the daily rollup
+    totals_today = daily_totals(today, today).annotate(
+        completed_amount=Sum('total_amount', filter=Q(status='completed')),
+    ).first() or {}
+    total_transactions_today = totals_today.get('count') or 0
+    total_amount_today = totals_today.get('completed_amount') or Decimal('0')
     
     # Loan statistics
-    loan_stats = {
-        'total_applications': LoanApplication.objects.count(),
-        'pending_applications': LoanApplication.objects.filter(status='pending').count(),
-        'active_loans': Loan.objects.filter(status='active').count(),
-        'total_disbursed': Loan.objects.aggregate(Sum('principal_amount'))['principal_amount__sum'] or Decimal('0')
-    }
+    loan_stats = LoanApplication.objects.aggregate(
+        total_applications=Count('id'),
+        pending_applications=Count('id', filter=Q(status='pending')),
+    )
+    loan_stats.update(Loan.objects.aggregate(
+        active_loans=Count('id', filter=Q(status='active')),
+        total_disbursed=Sum('principal_amount', default=Decimal('0')),
+    ))
     
     # ATM statistics
-    atm_stats = {
-        'total_atms': ATMMachine.objects.count(),
-        'online_atms': ATMMachine.objects.filter(status='online').count(),
-        'offline_atms': ATMMachine.objects.filter(status='offline').count(),
-        'maintenance_atms': ATMMachine.objects.filter(status='maintenance').count(),
-    }
+    atm_stats = ATMMachine.objects.aggregate(
+        total_atms=Count('id'),
+        online_atms=Count('id', filter=Q(status='online')),
+        offline_atms=Count('id', filter=Q(status='offline')),
+        maintenance_atms=Count('id', filter=Q(status='maintenance')),
+    )
     
     # Recent activities
     recent_activities = {
-        'transactions': Transaction.objects.order_by('-created_at')[:5],
+        'transactions': Transaction.objects.select_related('account').order_by('-created_at')[:5],
         'registrations': User.objects.filter(user_type='customer').order_by('-created_at')[:5],
-        'support_tickets': SupportTicket.objects.order_by('-created_at')[:5],
+        'support_tickets': SupportTicket.objects.select_related('customer').order_by('-created_at')[:5],
     }
     
     return {
@@ -236,15 +227,23 @@ def get_admin_dashboard_context():
         'total_accounts': total_accounts,
         'total_transactions_today': total_transactions_today,
         'total_amount_today': total_amount_today,
-        'account_types': account_types,
-        'transaction_trends': list(transaction_trends),
-        'branch_performance': branch_performance[:5],
         'loan_stats': loan_stats,
         'atm_stats': atm_stats,
         'recent_activities': recent_activities,
     }
 
-from django.db.models.functions import TruncDate
+def get_staff_dashboard_context():
+    """
+    Get operational dashboard context for staff
+    """
+    return {
+        'pending_kyc': KYCDocument.objects.filter(status='pending').count(),
+        'support_tickets': SupportTicket.objects.filter(status='open').count(),
+        'recent_transactions': list(
+            Transaction.objects.select_related('account__customer').order_by('-created_at')[:10]
+        ),
+    }
+
 # AJAX endpoints for dashboard charts
 @login_required
 def get_transaction_data(request):
@@ -255,23 +254,17 @@ def get_transaction_data(request):
         return JsonResponse({'error': 'Unauthorized'}, status=403)
     
     days = int(request.GET.get('days', 30))
-    start_date = timezone.now().date() - timedelta(days=days)
-    
-    data = Transaction.objects.filter(
-    created_at__date__gte=start_date,
-    status='completed'
-    ).annotate(
-        date=TruncDate('created_at')
-    ).values('date').annotate(
-        count=Count('id'),
-        amount=Sum('amount')
-    ).order_by('date')
-
-    return JsonResponse({
-        'labels': [item['date'].strftime('%Y-%m-%d') for item in data],  # now safe
-        'counts': [item['count'] for item in data],
-        'amounts': [float(item['amount']) for item in data]
-    })
+    
+    def build():
+        start_date = timezone.localdate() - timedelta(days=days)
+        data = daily_totals(start_date, status='completed')
+        return {
+            'labels': [item['date'].strftime('%Y-%m-%d') for item in data],
+            'counts': [item['count'] for item in data],
+            'amounts': [float(item['amount']) for item in data]
+        }
+
+    return JsonResponse(get_snapshot('transaction-data', {'days': days}, build))
 
 @login_required
 def get_account_distribution_data(request):
@@ -281,14 +274,16 @@ def get_account_distribution_data(request):
     if request.user.user_type != 'admin':
         return JsonResponse({'error': 'Unauthorized'}, status=403)
     
-    data = BankAccount.objects.values(
-        'account_type__name'
-    ).annotate(count=Count('id')).order_by('-count')
-    
-    return JsonResponse({
-        'labels': [item['account_type__name'] for item in data],
-        'data': [item['count'] for item in data]
-    })
+    def build():
+        data = BankAccount.objects.values(
+            'account_type__name'
+        ).annotate(count=Count('id')).order_by('-count')
+        return {
+            'labels': [item['account_type__name'] for item in data],
+            'data': [item['count'] for item in data]
+        }
+
+    return JsonResponse(get_snapshot('account-distribution', None, build))
 
 @login_required
 def get_branch_performance_data(request):
@@ -298,20 +293,16 @@ def get_branch_performance_data(request):
     if request.user.user_type != 'admin':
         return JsonResponse({'error': 'Unauthorized'}, status=403)
     
-    data = Branch.objects.annotate(
-        account_count=Count('bankaccount'),
-        transaction_count=Count('bankaccount__transactions', 
-                              filter=Q(bankaccount__transactions__status='completed')),
-        total_amount=Sum('bankaccount__transactions__amount',
-                        filter=Q(bankaccount__transactions__status='completed'))
-    ).order_by('-account_count')[:10]
-    
-    return JsonResponse({
-        'labels': [branch.name for branch in data],
-        'accounts': [branch.account_count for branch in data],
-        'transactions': [branch.transaction_count or 0 for branch in data],
-        'amounts': [float(branch.total_amount or 0) for branch in data]
-    })
+    def build():
+        data = branch_performance(limit=10, status='completed')
+        return {
+            'labels': [branch.name for branch in data],
+            'accounts': [branch.account_count for branch in data],
+            'transactions': [branch.transaction_count or 0 for branch in data],
+            'amounts': [float(branch.total_amount or 0) for branch in data]
+        }
+
+    return JsonResponse(get_snapshot('branch-performance', None, build))
 
 @login_required
 def get_forex_data(request):
@@ -321,24 +312,18 @@ def get_forex_data(request):
     if request.user.user_type != 'admin':
         return JsonResponse({'error': 'Unauthorized'}, status=403)
     
-    # Get latest forex rates
-    latest_rates = ForexRate.objects.filter(
-        effective_date__date=timezone.now().date()
-    ).order_by('-effective_date')
-    
-    if not latest_rates.exists():
-        # Get most recent rates if today's rates don't exist
-        latest_rates = ForexRate.objects.order_by('-effective_date')[:10]
-    
-    return JsonResponse({
-        'rates': [{
-            'currency': rate.target_currency,
-            'buy_rate': float(rate.buy_rate),
-            'sell_rate': float(rate.sell_rate),
-            'mid_rate': float(rate.mid_rate),
-            'effective_date': rate.effective_date.strftime('%Y-%m-%d %H:%M')
-        } for rate in latest_rates[:10]]
-    })
+    def build():
+        return {
+            'rates': [{
+                'currency': rate.target_currency,
+                'buy_rate': float(rate.buy_rate),
+                'sell_rate': float(rate.sell_rate),
+                'mid_rate': float(rate.mid_rate),
+                'effective_date': timezone.localtime(rate.effective_date).strftime('%Y-%m-%d %H:%M')
+            } for rate in latest_rates()]
+        }
+
+    return JsonResponse(get_snapshot('forex-data', None, build))
 
 @login_required
 def get_monthly_summary_data(request):
@@ -348,26 +333,129 @@ def get_monthly_summary_data(request):
     if request.user.user_type != 'admin':
         return JsonResponse({'error': 'Unauthorized'}, status=403)
     
-    # Get data for the last 12 months
-    twelve_months_ago = timezone.now().date().replace(day=1) - timedelta(days=365)
-    
-    monthly_data = Transaction.objects.filter(
-        created_at__date__gte=twelve_months_ago,
-        status='completed'
-    ).extra(
-        {'month': "DATE_FORMAT(created_at, '%%Y-%%m')"}
-    ).values('month').annotate(
-        transaction_count=Count('id'),
-        total_amount=Sum('amount'),
-        avg_amount=Avg('amount')
-    ).order_by('month')
-    
-    return JsonResponse({
-        'months': [item['month'] for item in monthly_data],
-        'transaction_counts': [item['transaction_count'] for item in monthly_data],
-        'total_amounts': [float(item['total_amount']) for item in monthly_data],
-        'avg_amounts': [float(item['avg_amount']) for item in monthly_data]
+    def build():
+        # Get data for the last 12 months
+        twelve_months_ago = timezone.localdate().replace(day=1) - timedelta(days=365)
+        monthly_data = monthly_totals(twelve_months_ago, status='completed')
+        return {
+            'months': [item['month'].strftime('%Y-%m') for item in monthly_data],
+            'transaction_counts': [item['count'] for item in monthly_data],
+            'total_amounts': [float(item['amount']) for item in monthly_data],
+            'avg_amounts': [float(item['avg_amount']) for item in monthly_data]
+        }
+
+    return JsonResponse(get_snapshot('monthly-summary', None, build))
+
+def _query_date(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+    return parsed
+
+@login_required
+def get_analytics_data(request):
+    """
+    API endpoint for chart series over any date range
+
+    Query parameters: from/to (YYYY-MM-DD, default the last 30 days),
+    granularity (hour/day/week/month), group_by (channel/branch/type/status)
+    and status (default completed, 'all' for every status). Responses carry
+    ETag and Last-Modified so browsers can revalidate with a 304.
+    """
+    if request.user.user_type != 'admin':
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+    try:
+        end_date = _query_date(request, 'to') or timezone.localdate()
+        start_date = _query_date(request, 'from') or end_date - timedelta(days=29)
+        granularity = request.GET.get('granularity', 'day')
+        group_by = request.GET.get('group_by') or None
+        status = request.GET.get('status', 'completed')
+        if start_date > end_date:
+            raise ValueError('from must not be after to')
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        if group_by is not None and group_by not in GROUP_BY_FIELDS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY_FIELDS)}")
+        if status != 'all' and status not in dict(Transaction.TRANSACTION_STATUS):
+            raise ValueError('Unknown status')
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    params = {'from': start_date, 'to': end_date, 'granularity': granularity,
+              'group_by': group_by or '', 'status': status}
+
+    def build():
+        data = transaction_series(start_date, end_date, granularity, group_by,
+                                  None if status == 'all' else status)
+        body = json.dumps(data, cls=DjangoJSONEncoder)
+        return {'body': body, 'etag': f'"{hashlib.md5(body.encode()).hexdigest()}"',
+                'last_modified': int(time.time())}
+
+    try:
+        snapshot = get_snapshot('analytics', params, build)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    response = get_conditional_response(
+        request, etag=snapshot['etag'], last_modified=snapshot['last_modified'],
+    )
+    if response is None:
+        response = HttpResponse(snapshot['body'], content_type='application/json')
+    response['ETag'] = snapshot['etag']
+    response['Last-Modified'] = http_date(snapshot['last_modified'])
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+TRANSACTION_EXPORT_FIELDS = (
+    'transaction_id', 'created_at', 'account__account_number', 'transaction_type', 'channel',
+    'status', 'amount', 'fee', 'balance_after', 'reference_number',
+)
+
+
+def transaction_export_rows(start_date, end_date, status=None):
+    """Export rows for local dates start_date..end_date, oldest first, read in chunks"""
+    transactions = Transaction.objects.filter(**local_date_range('created_at', start_date, end_date))
+    if status:
+        transactions = transactions.filter(status=status)
+    return transactions.order_by('created_at').values_list(
+        *TRANSACTION_EXPORT_FIELDS
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+@login_required
+def export_transactions(request):
+    """
+    API endpoint streaming every transaction in a date range as JSON
+
+    Query parameters: from/to (YYYY-MM-DD, default the last 30 days) and
+    status (default all). The body is {"fields": [...], "rows": [[...], ...]}
+    and is written as it is read, so the size of the range does not matter.
+    """
+    if request.user.user_type != 'admin':
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+    try:
+        end_date = _query_date(request, 'to') or timezone.localdate()
+        start_date = _query_date(request, 'from') or end_date - timedelta(days=29)
+        status = request.GET.get('status') or None
+        if start_date > end_date:
+            raise ValueError('from must not be after to')
+        if status is not None and status not in dict(Transaction.TRANSACTION_STATUS):
+            raise ValueError('Unknown status')
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    response = streaming_json_response({
+        'from': start_date,
+        'to': end_date,
+        'fields': TRANSACTION_EXPORT_FIELDS,
+        'rows': transaction_export_rows(start_date, end_date, status),
     })
+    response['Content-Disposition'] = f'attachment; filename="transactions-{start_date}-{end_date}.json"'
+    return response
 
 def custom_400(request, exception=None):
     return render(request, "errors/400.html", status=400)
@@ -388,7 +476,6 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.db.models import Sum, Q
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
@@ -397,8 +484,10 @@ import json
 from datetime import datetime, timedelta
 from .models import (
     User, BankAccount, Transaction, Notification, 
-    FeeStructure, UserTransactionLimit, BankAgent
+    UserTransactionLimit, BankAgent
 )
+from .fees import calculate_fee
+from .ledger import post_deposit, post_withdrawal, post_transfer
 
 @login_required
 def customer_dashboard(request):
@@ -408,7 +497,7 @@ def customer_dashboard(request):
         account = BankAccount.objects.filter(
             customer=request.user,
             status='active'
-        ).first()
+        ).select_related('account_type', 'branch').first()
         
         if not account:
             messages.error(request, "No active account found. Please contact customer service.")
@@ -419,33 +508,16 @@ def customer_dashboard(request):
             account=account
         ).order_by('-created_at')[:10]
         
-        # Get transaction summary for current month
-        current_month = timezone.now().replace(day=1)
-        monthly_transactions = Transaction.objects.filter(
-            account=account,
-            created_at__gte=current_month,
-            status='completed'
-        )
-        
-        # Calculate monthly stats
-        monthly_deposits = monthly_transactions.filter(
-            transaction_type='deposit'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        # Transaction summary for the current month (cached until the next posting)
+        monthly_totals_by_type = account_month_totals(account)
+        monthly_deposits = monthly_totals_by_type['deposit']
+        monthly_withdrawals = monthly_totals_by_type['withdrawal']
+        monthly_transfers_sent = monthly_totals_by_type['transfer']
         
-        monthly_withdrawals = monthly_transactions.filter(
-            transaction_type='withdrawal'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        monthly_transfers_sent = monthly_transactions.filter(
-            transaction_type='transfer'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        # Get user transaction limits
-        try:
-            limits = UserTransactionLimit.objects.get(user=request.user)
-        except UserTransactionLimit.DoesNotExist:
-            # Create default limits if they don't exist
-            limits = UserTransactionLimit.objects.create(user=request.user)
+        # Get user transaction limits, creating default limits if they don't exist
+        limits, _ = UserTransactionLimit.objects.get_or_create(user=request.user)
+        # Show today's usage: counters left over from an earlier day read as zero
+        limits.roll_over(timezone.localdate())
         
         # Get unread notifications
         unread_notifications = Notification.objects.filter(
@@ -508,6 +580,8 @@ def withdrawal_view(request):
         limits = UserTransactionLimit.objects.get(user=request.user)
     except UserTransactionLimit.DoesNotExist:
         limits = UserTransactionLimit.objects.create(user=request.user)
+    # Show today's usage: counters left over from an earlier day read as zero
+    limits.roll_over(timezone.localdate())
     
     # Get available agents
     agents = BankAgent.objects.filter(is_active=True)
@@ -537,6 +611,8 @@ def transfer_view(request):
         limits = UserTransactionLimit.objects.get(user=request.user)
     except UserTransactionLimit.DoesNotExist:
         limits = UserTransactionLimit.objects.create(user=request.user)
+    # Show today's usage: counters left over from an earlier day read as zero
+    limits.roll_over(timezone.localdate())
     
     context = {
         'account': account,
@@ -563,7 +639,7 @@ def api_deposit(request):
         account = BankAccount.objects.filter(
             customer=request.user,
             status='active'
-        ).first()
+        ).select_related('customer').first()
         
         if not account:
             return JsonResponse({'success': False, 'error': 'No active account found'})
@@ -574,43 +650,22 @@ def api_deposit(request):
             agent = get_object_or_404(BankAgent, id=agent_id, is_active=True)
         
         # Calculate fee
-        fee = calculate_transaction_fee('agent_deposit', amount)
-        total_deposit = amount - fee
-        
-        # Create transaction
-        balance_before = account.balance
-        account.balance += total_deposit
-        account.available_balance += total_deposit
-        account.last_transaction_date = timezone.now()
-        account.save()
-        
-        # Create transaction record
-        transaction = Transaction.objects.create(
-            account=account,
-            transaction_type='deposit',
-            amount=amount,
-            fee=fee,
-            total_amount=total_deposit,
-            balance_before=balance_before,
-            balance_after=account.balance,
+        fee = calculate_fee('agent_deposit', amount)
+        
+        # Post the deposit
+        transaction = post_deposit(
+            account,
+            amount,
+            fee,
             channel='agent',
             description=f'Cash deposit via agent {agent.business_name if agent else "N/A"}',
-            status='completed',
-            agent=agent,
-            processed_at=timezone.now()
-        )
-        
-        # Send notification
-        send_transaction_notification(
-            user=request.user,
-            transaction=transaction,
-            notification_type='deposit'
+            agent=agent
         )
         
         return JsonResponse({
             'success': True,
             'transaction_id': transaction.transaction_id,
-            'new_balance': float(account.balance),
+            'new_balance': float(transaction.balance_after),
             'fee': float(fee)
         })
         
@@ -634,82 +689,33 @@ def api_withdrawal(request):
         account = BankAccount.objects.filter(
             customer=request.user,
             status='active'
-        ).first()
+        ).select_related('customer').first()
         
         if not account:
             return JsonResponse({'success': False, 'error': 'No active account found'})
         
-        # Check limits
-        limits = UserTransactionLimit.objects.get_or_create(user=request.user)[0]
-        
-        if amount > limits.single_transaction_limit:
-            return JsonResponse({
-                'success': False, 
-                'error': f'Amount exceeds single transaction limit of KES {limits.single_transaction_limit:,.2f}'
-            })
-        
-        # Check daily limit
-        today = timezone.now().date()
-        daily_withdrawals = Transaction.objects.filter(
-            account=account,
-            transaction_type='withdrawal',
-            created_at__date=today,
-            status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        if daily_withdrawals + amount > limits.daily_withdrawal_limit:
-            return JsonResponse({
-                'success': False,
-                'error': f'Daily withdrawal limit of KES {limits.daily_withdrawal_limit:,.2f} exceeded'
-            })
-        
         # Get agent if specified
         agent = None
         if agent_id:
             agent = get_object_or_404(BankAgent, id=agent_id, is_active=True)
         
         # Calculate fee
-        fee = calculate_transaction_fee('agent_withdrawal', amount)
-        total_debit = amount + fee
-        
-        # Check balance
-        if account.available_balance < total_debit:
-            return JsonResponse({'success': False, 'error': 'Insufficient funds'})
-        
-        # Process withdrawal
-        balance_before = account.balance
-        account.balance -= total_debit
-        account.available_balance -= total_debit
-        account.last_transaction_date = timezone.now()
-        account.save()
-        
-        # Create transaction record
-        transaction = Transaction.objects.create(
-            account=account,
-            transaction_type='withdrawal',
-            amount=amount,
-            fee=fee,
-            total_amount=total_debit,
-            balance_before=balance_before,
-            balance_after=account.balance,
+        fee = calculate_fee('agent_withdrawal', amount)
+        
+        # Post the withdrawal (balance and limits are checked under the row locks)
+        transaction = post_withdrawal(
+            account,
+            amount,
+            fee,
             channel='agent',
             description=f'Cash withdrawal via agent {agent.business_name if agent else "N/A"}',
-            status='completed',
-            agent=agent,
-            processed_at=timezone.now()
-        )
-        
-        # Send notification
-        send_transaction_notification(
-            user=request.user,
-            transaction=transaction,
-            notification_type='withdrawal'
+            agent=agent
         )
         
         return JsonResponse({
             'success': True,
             'transaction_id': transaction.transaction_id,
-            'new_balance': float(account.balance),
+            'new_balance': float(transaction.balance_after),
             'fee': float(fee)
         })
         
@@ -738,35 +744,11 @@ def api_transfer(request):
         sender_account = BankAccount.objects.filter(
             customer=request.user,
             status='active'
-        ).first()
+        ).select_related('customer').first()
         
         if not sender_account:
             return JsonResponse({'success': False, 'error': 'No active account found'})
         
-        # Check limits
-        limits = UserTransactionLimit.objects.get_or_create(user=request.user)[0]
-        
-        if amount > limits.single_transaction_limit:
-            return JsonResponse({
-                'success': False,
-                'error': f'Amount exceeds single transaction limit of KES {limits.single_transaction_limit:,.2f}'
-            })
-        
-        # Check daily limit
-        today = timezone.now().date()
-        daily_transfers = Transaction.objects.filter(
-            account=sender_account,
-            transaction_type='transfer',
-            created_at__date=today,
-            status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        if daily_transfers + amount > limits.daily_transfer_limit:
-            return JsonResponse({
-                'success': False,
-                'error': f'Daily transfer limit of KES {limits.daily_transfer_limit:,.2f} exceeded'
-            })
-        
         # Find beneficiary account
         try:
             beneficiary_account = BankAccount.objects.get(
@@ -776,83 +758,24 @@ def api_transfer(request):
         except BankAccount.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Beneficiary account not found'})
         
-        # Check if trying to transfer to same account
-        if sender_account.id == beneficiary_account.id:
-            return JsonResponse({'success': False, 'error': 'Cannot transfer to same account'})
-        
         # Calculate fee
-        fee = calculate_transaction_fee('mobile_transfer_own', amount)
-        total_debit = amount + fee
-        
-        # Check balance
-        if sender_account.available_balance < total_debit:
-            return JsonResponse({'success': False, 'error': 'Insufficient funds'})
-        
-        # Process transfer (debit sender)
-        sender_balance_before = sender_account.balance
-        sender_account.balance -= total_debit
-        sender_account.available_balance -= total_debit
-        sender_account.last_transaction_date = timezone.now()
-        sender_account.save()
-        
-        # Credit beneficiary
-        beneficiary_balance_before = beneficiary_account.balance
-        beneficiary_account.balance += amount
-        beneficiary_account.available_balance += amount
-        beneficiary_account.last_transaction_date = timezone.now()
-        beneficiary_account.save()
-        
-        # Create debit transaction for sender
-        debit_transaction = Transaction.objects.create(
-            account=sender_account,
-            transaction_type='transfer',
-            amount=amount,
-            fee=fee,
-            total_amount=total_debit,
-            balance_before=sender_balance_before,
-            balance_after=sender_account.balance,
+        fee = calculate_fee('mobile_transfer_own', amount)
+        
+        # Post the transfer (balance and limits are checked under the row locks)
+        debit_transaction, credit_transaction = post_transfer(
+            sender_account,
+            beneficiary_account,
+            amount,
+            fee,
             channel='mobile',
-            description=f'Transfer to {beneficiary_name or beneficiary_account.customer.get_full_name()}',
-            reference_number=reference,
-            status='completed',
-            beneficiary_account=beneficiary_account,
             beneficiary_name=beneficiary_name or beneficiary_account.customer.get_full_name(),
-            processed_at=timezone.now()
-        )
-        
-        # Create credit transaction for beneficiary
-        credit_transaction = Transaction.objects.create(
-            account=beneficiary_account,
-            transaction_type='deposit',
-            amount=amount,
-            fee=Decimal('0'),
-            total_amount=amount,
-            balance_before=beneficiary_balance_before,
-            balance_after=beneficiary_account.balance,
-            channel='mobile',
-            description=f'Transfer from {sender_account.customer.get_full_name()}',
-            reference_number=reference,
-            status='completed',
-            processed_at=timezone.now()
-        )
-        
-        # Send notifications
-        send_transaction_notification(
-            user=request.user,
-            transaction=debit_transaction,
-            notification_type='transfer_sent'
-        )
-        
-        send_transaction_notification(
-            user=beneficiary_account.customer,
-            transaction=credit_transaction,
-            notification_type='transfer_received'
+            reference=reference
         )
         
         return JsonResponse({
             'success': True,
             'transaction_id': debit_transaction.transaction_id,
-            'new_balance': float(sender_account.balance),
+            'new_balance': float(debit_transaction.balance_after),
             'fee': float(fee),
             'beneficiary_name': beneficiary_account.customer.get_full_name()
         })
@@ -888,123 +811,3 @@ def api_verify_account(request):
             
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
-
-# Helper functions
-def calculate_transaction_fee(transaction_type, amount):
-    """Calculate transaction fee based on type and amount"""
-    try:
-        fee_structure = FeeStructure.objects.get(
-            transaction_type=transaction_type,
-            is_active=True
-        )
-        
-        # Calculate percentage fee
-        percentage_fee = amount * (fee_structure.percentage_fee / 100)
-        
-        # Use fixed fee or percentage fee, whichever is higher
-        calculated_fee = max(fee_structure.fixed_fee, percentage_fee)
-        
-        # Apply minimum and maximum limits
-        if calculated_fee < fee_structure.minimum_fee:
-            calculated_fee = fee_structure.minimum_fee
-        
-        if fee_structure.maximum_fee and calculated_fee > fee_structure.maximum_fee:
-            calculated_fee = fee_structure.maximum_fee
-        
-        return calculated_fee
-        
-    except FeeStructure.DoesNotExist:
-        # Default fees if fee structure not found
-        default_fees = {
-            'agent_deposit': Decimal('10.00'),
-            'agent_withdrawal': Decimal('35.00'),
-            'mobile_transfer_own': Decimal('25.00'),
-            'mobile_transfer_other': Decimal('50.00'),
-        }
-        return default_fees.get(transaction_type, Decimal('0.00'))
-
-def send_transaction_notification(user, transaction, notification_type):
-    """Send transaction notification via email and in-app"""
-    try:
-        # Create notification messages
-        notification_messages = {
-            'deposit': {
-                'title': 'Money Received',
-                'message': f'You have received KES {transaction.amount:,.2f} in your account {transaction.account.account_number}. Your new balance is KES {transaction.balance_after:,.2f}.',
-                'email_subject': 'Equity Bank - Money Received'
-            },
-            'withdrawal': {
-                'title': 'Money Withdrawn',
-                'message': f'You have withdrawn KES {transaction.amount:,.2f} from your account {transaction.account.account_number}. Fee: KES {transaction.fee:,.2f}. Your new balance is KES {transaction.balance_after:,.2f}.',
-                'email_subject': 'Equity Bank - Withdrawal Confirmation'
-            },
-            'transfer_sent': {
-                'title': 'Money Sent',
-                'message': f'You have sent KES {transaction.amount:,.2f} to {transaction.beneficiary_name}. Fee: KES {transaction.fee:,.2f}. Your new balance is KES {transaction.balance_after:,.2f}.',
-                'email_subject': 'Equity Bank - Transfer Sent'
-            },
-            'transfer_received': {
-                'title': 'Money Received',
-                'message': f'You have received KES {transaction.amount:,.2f} from {transaction.description.replace("Transfer from ", "")}. Your new balance is KES {transaction.balance_after:,.2f}.',
-                'email_subject': 'Equity Bank - Money Received'
-            }
-        }
-        
-        notification_data = notification_messages.get(notification_type, {
-            'title': 'Transaction Alert',
-            'message': f'Transaction of KES {transaction.amount:,.2f} processed.',
-            'email_subject': 'Equity Bank - Transaction Alert'
-        })
-        
-        # Create in-app notification
-        Notification.objects.create(
-            user=user,
-            notification_type='transaction',
-            channel='in_app',
-            title=notification_data['title'],
-            message=notification_data['message'],
-            status='sent',
-            related_transaction=transaction,
-            sent_at=timezone.now()
-        )
-        
-        # Send email notification
-        if user.email:
-            email_message = f"""
-Dear {user.get_full_name() or user.username},
-
-{notification_data['message']}
-
-Transaction Details:
-- Transaction ID: {transaction.transaction_id}
-- Date: {transaction.created_at.strftime('%d/%m/%Y %H:%M:%S')}
-- Channel: {transaction.get_channel_display()}
-
-For any inquiries, please contact our customer service.
-
-Best regards,
-Equity Bank Kenya
-            """
-            
-            send_mail(
-                subject=notification_data['email_subject'],
-                message=email_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=True
-            )
-            
-            # Create email notification record
-            Notification.objects.create(
-                user=user,
-                notification_type='transaction',
-                channel='email',
-                title=notification_data['email_subject'],
-                message=email_message,
-                status='sent',
-                related_transaction=transaction,
-                sent_at=timezone.now()
-            )
-            
-    except Exception as e:
-        print(f"Error sending notification: {e}")